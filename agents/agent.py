@@ -1,53 +1,239 @@
 #!/usr/bin/env python3
 """Local BitShred Agent (safe stub)
 
-- Polls cloud API for job status (requires API base and JWT token configured via env)
-- Downloads job and would perform local wipe using tools/wipe_*.py (but defaults to dry-run)
-- Reports back to server via /api/report
+- Holds a persistent connection to the cloud API (Server-Sent Events, or
+  long-poll with --mode poll) and starts a job as soon as it is assigned
+- Keeps the job lease alive with heartbeats while the job runs and until
+  the server has taken its report
+- Would perform local wipe using tools/wipe_*.py (but defaults to dry-run):
+  a job's confirm_local only makes it real on an agent started with
+  --allow-destructive (or AGENT_ALLOW_DESTRUCTIVE=1); otherwise the job is
+  refused and the refusal is reported
+- Streams the wipe tool's output gzipped to a local file and uploads it in
+  resumable chunks (/api/evidence) from the spool, before the report that
+  references it
+- Spools results and progress in a local SQLite file and uploads them in
+  the background (/api/reports:batch), so a result outlives an outage
 
 USAGE:
   export API_BASE=http://localhost:5001
-  export AGENT_TOKEN=<JWT>
-  python3 agents/agent.py --poll-interval 15
+  export AGENT_TOKEN=<JWT>   # e.g. python -m backend.auth --role agent --ttl 2592000
+  python3 agents/agent.py --mode sse --platform linux [--allow-destructive]
 """
-import os, time, requests, argparse, json, subprocess
+import os, sys, time, uuid, requests, argparse, json, socket, threading, asyncio
+from concurrent.futures import ThreadPoolExecutor
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + '/../'))
+from agents.orchestrator import WipeOrchestrator
+from agents.spool import ResultSpool, SpoolUploader
 API_BASE = os.getenv('API_BASE','http://localhost:5001')
 AGENT_TOKEN = os.getenv('AGENT_TOKEN','')
+AGENT_ID = os.getenv('AGENT_ID', socket.gethostname())
+HEARTBEAT_INTERVAL = int(os.getenv('AGENT_HEARTBEAT_INTERVAL', '30'))
+PER_BUS = int(os.getenv('AGENT_PER_BUS', '2'))
+# Results and evidence must survive a reboot, so not under /tmp
+STATE_DIR = os.getenv('AGENT_STATE_DIR', os.path.expanduser('~/.securewipe'))
+EVIDENCE_DIR = os.getenv('AGENT_EVIDENCE_DIR', os.path.join(STATE_DIR, 'evidence'))
+SPOOL_PATH = os.getenv('AGENT_SPOOL', os.path.join(STATE_DIR, 'spool.db'))
+UPLOAD_BATCH = int(os.getenv('AGENT_UPLOAD_BATCH', '100'))
+# Per-wipe time limits in seconds. A real wipe of a big disk runs for hours, so
+# by default it has none; the lease heartbeat shows the server it is alive.
+DRY_RUN_TIMEOUT = float(os.getenv('AGENT_DRY_RUN_TIMEOUT', '600'))
+WIPE_TIMEOUT = float(os.getenv('AGENT_WIPE_TIMEOUT', '0'))  # 0 = no limit
+# The server can ask for a real wipe (confirm_local), but only this host can allow one
+ALLOW_DESTRUCTIVE = os.getenv('AGENT_ALLOW_DESTRUCTIVE', '0') in ('1', 'true', 'yes')
 HEADERS = {'Authorization': f'Bearer {AGENT_TOKEN}', 'Content-Type':'application/json'}
 
+# One keep-alive session for every call to the API
+session = requests.Session()
+session.headers.update(HEADERS)
+
+# Wipes from concurrently running jobs all go through one orchestrator so the
+# per-bus cap holds across jobs; it lives on its own event loop thread.
+_orch = None
+_orch_loop = None
+_orch_lock = threading.Lock()
+_spool = None
+_uploader = None
+_spool_lock = threading.Lock()
+# report_id -> the job's heartbeat stop event, until the server has taken the report
+_delivering = {}
+_delivering_lock = threading.Lock()
+
+def result_spool():
+    """The local spool, with its uploader thread started on first use."""
+    global _spool, _uploader
+    with _spool_lock:
+        if _spool is None:
+            _spool = ResultSpool(SPOOL_PATH)
+            _uploader = SpoolUploader(_spool, session, API_BASE, batch_size=UPLOAD_BATCH, on_sent=_reports_sent)
+            _uploader.start()
+        return _spool
+
+def _reports_sent(report_ids):
+    with _delivering_lock:
+        stops = [_delivering.pop(rid, None) for rid in report_ids]
+    for stop in stops:
+        if stop is not None:
+            stop.set()
+
+def _on_progress(dev, event):
+    print(f"[{dev.get('job_id')}] {event}")
+    if isinstance(event, dict) and dev.get('job_id'):
+        result_spool().put_progress(dev['job_id'], event)
+
+def orchestrator(max_parallel=1, per_bus=PER_BUS):
+    global _orch, _orch_loop
+    with _orch_lock:
+        if _orch is None:
+            _orch_loop = asyncio.new_event_loop()
+            threading.Thread(target=_orch_loop.run_forever, daemon=True).start()
+            _orch = WipeOrchestrator(max_parallel=max_parallel, per_bus=per_bus, evidence_dir=EVIDENCE_DIR,
+                                     on_progress=_on_progress)
+        return _orch
+
 def perform_local_action(job):
     # Safe: call wipe scripts in dry_run mode by default
     plat = (job.get('device') or {}).get('platform','linux').lower()
     params = job.get('params',{})
+    if params.get('confirm_local') and not ALLOW_DESTRUCTIVE:
+        reason = 'destructive wipes are not enabled on this agent (--allow-destructive / AGENT_ALLOW_DESTRUCTIVE=1)'
+        print('Refusing job', job.get('job_id'), '-', reason)
+        return {'job_id': job.get('job_id'), 'status': 'refused', 'error': reason,
+                'result': {'status': 'REFUSED', 'path': params.get('device')}}
     params['dry_run'] = True if not params.get('confirm_local') else False
-    if plat == 'windows':
-        cmd = ['python3','tools/wipe_windows.py']
-    elif plat == 'android':
-        cmd = ['python3','tools/wipe_android.py']
+    device = {'job_id': job.get('job_id'), 'platform': plat, 'path': params.get('device'), 'params': params,
+              'timeout': DRY_RUN_TIMEOUT if params['dry_run'] else WIPE_TIMEOUT}
+    orch = orchestrator()
+    res = asyncio.run_coroutine_threadsafe(orch.wipe_one(device), _orch_loop).result()
+    if params['dry_run']:
+        status = 'dry-run'
     else:
-        cmd = ['python3','tools/wipe_linux.py']
-    # we call with json params via environment for simplicity (not destructive)
-    env = os.environ.copy()
-    env['WIPE_PARAMS'] = json.dumps(params)
+        status = 'success' if res.get('status') == 'SUCCESS' else 'failed'
+    evidence = res.pop('evidence', [])
+    report = {'job_id': job.get('job_id'), 'status': status, 'result': res}
+    # With a log file (evidence_spool) this is only its tail, sent if the upload cannot be done
+    report['out'] = '\n'.join(e.get('out', '') for e in evidence)
+    report['evidence'] = evidence
+    if res.get('evidence_spool'):
+        report['evidence_spool'] = res.pop('evidence_spool')
+    if res.get('verification'):
+        report['verification'] = res['verification']
+    return report
+
+def heartbeat_loop(job_id, stop):
+    while not stop.wait(HEARTBEAT_INTERVAL):
+        try:
+            r = session.post(f'{API_BASE}/api/agent/heartbeat', json={'agent_id': AGENT_ID, 'job_id': job_id}, timeout=10)
+            if r.status_code == 409:
+                print('Lease lost for', job_id)
+                return
+        except requests.RequestException as e:
+            print('Heartbeat failed for', job_id, e)
+
+def run_job(job):
+    job_id = job.get('job_id')
+    print('Starting job', job_id)
+    stop = threading.Event()
+    # The lease is kept until the server has the report: uploading the
+    # evidence can outlast it, and an expired lease hands the job out again.
+    report_id = uuid.uuid4().hex
+    with _delivering_lock:
+        _delivering[report_id] = stop
+    threading.Thread(target=heartbeat_loop, args=(job_id, stop), daemon=True).start()
     try:
-        proc = subprocess.run(cmd + [], stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, text=True, timeout=600)
-        out = proc.stdout + '\n' + proc.stderr
-        status = 'success' if proc.returncode==0 else 'failed'
+        result = perform_local_action(job)
+        result['agent_id'] = AGENT_ID
+        result['report_id'] = report_id
+        # durable before anything goes over the network; the uploader sends it,
+        # after uploading its evidence log if there is one
+        evidence_spool = result.pop('evidence_spool', None)
+        if evidence_spool:
+            result_spool().put_evidence(result, evidence_spool)
+        else:
+            result_spool().put_report(result)
+        print('Result spooled for', job_id)
     except Exception as e:
-        out = str(e); status='failed'
-    return {'job_id': job.get('job_id'), 'status': 'dry-run', 'out': out}
+        print('Job failed', job_id, e)
+        _reports_sent([report_id])
 
-def poll_loop(interval=15):
+def _retry_after(r, default):
+    # a full agent channel answers 503 with Retry-After
+    try:
+        return float(r.headers.get('Retry-After', default))
+    except ValueError:
+        return default
+
+def stream_loop(platform=None, capacity=1):
+    """Hold an SSE connection open; the server pushes a job event as soon as one is claimed for us."""
+    print('Agent', AGENT_ID, 'listening on', API_BASE)
+    params = {'agent_id': AGENT_ID, 'capacity': capacity}
+    if platform:
+        params['platform'] = platform
+    pool = ThreadPoolExecutor(max_workers=capacity)
+    backoff = 1
+    while True:
+        try:
+            with session.get(f'{API_BASE}/api/agent/stream', params=params, stream=True, timeout=(10, 120)) as r:
+                if r.status_code == 503:
+                    delay = _retry_after(r, backoff)
+                    print('Agent channel full, retrying in', delay)
+                    time.sleep(min(delay, 300))
+                    continue
+                r.raise_for_status()
+                backoff = 1
+                event = None
+                for line in r.iter_lines(decode_unicode=True):
+                    if line.startswith('event:'):
+                        event = line[6:].strip()
+                    elif line.startswith('data:') and event == 'job':
+                        pool.submit(run_job, json.loads(line[5:]))
+                    elif not line:
+                        event = None
+        except KeyboardInterrupt:
+            break
+        except requests.RequestException as e:
+            print('Stream disconnected:', e)
+        time.sleep(backoff)
+        backoff = min(backoff * 2, 60)
+    pool.shutdown(wait=False)
+
+def poll_loop(interval=15, platform=None):
+    """Long-poll fallback: the server holds each claim request up to `interval` seconds."""
     print('Agent polling', API_BASE)
+    backoff = 1
     while True:
         try:
-            # This is a stub: in a real implementation agent would list assigned jobs or wait for webhook.
-            time.sleep(interval)
+            r = session.post(f'{API_BASE}/api/agent/claim', json={'agent_id': AGENT_ID, 'platform': platform, 'wait': interval},
+                             timeout=interval + 30)
+            if r.status_code == 200:
+                run_job(r.json())
+            elif r.status_code != 204:
+                print('Claim failed:', r.status_code, r.text[:200])
+                time.sleep(min(_retry_after(r, backoff), 300) if r.status_code == 503 else backoff)
+                backoff = min(backoff * 2, 60)
+                continue
+            backoff = 1
         except KeyboardInterrupt:
             break
+        except requests.RequestException as e:
+            print('Claim request failed:', e)
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60)
 
 if __name__ == '__main__':
     p = argparse.ArgumentParser()
-    p.add_argument('--poll-interval', type=int, default=15)
+    p.add_argument('--mode', choices=['sse', 'poll'], default='sse')
+    p.add_argument('--poll-interval', type=int, default=15, help='long-poll wait in seconds (poll mode)')
+    p.add_argument('--platform', default=None)
+    p.add_argument('--capacity', type=int, default=1, help='jobs to run at once (sse mode)')
+    p.add_argument('--per-bus', type=int, default=PER_BUS, help='concurrent wipes per disk controller')
+    p.add_argument('--allow-destructive', action='store_true', default=ALLOW_DESTRUCTIVE,
+                   help="carry out real wipes for jobs that ask for one (confirm_local); refused otherwise")
     args = p.parse_args()
-    poll_loop(args.poll_interval)
+    ALLOW_DESTRUCTIVE = args.allow_destructive
+    orchestrator(max_parallel=args.capacity, per_bus=args.per_bus)
+    result_spool()  # resumes uploading anything left from a previous run
+    if args.mode == 'sse':
+        stream_loop(args.platform, args.capacity)
+    else:
+        poll_loop(args.poll_interval, args.platform)
@@ -0,0 +1,110 @@
+"""Agent side of evidence uploads (see backend/evidence.py).
+
+EvidenceSpool gzips the wipe tool's output to a local file line by line as
+it arrives, hashing the uncompressed text and keeping only a short tail in
+memory. upload_evidence() then sends the compressed file in the chunk size
+the server asks for, one chunk in memory at a time, resuming from the
+server's offset after a dropped connection or a 409. The agent runs it from
+its result spool (agents/spool.py), so an upload that fails is tried again
+later, resuming the same upload.
+"""
+import os, time, zlib, hashlib, requests
+from collections import deque
+
+TAIL_LINES = 10
+UPLOAD_ATTEMPTS = int(os.getenv('AGENT_EVIDENCE_ATTEMPTS', '8'))
+
+class EvidenceSpool:
+    def __init__(self, path, level=6):
+        self.path = path
+        self._f = open(path, 'wb')
+        self._z = zlib.compressobj(level, zlib.DEFLATED, 31)  # gzip framing
+        self._sha = hashlib.sha256()
+        self.size = 0
+        self.lines = 0
+        self.tail = deque(maxlen=TAIL_LINES)
+
+    def write(self, line):
+        data = (line + '\n').encode(errors='replace')
+        self._sha.update(data)
+        self.size += len(data)
+        self.lines += 1
+        self.tail.append(line[:200])
+        self._f.write(self._z.compress(data))
+
+    def close(self):
+        """Finish the gzip stream; returns {path, sha256, size, lines, tail}."""
+        if not self._f.closed:
+            self._f.write(self._z.flush())
+            self._f.close()
+        return {'path': self.path, 'encoding': 'gzip', 'sha256': self._sha.hexdigest(), 'size': self.size,
+                'lines': self.lines, 'tail': list(self.tail)}
+
+def _wait(r, backoff):
+    # flask-limiter sends Retry-After with its 429s
+    try:
+        delay = float(r.headers.get('Retry-After', backoff)) if r is not None else backoff
+    except ValueError:
+        delay = backoff
+    time.sleep(min(delay, 300))
+
+def upload_evidence(session, api_base, job_id, spool, attempts=UPLOAD_ATTEMPTS, upload_id=None, on_open=None):
+    """Upload a closed spool ({path, sha256, size}); returns the server's evidence record.
+
+    With `upload_id` the upload resumes from the server's offset, or starts
+    over if the server no longer has it (expired). on_open(upload_id) is
+    called for a newly opened upload so the caller can keep the id.
+    """
+    state = None
+    if upload_id:
+        r = session.get(f'{api_base}/api/evidence/{upload_id}', timeout=30)
+        if r.status_code != 404:
+            r.raise_for_status()
+            state = r.json()
+    if state is None:
+        r = session.post(f'{api_base}/api/evidence', json={'job_id': job_id, 'encoding': spool.get('encoding', 'gzip')},
+                         timeout=30)
+        r.raise_for_status()
+        state = r.json()
+        if on_open:
+            on_open(state['upload_id'])
+    url = f"{api_base}/api/evidence/{state['upload_id']}"
+    chunk_size, offset = state['chunk_size'], state['offset']
+    total = os.path.getsize(spool['path'])
+    failures, backoff = 0, 1
+    with open(spool['path'], 'rb') as f:
+        while offset < total:
+            f.seek(offset)
+            chunk = f.read(chunk_size)
+            r = None
+            try:
+                r = session.put(url, data=chunk, headers={'Upload-Offset': str(offset),
+                                                          'Content-Type': 'application/octet-stream'}, timeout=60)
+                if r.status_code == 200:
+                    offset, failures, backoff = r.json()['offset'], 0, 1
+                    continue
+                if r.status_code == 409 and 'offset' in r.json():
+                    # the server has more (or less) than we thought: continue from its offset.
+                    # Counted like a failure (reset by the next stored chunk), so a server
+                    # that keeps answering 409 cannot keep us here forever.
+                    offset = r.json()['offset']
+                    failures += 1
+                    if failures >= attempts:
+                        raise RuntimeError(f'evidence upload for {job_id} gave up at offset {offset}')
+                    continue
+                if r.status_code < 500 and r.status_code != 429:
+                    r.raise_for_status()
+            except (requests.ConnectionError, requests.Timeout):
+                pass
+            failures += 1
+            if failures >= attempts:
+                raise RuntimeError(f'evidence upload for {job_id} gave up at offset {offset}')
+            _wait(r, backoff)
+            backoff = min(backoff * 2, 60)
+            try:
+                offset = session.get(url, timeout=30).json()['offset']
+            except (requests.RequestException, ValueError, KeyError):
+                pass
+    r = session.post(f'{url}/complete', json={'sha256': spool['sha256'], 'size': spool['size']}, timeout=300)
+    r.raise_for_status()
+    return r.json()
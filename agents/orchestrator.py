@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""Concurrent multi-device wipe orchestrator (asyncio subprocesses).
+
+Runs one tools/wipe_*.py subprocess per device, several at once, with two
+limits: a global cap and a per-bus cap so devices behind the same
+controller (e.g. one SATA HBA) are not all hammered at the same time.
+Every stdout/stderr line of a running wipe is passed to on_progress as it
+arrives (JSON progress lines from the native engine as dicts), and
+on_result fires for each device the moment it finishes. `timeout` (or a
+device's own 'timeout') bounds each wipe in seconds; 0 or None means none,
+which is what a real wipe of a large disk needs.
+
+With evidence_dir set, each device's output is gzipped to
+<evidence_dir>/<job_id or device>.<unique>.log.gz as it arrives (agents/evidence.py)
+and only the last lines are kept in memory; the result then carries
+'evidence_spool' for upload instead of the full text.
+
+USAGE (bench station, prints NDJSON events):
+  python3 agents/orchestrator.py --per-bus 2 --max-parallel 16 \\
+      --device /dev/sdb --device /dev/sdc --params '{"passes": 1}'
+"""
+import os, re, sys, json, time, asyncio, argparse, tempfile
+from collections import deque
+try:
+    from agents.evidence import EvidenceSpool
+except ImportError:  # run from agents/ as a script
+    from evidence import EvidenceSpool
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+TAIL_LINES = 50
+_PCI_ADDR = re.compile(r'^[0-9a-f]{4}:[0-9a-f]{2}:[0-9a-f]{2}\.[0-9a-f]$')
+
+def bus_of(path):
+    """Controller a device (or the filesystem holding a file) hangs off.
+
+    Resolves /sys/dev/block/<maj:min> and takes the last PCI address on the
+    way down, so all disks on one HBA share a key and each NVMe drive gets
+    its own. Falls back to the major:minor pair, or 'unknown'.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return 'unknown'
+    dev = st.st_rdev if st.st_rdev else st.st_dev
+    majmin = f'{os.major(dev)}:{os.minor(dev)}'
+    try:
+        real = os.path.realpath(f'/sys/dev/block/{majmin}')
+    except OSError:
+        return majmin
+    pci = [part for part in real.split('/') if _PCI_ADDR.match(part)]
+    return pci[-1] if pci else majmin
+
+def default_command(device):
+    """argv and env to wipe `device` ({'path', 'platform', 'params'}) with the repo's tools."""
+    plat = (device.get('platform') or 'linux').lower()
+    script = {'windows': 'wipe_windows.py', 'android': 'wipe_android.py'}.get(plat, 'wipe_linux.py')
+    params = dict(device.get('params') or {})
+    if device.get('path'):
+        params.setdefault('device', device['path'])
+    env = os.environ.copy()
+    env['WIPE_PARAMS'] = json.dumps(params)
+    return [sys.executable, '-u', os.path.join(REPO_ROOT, 'tools', script)], env
+
+class WipeOrchestrator:
+    def __init__(self, max_parallel=8, per_bus=2, timeout=600, on_progress=None, on_result=None, command=default_command,
+                 evidence_dir=None):
+        self.max_parallel = max_parallel
+        self.per_bus = per_bus
+        self.timeout = timeout
+        self.on_progress = on_progress
+        self.on_result = on_result
+        self.command = command
+        self.evidence_dir = evidence_dir
+        self._global = None
+        self._buses = {}
+
+    def _bus_sem(self, bus):
+        if bus not in self._buses:
+            self._buses[bus] = asyncio.Semaphore(self.per_bus)
+        return self._buses[bus]
+
+    def _spool_for(self, device):
+        if not self.evidence_dir:
+            return None
+        os.makedirs(self.evidence_dir, exist_ok=True)
+        name = re.sub(r'[^A-Za-z0-9_.-]', '_', str(device.get('job_id') or device.get('path') or 'device'))
+        # unique per run: a job sent again must not overwrite a log still waiting for upload
+        fd, path = tempfile.mkstemp(prefix=f'{name}.', suffix='.log.gz', dir=self.evidence_dir)
+        os.close(fd)
+        return EvidenceSpool(path)
+
+    async def _pump(self, stream, device, lines, spool=None):
+        async for raw in stream:
+            line = raw.decode(errors='replace').rstrip()
+            if not line:
+                continue
+            if line.startswith('{"progress"'):
+                # structured progress from the native engine: pass on, keep out of evidence
+                try:
+                    event = json.loads(line)['progress']
+                except (ValueError, KeyError):
+                    event = line
+            else:
+                lines.append(line)
+                if spool:
+                    spool.write(line)
+                event = line
+            if self.on_progress:
+                self.on_progress(device, event)
+
+    async def wipe_one(self, device):
+        """Wipe one device, respecting the global and per-bus caps; returns its result dict."""
+        if self._global is None:
+            self._global = asyncio.Semaphore(self.max_parallel)
+        bus = device.get('bus') or bus_of(device.get('path') or '')
+        async with self._bus_sem(bus), self._global:
+            start = time.time()
+            argv, env = self.command(device)
+            timeout = device.get('timeout', self.timeout) or None
+            spool = self._spool_for(device)
+            lines = deque(maxlen=TAIL_LINES) if spool else []
+            try:
+                proc = await asyncio.create_subprocess_exec(*argv, env=env, stdout=asyncio.subprocess.PIPE,
+                                                            stderr=asyncio.subprocess.PIPE)
+                try:
+                    await asyncio.wait_for(asyncio.gather(self._pump(proc.stdout, device, lines, spool),
+                                                          self._pump(proc.stderr, device, lines, spool),
+                                                          proc.wait()), timeout)
+                except asyncio.TimeoutError:
+                    proc.kill()
+                    await proc.wait()
+                    raise
+                result = self._parse_result(lines, proc.returncode)
+            except Exception as e:
+                result = {'status': 'FAILED', 'error': str(e) or type(e).__name__}
+            result.update({'path': device.get('path'), 'bus': bus, 'elapsed_sec': round(time.time() - start, 2)})
+            if device.get('job_id'):
+                result['job_id'] = device['job_id']
+            if spool:
+                result['evidence_spool'] = spool.close()
+            # with a spool this is only the tail, kept as a fallback if the upload fails
+            result.setdefault('evidence', [{'cmd': ' '.join(argv), 'out': '\n'.join(lines)}])
+        if self.on_result:
+            self.on_result(device, result)
+        return result
+
+    @staticmethod
+    def _parse_result(lines, returncode):
+        # The wipe tools end with one JSON line holding their result.
+        for line in reversed(lines):
+            if line.startswith('{'):
+                try:
+                    res = json.loads(line)
+                except ValueError:
+                    continue
+                if 'status' in res:
+                    return res
+        return {'status': 'SUCCESS' if returncode == 0 else 'FAILED', 'returncode': returncode}
+
+    async def run(self, devices):
+        """Wipe all devices; results come back in input order, on_result fires in completion order."""
+        return await asyncio.gather(*(self.wipe_one(d) for d in devices))
+
+def _print_event(kind):
+    def emit(device, payload):
+        print(json.dumps({'event': kind, 'path': device.get('path'), 'data': payload}), flush=True)
+    return emit
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser()
+    p.add_argument('--device', action='append', required=True)
+    p.add_argument('--platform', default='linux')
+    p.add_argument('--params', default='{}', help='JSON params passed to every wipe (dry_run defaults to true)')
+    p.add_argument('--max-parallel', type=int, default=8)
+    p.add_argument('--per-bus', type=int, default=2)
+    p.add_argument('--timeout', type=int, default=600, help='seconds per wipe, 0 = no limit')
+    args = p.parse_args()
+    params = json.loads(args.params)
+    params.setdefault('dry_run', True)
+    devices = [{'path': d, 'platform': args.platform, 'params': params} for d in args.device]
+    orch = WipeOrchestrator(args.max_parallel, args.per_bus, args.timeout,
+                            on_progress=_print_event('progress'), on_result=_print_event('result'))
+    results = asyncio.run(orch.run(devices))
+    sys.exit(0 if all(r.get('status') in ('SUCCESS', 'DRY-RUN') for r in results) else 1)
@@ -0,0 +1,314 @@
+"""Durable local spool for agent results and progress (SQLite).
+
+A finished wipe result is written to the spool before anything is sent, so
+it survives the devapi being down, rate-limiting us, or the agent being
+restarted. SpoolUploader drains it in the background over the agent's one
+keep-alive session:
+
+- reports go to /api/reports:batch, progress to /api/progress:batch, up to
+  `batch_size` per request, gzip-compressed;
+- a report with an evidence log is spooled as an 'evidence' item: a second
+  thread uploads the log (agents/evidence.py, resuming the upload whose id
+  it recorded), then swaps the item for the report carrying evidence_id and
+  deletes the file. A log the server refuses, or that keeps failing for
+  `evidence_attempts` tries, is dropped and the report goes out with the
+  tail of the output it already holds;
+- progress is coalesced in the spool (only the latest event per job is kept),
+  since the server only shows the latest anyway;
+- a 429 waits for the server's Retry-After, other failures back off
+  exponentially; items the server rejects outright are parked as 'dead'
+  for inspection instead of being retried forever.
+
+Every report carries a report_id so a batch re-sent after a lost response
+does not finalize the receipt twice.
+"""
+import os, json, gzip, time, uuid, sqlite3, random, logging, threading, requests
+try:
+    from agents.evidence import upload_evidence
+except ImportError:  # run from agents/ as a script
+    from evidence import upload_evidence
+
+logger = logging.getLogger('agent.spool')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS spool (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,               -- report / progress / evidence
+    job_id TEXT NOT NULL,
+    body TEXT NOT NULL,               -- JSON
+    status TEXT NOT NULL DEFAULT 'pending',  -- pending / dead
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_at REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS spool_due ON spool (status, kind, next_at);
+CREATE UNIQUE INDEX IF NOT EXISTS spool_progress ON spool (job_id) WHERE kind = 'progress' AND status = 'pending';
+'''
+ENDPOINTS = {'report': '/api/reports:batch', 'progress': '/api/progress:batch'}
+# Per-item errors that a retry cannot fix
+PERMANENT_ERRORS = ('not_found', 'job_id_required', 'invalid', 'evidence_not_found', 'already_finalized')
+# Evidence upload answers that a retry cannot fix (unknown job, too large, hash mismatch)
+PERMANENT_STATUS = (400, 404, 413, 422)
+
+class ResultSpool:
+    def __init__(self, path):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(SCHEMA)
+        self.wakeup = threading.Event()
+        self.evidence_wakeup = threading.Event()
+
+    def put_report(self, report):
+        """Spool a finished result; returns its report_id."""
+        report.setdefault('report_id', uuid.uuid4().hex)
+        with self._lock:
+            self._db.execute('INSERT INTO spool (kind, job_id, body, created_at) VALUES (?, ?, ?, ?)',
+                             ('report', report.get('job_id') or '', json.dumps(report), time.time()))
+        self.wakeup.set()
+        return report['report_id']
+
+    def put_evidence(self, report, spool):
+        """Spool a result whose evidence log (a closed EvidenceSpool) is uploaded before it is sent."""
+        report.setdefault('report_id', uuid.uuid4().hex)
+        body = json.dumps({'report': report, 'spool': spool, 'upload_id': None})
+        with self._lock:
+            self._db.execute('INSERT INTO spool (kind, job_id, body, created_at) VALUES (?, ?, ?, ?)',
+                             ('evidence', report.get('job_id') or '', body, time.time()))
+        self.evidence_wakeup.set()
+        return report['report_id']
+
+    def put_progress(self, job_id, event):
+        body = json.dumps({'job_id': job_id, 'event': event, 'ts': time.time()})
+        with self._lock:
+            self._db.execute('INSERT INTO spool (kind, job_id, body, created_at) VALUES (?, ?, ?, ?) '
+                             "ON CONFLICT (job_id) WHERE kind = 'progress' AND status = 'pending' "
+                             'DO UPDATE SET body = excluded.body',
+                             ('progress', job_id, body, time.time()))
+
+    def due(self, kind, limit):
+        """[(id, body JSON text)] ready to send, oldest first."""
+        with self._lock:
+            return self._db.execute("SELECT id, body FROM spool WHERE status = 'pending' AND kind = ? AND next_at <= ? "
+                                    'ORDER BY id LIMIT ?', (kind, time.time(), limit)).fetchall()
+
+    def due_evidence(self, limit):
+        """[(id, body JSON text, attempts)] of evidence uploads ready to (re)try, oldest first."""
+        with self._lock:
+            return self._db.execute("SELECT id, body, attempts FROM spool WHERE status = 'pending' AND kind = 'evidence' "
+                                    'AND next_at <= ? ORDER BY id LIMIT ?', (time.time(), limit)).fetchall()
+
+    def update(self, row_id, body):
+        with self._lock:
+            self._db.execute('UPDATE spool SET body = ? WHERE id = ?', (body, row_id))
+
+    def promote(self, row_id, report):
+        """Replace evidence item `row_id` with the report to send, in one transaction."""
+        with self._lock:
+            self._db.execute('BEGIN')
+            try:
+                self._db.execute('DELETE FROM spool WHERE id = ?', (row_id,))
+                self._db.execute('INSERT INTO spool (kind, job_id, body, created_at) VALUES (?, ?, ?, ?)',
+                                 ('report', report.get('job_id') or '', json.dumps(report), time.time()))
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+            self._db.execute('COMMIT')
+        self.wakeup.set()
+
+    def ack(self, rows):
+        # Matching on body too: a progress row updated while its old body was
+        # in flight stays queued.
+        if rows:
+            with self._lock:
+                self._db.executemany('DELETE FROM spool WHERE id = ? AND body = ?', rows)
+
+    def retry(self, ids, delay, error):
+        if ids:
+            with self._lock:
+                self._db.executemany('UPDATE spool SET attempts = attempts + 1, next_at = ?, last_error = ? WHERE id = ?',
+                                     [(time.time() + delay, str(error)[:500], i) for i in ids])
+
+    def bury(self, ids, error):
+        if ids:
+            with self._lock:
+                self._db.executemany("UPDATE spool SET status = 'dead', last_error = ? WHERE id = ?",
+                                     [(str(error)[:500], i) for i in ids])
+
+    def pending(self, kind=None):
+        sql, args = "SELECT COUNT(*) FROM spool WHERE status = 'pending'", ()
+        if kind:
+            sql, args = sql + ' AND kind = ?', (kind,)
+        with self._lock:
+            return self._db.execute(sql, args).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+class SpoolUploader:
+    def __init__(self, spool, session, api_base, batch_size=100, interval=2.0, max_backoff=300.0, timeout=30,
+                 evidence_attempts=12, on_sent=None):
+        self.spool = spool
+        self.session = session
+        self.api_base = api_base
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.evidence_attempts = evidence_attempts
+        # on_sent([report_id, ...]): reports the server has taken (or refused for good)
+        self.on_sent = on_sent
+        self._failures = 0
+        self._evidence_failures = 0
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._stop.clear()
+        # evidence has its own thread: a long upload must not hold up reports and progress
+        for target, name in ((self._run, 'spool-uploader'), (self._run_evidence, 'spool-evidence')):
+            t = threading.Thread(target=target, name=name, daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        self.spool.wakeup.set()
+        self.spool.evidence_wakeup.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                delay = self.flush_once()
+            except Exception:
+                logger.exception('Spool upload crashed')
+                delay = self.interval
+            self.spool.wakeup.wait(delay)
+            self.spool.wakeup.clear()
+
+    def _run_evidence(self):
+        while not self._stop.is_set():
+            try:
+                delay = self.upload_evidence_once()
+            except Exception:
+                logger.exception('Evidence upload crashed')
+                delay = self.interval
+            self.spool.evidence_wakeup.wait(delay)
+            self.spool.evidence_wakeup.clear()
+
+    def backoff(self, failures=None):
+        # full jitter so a site's agents do not all come back at once
+        failures = self._failures if failures is None else failures
+        return random.uniform(0, min(self.max_backoff, self.interval * 2 ** failures))
+
+    def upload_evidence_once(self):
+        """Upload the oldest due evidence log and spool its report; returns how long to wait."""
+        rows = self.spool.due_evidence(1)
+        if not rows:
+            return self.interval
+        row_id, body, attempts = rows[0]
+        item = json.loads(body)
+        report = item['report']
+
+        def remember(upload_id):
+            item['upload_id'] = upload_id
+            self.spool.update(row_id, json.dumps(item))
+
+        try:
+            record = upload_evidence(self.session, self.api_base, report.get('job_id'), item['spool'],
+                                     upload_id=item.get('upload_id'), on_open=remember)
+        except (requests.RequestException, RuntimeError, OSError) as e:
+            response = getattr(e, 'response', None)
+            permanent = isinstance(e, FileNotFoundError) or (
+                isinstance(e, requests.HTTPError) and response is not None and response.status_code in PERMANENT_STATUS)
+            if permanent or attempts + 1 >= self.evidence_attempts:
+                logger.error('Giving up on the evidence log of %s, reporting its tail instead: %s',
+                             report.get('job_id'), e)
+                self._settle_evidence(row_id, item, report)
+                return 0
+            self._evidence_failures += 1
+            delay = self.backoff(self._evidence_failures)
+            logger.warning('Evidence upload for %s failed, retrying in %.1fs: %s', report.get('job_id'), delay, e)
+            self.spool.retry([row_id], delay, e)
+            return delay
+        self._evidence_failures = 0
+        report.pop('out', None)
+        report.pop('evidence', None)  # the uploaded log replaces the inline tail
+        report['evidence_id'] = record['evidence_id']
+        self._settle_evidence(row_id, item, report)
+        return 0
+
+    def _settle_evidence(self, row_id, item, report):
+        self.spool.promote(row_id, report)
+        try:
+            os.remove(item['spool']['path'])
+        except FileNotFoundError:
+            pass
+
+    def flush_once(self):
+        """Send one batch of each kind; returns how long to wait before the next round."""
+        wait = self.interval
+        for kind in ('report', 'progress'):
+            rows = self.spool.due(kind, self.batch_size)
+            if not rows:
+                continue
+            ids = [row_id for row_id, _ in rows]
+            body = gzip.compress(('{"items": [' + ', '.join(item for _, item in rows) + ']}').encode())
+            try:
+                r = self.session.post(self.api_base + ENDPOINTS[kind], data=body, timeout=self.timeout,
+                                      headers={'Content-Type': 'application/json', 'Content-Encoding': 'gzip'})
+            except requests.RequestException as e:
+                return self._failed(ids, e)
+            if r.status_code == 429:
+                try:
+                    retry_after = float(r.headers.get('Retry-After', ''))
+                except ValueError:
+                    retry_after = self.backoff()
+                self.spool.retry(ids, retry_after, 'rate_limited')
+                return retry_after
+            if r.status_code >= 400:
+                return self._failed(ids, f'HTTP {r.status_code}: {r.text[:200]}')
+            self._failures = 0
+            self._settle(kind, rows, r.json().get('results') or [])
+            if len(rows) == self.batch_size:
+                wait = 0  # more waiting
+        return wait
+
+    def _failed(self, ids, error):
+        self._failures += 1
+        delay = self.backoff()
+        logger.warning('Spool upload failed (%d in batch), retrying in %.1fs: %s', len(ids), delay, error)
+        self.spool.retry(ids, delay, error)
+        return delay
+
+    def _settle(self, kind, rows, results):
+        done, dead, again, sent = [], [], [], []
+        for n, (row_id, body) in enumerate(rows):
+            res = results[n] if n < len(results) else {}
+            err = res.get('error')
+            if not err:
+                done.append((row_id, body))
+            elif str(err).startswith(PERMANENT_ERRORS):
+                dead.append((row_id, err))
+            else:
+                again.append(row_id)
+                continue
+            if kind == 'report':
+                sent.append(json.loads(body).get('report_id'))
+        self.spool.ack(done)
+        for row_id, err in dead:
+            logger.error('Server rejected spooled item %d: %s', row_id, err)
+            self.spool.bury([row_id], err)
+        if again:
+            self.spool.retry(again, self.backoff(), 'item failed')
+        if sent and self.on_sent:
+            self.on_sent(sent)
@@ -0,0 +1,121 @@
+"""JWT issuing and verification for the devapi.
+
+Tokens are HS256 with `exp`, `iat`, `aud` and a `kid` header naming the key
+that signed them. Several keys can be active at once so secrets rotate
+without logging everyone out: new tokens are signed with the active key,
+tokens signed with any listed key keep verifying until they expire.
+
+    JWT_KEYS="2025b:<secret>,2025a:<old secret>"   JWT_ACTIVE_KID=2025b
+
+Without JWT_KEYS the single JWT_SECRET is used under kid "default".
+
+Verified claims are cached by SHA-256 of the token until the token expires
+(capped at cache_ttl), so the agent heartbeat / poll traffic that presents
+the same token over and over skips the HMAC and JSON work.
+
+Issue a long-lived agent token:
+  python -m backend.auth --role agent --ttl 2592000 --sub bench-01
+"""
+import os
+import time
+import hashlib
+import argparse
+
+import jwt
+
+from verifier.cache import TTLCache
+
+ALGORITHM = "HS256"
+
+
+class AuthError(Exception):
+    pass
+
+
+class JWTKeyring:
+    def __init__(self, keys, active_kid=None, audience="securewipe-devapi", ttl=12 * 3600,
+                 cache_size=4096, cache_ttl=300.0, leeway=30):
+        if not keys:
+            raise ValueError("at least one signing key is required")
+        self.keys = dict(keys)
+        self.active_kid = active_kid or next(iter(self.keys))
+        if self.active_kid not in self.keys:
+            raise ValueError(f"active kid {self.active_kid!r} is not in the keyring")
+        self.audience = audience
+        self.ttl = ttl
+        self.cache_ttl = cache_ttl
+        self.leeway = leeway
+        self._cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+
+    @classmethod
+    def from_env(cls):
+        keys = {}
+        for item in os.environ.get("JWT_KEYS", "").split(","):
+            kid, sep, secret = item.strip().partition(":")
+            if sep and kid and secret:
+                keys[kid] = secret
+        if not keys:
+            keys["default"] = os.environ.get("JWT_SECRET", "dev-secret")
+        return cls(
+            keys,
+            active_kid=os.environ.get("JWT_ACTIVE_KID") or None,
+            audience=os.environ.get("JWT_AUDIENCE", "securewipe-devapi"),
+            ttl=int(os.environ.get("JWT_TTL_SECONDS", str(12 * 3600))),
+            cache_size=int(os.environ.get("JWT_CACHE_SIZE", "4096")),
+            cache_ttl=float(os.environ.get("JWT_CACHE_TTL", "300")),
+        )
+
+    def issue(self, claims, ttl=None):
+        now = int(time.time())
+        payload = dict(claims, iat=now, exp=now + int(ttl or self.ttl), aud=self.audience)
+        return jwt.encode(payload, self.keys[self.active_kid], algorithm=ALGORITHM,
+                          headers={"kid": self.active_kid})
+
+    def decode(self, token):
+        """Full verification, no cache. Raises AuthError."""
+        try:
+            kid = jwt.get_unverified_header(token).get("kid")
+        except jwt.PyJWTError as e:
+            raise AuthError("malformed_token") from e
+        secret = self.keys.get(kid)
+        if secret is None:
+            raise AuthError("unknown_key")
+        try:
+            return jwt.decode(token, secret, algorithms=[ALGORITHM], audience=self.audience,
+                              leeway=self.leeway, options={"require": ["exp", "iat"]})
+        except jwt.ExpiredSignatureError as e:
+            raise AuthError("token_expired") from e
+        except jwt.PyJWTError as e:
+            raise AuthError("invalid_token") from e
+
+    def verify(self, token):
+        """Claims for `token`, from the cache when it was verified before. Raises AuthError."""
+        key = hashlib.sha256(token.encode()).digest()
+        claims = self._cache.get(key)
+        now = time.time()
+        if claims is not None and claims["exp"] + self.leeway > now:
+            return claims
+        claims = self.decode(token)
+        remaining = claims["exp"] + self.leeway - now
+        if remaining > 0:
+            self._cache.set(key, claims, ttl=min(self.cache_ttl, remaining))
+        return claims
+
+    def retire(self, kid):
+        """Stop accepting tokens signed with `kid` (and forget cached ones)."""
+        if kid == self.active_kid:
+            raise ValueError("cannot retire the active key")
+        self.keys.pop(kid, None)
+        self._cache.clear()
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Issue a devapi JWT with the configured active key")
+    p.add_argument("--role", default="agent")
+    p.add_argument("--sub", default=None)
+    p.add_argument("--ttl", type=int, default=None, help="lifetime in seconds")
+    args = p.parse_args()
+    claims = {"role": args.role}
+    if args.sub:
+        claims["sub"] = args.sub
+    print(JWTKeyring.from_env().issue(claims, args.ttl))
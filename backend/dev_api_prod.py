@@ -1,16 +1,34 @@
 #!/usr/bin/env python3
+import time
+_IMPORT_STARTED = time.perf_counter()  # boot timing, see verifier.startup.BootTimer
 import os
 import sys
 import json
 import logging
 import datetime
-import jwt
-import time
-from flask import Flask, request, jsonify
+import hmac
+import threading
+import csv
+import io
+import zlib
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from mongoengine import connect
-from verifier.models import Receipt
+from mongoengine import ValidationError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from verifier.models import Receipt, SigningBatch, canonical_bytes
+from verifier.merkle import ALG as MERKLE_ALG, build_tree, batch_statement
+from backend.pipeline import LazyQueue, ReceiptPipeline, make_queue
+from backend.ids import JobIdGenerator, new_job_id
+from backend.auth import AuthError, JWTKeyring
+from backend.dispatch import JobDispatcher, job_message, sse_event
+from backend import evidence
+from backend.outbox import OutboxSender, enqueue as enqueue_email, transport_from_env
+from verifier.models import EmailOutbox
+from verifier.blobstore import make_store
+from verifier import metrics, ratelimit, startup
+from backend.listing import LISTING_FIELDS, QueryError, build_query, encode_cursor, shape_row
 
 # Ensure repo root is on path (already done by project layout, but keep for safety)
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + '/../'))
@@ -21,23 +39,64 @@ logging.basicConfig(level=logging.INFO)
 
 # Config from env
 MONGO_URL = os.environ.get("MONGO_URL", os.environ.get("VERIFIER_DB_URL", "mongodb://localhost:27017/securewipe"))
-JWT_SECRET = os.environ.get("JWT_SECRET", "dev-secret")
 OPERATOR_PIN = os.environ.get("OPERATOR_PIN", "1234")
 PRIVATE_KEY = os.environ.get("PRIVATE_KEY", "")
+SIGNING_KEY_PATH = os.environ.get("SIGNING_KEY_PATH", "")
 EMAILER_API_KEY = os.environ.get("EMAILER_API_KEY", "")
+PIPELINE_WORKERS = int(os.environ.get("PIPELINE_WORKERS", "2"))
+# Receipts that sat in a pipeline stage this long (a task lost with a crashed worker) are re-queued
+PIPELINE_STALE_SECONDS = float(os.environ.get("PIPELINE_STALE_SECONDS", "900"))
+PIPELINE_SWEEP_INTERVAL = float(os.environ.get("PIPELINE_SWEEP_INTERVAL", "60"))
+PIPELINE_MAX_ATTEMPTS = int(os.environ.get("PIPELINE_MAX_ATTEMPTS", "8"))
+# Merkle-batched signing: > 0 signs the receipts finalized within this window with one RSA signature
+SIGNING_BATCH_WINDOW_MS = int(os.environ.get("SIGNING_BATCH_WINDOW_MS", "0"))
+SIGNING_BATCH_MAX = int(os.environ.get("SIGNING_BATCH_MAX", "256"))
+LIST_PAGE_MAX = int(os.environ.get("LIST_PAGE_MAX", "500"))
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "1000"))
+DISPATCH_LEASE_SECONDS = int(os.environ.get("DISPATCH_LEASE_SECONDS", "120"))
+DISPATCH_MAX_WAIT = float(os.environ.get("DISPATCH_MAX_WAIT", "30"))
+SSE_KEEPALIVE_SECONDS = float(os.environ.get("SSE_KEEPALIVE_SECONDS", "15"))
+# Agent connections (SSE streams and long-poll waits) held open per process. Each one
+# holds a worker thread, so keep this below gunicorn's --threads to leave threads for
+# every other route (see devapi.Dockerfile); agents beyond it get 503 + Retry-After.
+AGENT_CHANNEL_MAX = int(os.environ.get("AGENT_CHANNEL_MAX", "24"))
+# Content-addressed PDF store shared with the verifier: a directory or s3://bucket/prefix
+RECEIPT_STORE = os.environ.get("RECEIPT_STORE", os.path.join(os.path.dirname(__file__), "..", "data", "pdfs"))
+OUTBOX_WORKERS = int(os.environ.get("OUTBOX_WORKERS", "1"))
+OUTBOX_BATCH_SIZE = int(os.environ.get("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "8"))
+# /api/debug/profile (sampling profiler) starts off unless enabled; PUT /api/debug/profiler flips it
+PROFILER_ENABLED = os.environ.get("PROFILER_ENABLED", "0") in ("1", "true", "yes")
+# Runtime PUTs to the switch are refused unless this is set; any valid caller could otherwise turn it on
+PROFILER_SWITCH = os.environ.get("PROFILER_SWITCH", "0") in ("1", "true", "yes")
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", "500"))
+# Batch endpoints are limited on items, not requests (see _batch_cost).
+BATCH_JOBS_RATE_LIMIT = os.environ.get("BATCH_JOBS_RATE_LIMIT", "1000 per minute")
+BATCH_REPORTS_RATE_LIMIT = os.environ.get("BATCH_REPORTS_RATE_LIMIT", "1000 per minute")
+# Largest inflated body accepted from a gzip-encoded batch request
+REQUEST_INFLATE_MAX = int(os.environ.get("REQUEST_INFLATE_MAX", str(32 * 1024 * 1024)))
+# Chunked evidence uploads (backend.evidence): chunk size handed to agents and a cap on the compressed log
+EVIDENCE_CHUNK_SIZE = int(os.environ.get("EVIDENCE_CHUNK_SIZE", str(1024 * 1024)))
+EVIDENCE_MAX_BYTES = int(os.environ.get("EVIDENCE_MAX_BYTES", str(4 * 1024 ** 3)))
+EVIDENCE_RATE_LIMIT = os.environ.get("EVIDENCE_RATE_LIMIT", "600 per minute")
+# Open uploads untouched this long are deleted with their chunks, checked every EVIDENCE_EXPIRE_INTERVAL s (0 = never)
+EVIDENCE_UPLOAD_TTL = float(os.environ.get("EVIDENCE_UPLOAD_TTL", str(24 * 3600)))
+EVIDENCE_EXPIRE_INTERVAL = float(os.environ.get("EVIDENCE_EXPIRE_INTERVAL", "600"))
 
-# Connect to MongoDB
-try:
-    # If MONGO_URL is a full connection URI, pass as host
-    connect(host=MONGO_URL)
-    logger.info("Connected to MongoDB at %s", MONGO_URL)
-except Exception as e:
-    logger.exception("Failed to connect to MongoDB: %s", e)
-    raise
+# MongoDB: registered here, connected on first use (command timings go to /metrics;
+# pool size and timeouts from MONGO_* env, see verifier.startup)
+metrics.register_mongo()
+startup.connect_mongo(MONGO_URL)
+boot = startup.BootTimer(_IMPORT_STARTED)
 
 app = Flask(__name__)
+metrics.instrument_flask(app)
 
 RATE_LIMIT_STORAGE = os.environ.get("RATE_LIMIT_STORAGE", "")
+# Redis-backed limits are decided in process and reconciled every RATE_LIMIT_SYNC_INTERVAL
+# seconds (verifier.ratelimit); RATE_LIMIT_HYBRID=0 goes back to a Redis call per request.
+RATE_LIMIT_HYBRID = os.environ.get("RATE_LIMIT_HYBRID", "1") in ("1", "true", "yes")
+RATE_LIMIT_SYNC_INTERVAL = float(os.environ.get("RATE_LIMIT_SYNC_INTERVAL", "0.25"))
 
 def pick_rate_limit_storage(uri):
     from urllib.parse import urlparse
@@ -53,24 +112,37 @@ def pick_rate_limit_storage(uri):
             logger.info("Connected to Redis for rate limiting: %s", uri)
             return uri
         except Exception as e:
-            logger.warning("Failed to connect to Redis at %s — falling back to in-memory rate limiting. Reason: %s", uri, e)
+            logger.warning("Failed to connect to Redis at %s — falling back to in-process storage. Reason: %s", uri, e)
             return "memory://"
     else:
         logger.info("Using configured rate-limiter storage URI: %s", uri)
         return uri
 
-_storage_uri = pick_rate_limit_storage(RATE_LIMIT_STORAGE)
+
+rate_limited = metrics.REGISTRY.counter("rate_limit_rejections_total", "Requests rejected by the rate limiter")
+
+def _on_rate_limited(limit):
+    rate_limited.inc(route=request.url_rule.rule if request.url_rule else "<unmatched>", limit=str(limit.limit))
+
+# Hybrid storage needs no startup ping: it limits per process until Redis answers.
+_limiter_uri = (RATE_LIMIT_HYBRID and ratelimit.hybrid_uri(RATE_LIMIT_STORAGE)) or pick_rate_limit_storage(RATE_LIMIT_STORAGE)
+_redis_uri = RATE_LIMIT_STORAGE if RATE_LIMIT_STORAGE.startswith(("redis://", "rediss://")) else None
 
 limiter = Limiter(
     key_func=get_remote_address,
     default_limits=[os.environ.get("DEV_RATE_LIMIT", "60 per minute")],
-    storage_uri=_storage_uri
+    storage_uri=_limiter_uri,
+    storage_options={"sync_interval": RATE_LIMIT_SYNC_INTERVAL} if _limiter_uri.startswith("hybrid+") else {},
+    on_breach=_on_rate_limited,
+    headers_enabled=True,  # Retry-After on 429s; the agent's spool uploader waits for it
 )
+limiter.init_app(app)
 
-# Simple JWT helpers
-def create_jwt(role):
-    payload = {"role": role, "iat": int(time.time())}
-    return jwt.encode(payload, JWT_SECRET, algorithm="HS256")
+# JWT helpers: keys / rotation / claim cache in backend.auth (JWT_KEYS, JWT_SECRET, ...)
+keyring = JWTKeyring.from_env()
+
+def create_jwt(role, ttl=None):
+    return keyring.issue({"role": role}, ttl)
 
 def require_jwt(fn):
     from functools import wraps
@@ -83,10 +155,9 @@ def require_jwt(fn):
         if not token:
             return jsonify({"error": "missing_token"}), 401
         try:
-            payload = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-            request.jwt_payload = payload
-        except Exception:
-            return jsonify({"error": "invalid_token"}), 401
+            request.jwt_payload = keyring.verify(token)
+        except AuthError as e:
+            return jsonify({"error": str(e)}), 401
         return fn(*args, **kwargs)
     return wrapper
 
@@ -95,108 +166,726 @@ def require_jwt(fn):
 # Placeholder implementations for signing, pdf generation and email sending.
 # Keep existing function names so other modules calling them keep working.
 def sign_payload(private_key_pem, payload_json):
-    # Implement actual cryptographic signing as required by project.
-    # For now, return a simple deterministic signature for testing.
+    # With SIGNING_KEY_PATH configured, sign with the RSA key (verifiable by
+    # the verifier's /receipts/verify). Otherwise fall back to a simple
+    # deterministic digest for testing.
+    if SIGNING_KEY_PATH:
+        from tools.signer import sign_payload as rsa_sign_payload
+        return rsa_sign_payload(SIGNING_KEY_PATH, payload_json)
     import hashlib
-    return hashlib.sha256((private_key_pem or "") + json.dumps(payload_json, sort_keys=True)).hexdigest()
+    return hashlib.sha256(((private_key_pem or "") + json.dumps(payload_json, sort_keys=True)).encode()).hexdigest()
+
+receipt_store = make_store(RECEIPT_STORE)
+_renderer = None
+_renderer_lock = threading.Lock()
+
+def get_renderer():
+    # ReportLab and qrcode are imported on first use (or by the readiness warm-up), not at boot.
+    global _renderer
+    if _renderer is None:
+        with _renderer_lock:
+            if _renderer is None:
+                from tools.pdf_receipt import CertificateRenderer
+                _renderer = CertificateRenderer()
+    return _renderer
 
 def build_pdf_for_receipt(receipt_json, signature, job_id):
-    # Create a simple PDF file or placeholder path. The real project likely uses reportlab/weasyprint.
-    # For now, create a small text file to simulate a pdf path.
-    out_dir = os.path.join(os.path.dirname(__file__), "../static/pdfs")
-    os.makedirs(out_dir, exist_ok=True)
-    fname = f"receipt-{job_id}.txt"
-    path = os.path.join(out_dir, fname)
-    with open(path, "w") as f:
-        f.write("Receipt for job: " + job_id + "\n")
-        f.write(json.dumps(receipt_json, indent=2))
-        f.write("\nSignature: " + signature)
-    return path
-
-def send_receipt_email(to_email, subject, body, attachment_path=None):
-    # Implement real email sending using configured EMAILER_API_KEY or SMTP.
-    logger.info("Pretend-sending email to %s subj=%s attachment=%s", to_email, subject, attachment_path)
-    return True
+    # Rendering is deterministic and the store is keyed by content, so
+    # re-rendering an unchanged receipt writes nothing. Returns the store key.
+    return get_renderer().render_to_store(receipt_store, receipt_json, signature, job_id)
+
+def send_receipt_email(to_email, subject, body, attachment_key=None, job_id=None, attachment_path=None):
+    # Queue in the durable outbox; OutboxSender delivers over pooled SMTP
+    # (or just logs when SMTP_SERVER is not set).
+    row = enqueue_email(to_email, subject, body, attachment_path, job_id=job_id, attachment_key=attachment_key)
+    outbox.notify()
+    return row
+
+# --- Email outbox (batched delivery with retry/backoff) ---
+outbox = OutboxSender(
+    transport_from_env(receipt_store),
+    workers=OUTBOX_WORKERS,
+    batch_size=OUTBOX_BATCH_SIZE,
+    max_attempts=OUTBOX_MAX_ATTEMPTS,
+)
+
+# --- Receipt pipeline (sign -> render -> email off the request path) ---
+# Defaults to the limiter's Redis so every devapi process shares one queue.
+_batch_ids = JobIdGenerator(prefix="batch-")
+
+def sign_receipt_batch(payloads):
+    # One signature over the Merkle root of the batch; each receipt keeps its
+    # proof, so it still verifies on its own (verifier.merkle).
+    root, proofs = build_tree([canonical_bytes(p) for p in payloads])
+    batch_id = _batch_ids.new_id()
+    signature = sign_payload(PRIVATE_KEY, batch_statement(batch_id, root.hex(), len(payloads)))
+    SigningBatch(batch_id=batch_id, alg=MERKLE_ALG, root=root.hex(), size=len(payloads), signature=signature).save()
+    return [{"signature": signature, "batch_id": batch_id, "proof": proof} for proof in proofs]
+
+pipeline = ReceiptPipeline(
+    LazyQueue(lambda: make_queue(os.environ.get("PIPELINE_QUEUE", RATE_LIMIT_STORAGE), fallback=False)),
+    sign=lambda payload: sign_payload(PRIVATE_KEY, payload),
+    render=build_pdf_for_receipt,
+    email=send_receipt_email,
+    workers=PIPELINE_WORKERS,
+    sign_batch=sign_receipt_batch if SIGNING_BATCH_WINDOW_MS > 0 else None,
+    batch_window=SIGNING_BATCH_WINDOW_MS / 1000.0,
+    batch_max=SIGNING_BATCH_MAX,
+    stale_seconds=PIPELINE_STALE_SECONDS,
+    sweep_interval=PIPELINE_SWEEP_INTERVAL,
+    max_attempts=PIPELINE_MAX_ATTEMPTS,
+)
+
+# --- Agent job dispatch (long-poll / SSE with leases) ---
+dispatcher = JobDispatcher(
+    lease_seconds=DISPATCH_LEASE_SECONDS,
+    redis_uri=_redis_uri,
+)
+
+metrics.REGISTRY.gauge("pipeline_queue_depth", "Finalize tasks waiting in the pipeline queue",
+                       fn=lambda: pipeline.queue.depth())
+metrics.REGISTRY.gauge("outbox_pending", "Emails waiting in the outbox",
+                       fn=lambda: EmailOutbox.objects(status__in=["pending", "sending"]).count())
+profiler = metrics.SamplingProfiler(enabled=PROFILER_ENABLED)
+
+# --- Readiness: each check also warms its dependency (run off the request path) ---
+def _warm_mongo():
+    startup.mongo_ping()
+    evidence.ensure_indexes()
+
+def _warm_signing_key():
+    if SIGNING_KEY_PATH:
+        from tools.signer import load_private_key
+        load_private_key(SIGNING_KEY_PATH)
+
+def _warm_redis():
+    startup.redis_ping(_redis_uri)
+
+def _warm_background():
+    # Both keep working in process without Redis and reconnect on their own; this reports it.
+    pipeline.queue.depth()
+    dispatcher.start()
+    if pipeline.queue.error:
+        raise RuntimeError(f"pipeline queue in process: {pipeline.queue.error}")
+
+evidence_expired = metrics.REGISTRY.counter("evidence_uploads_expired_total", "Abandoned evidence uploads deleted")
+
+def _expire_evidence_loop():
+    while True:
+        time.sleep(EVIDENCE_EXPIRE_INTERVAL)
+        try:
+            expired = evidence.expire_uploads(EVIDENCE_UPLOAD_TTL)
+        except Exception:
+            logger.exception("Evidence upload expiry failed")
+            continue
+        if expired:
+            evidence_expired.inc(len(expired))
+            logger.info("Deleted %d abandoned evidence uploads", len(expired))
+
+readiness = startup.Readiness(on_ready=lambda: boot.mark("ready"))
+readiness.add("mongo", _warm_mongo)
+readiness.add("signing_key", _warm_signing_key)
+readiness.add("renderer", get_renderer)
+if _redis_uri:
+    # the limiter, queue and dispatcher all degrade without Redis: reported, not required
+    readiness.add("redis", _warm_redis, required=False)
+readiness.add("dispatch", _warm_background, required=False)
+
+_created = False
+_create_lock = threading.Lock()
+
+def create_app():
+    """WSGI entry point: gunicorn "backend.dev_api_prod:create_app()".
+
+    Importing this module opens no connections. This starts the pipeline and
+    outbox workers and the readiness warm-up (Mongo, signing key, PDF
+    renderer, Redis) in the background and returns the app straight away;
+    /readyz turns 200 once the required dependencies are warm. Calling it
+    again returns the same app.
+    """
+    global _created
+    with _create_lock:
+        if not _created:
+            _created = True
+            if OUTBOX_WORKERS > 0:
+                outbox.start()
+            if PIPELINE_WORKERS > 0:
+                pipeline.start()
+            if EVIDENCE_UPLOAD_TTL > 0 and EVIDENCE_EXPIRE_INTERVAL > 0:
+                threading.Thread(target=_expire_evidence_loop, name="evidence-expiry", daemon=True).start()
+            readiness.refresh_async()
+            boot.mark("create_app")
+    return app
 
 # --- Routes ---
 @app.route("/api/health", methods=["GET"])
 def health():
     return jsonify({"status": "ok"})
 
+@app.route("/livez", methods=["GET"])
+@limiter.exempt
+def livez():
+    # Liveness: the process serves requests; never touches a dependency.
+    return jsonify({"status": "ok"})
+
+@app.route("/readyz", methods=["GET"])
+@limiter.exempt
+def readyz():
+    ready, checks = readiness.status()
+    return jsonify({"ready": ready, "checks": checks, "boot_seconds": boot.phases}), 200 if ready else 503
+
+@app.route("/metrics", methods=["GET"])
+@limiter.exempt
+def prometheus_metrics():
+    return Response(metrics.REGISTRY.render(), mimetype=metrics.CONTENT_TYPE)
+
+@app.route("/api/debug/profile", methods=["POST"])
+@require_jwt
+def debug_profile():
+    # Samples all threads for ?seconds=N and returns collapsed stacks (flamegraph input).
+    if not profiler.enabled:
+        return jsonify({"error": "profiler_disabled"}), 404
+    try:
+        seconds = min(max(float(request.args.get("seconds", 10)), 0.1), profiler.max_seconds)
+    except ValueError:
+        return jsonify({"error": "invalid_seconds"}), 400
+    try:
+        stacks = profiler.profile(seconds)
+    except RuntimeError:
+        return jsonify({"error": "profile_in_progress"}), 409
+    return Response(stacks, mimetype="text/plain")
+
+@app.route("/api/debug/profiler", methods=["GET", "PUT"])
+@require_jwt
+def debug_profiler_switch():
+    # Turns /api/debug/profile on or off at runtime. The switch is per worker
+    # process (as is what a profile samples); PROFILER_ENABLED sets it at start.
+    if request.method == "PUT":
+        if not PROFILER_SWITCH:
+            return jsonify({"error": "profiler_switch_disabled"}), 403
+        enabled = (request.get_json(silent=True) or {}).get("enabled")
+        if not isinstance(enabled, bool):
+            return jsonify({"error": "enabled_must_be_bool"}), 400
+        profiler.enabled = enabled
+        logger.info("Profiler %s", "enabled" if enabled else "disabled")
+    return jsonify({"enabled": profiler.enabled, "pid": os.getpid()})
+
 @app.route("/api/login", methods=["POST"])
 @limiter.limit("10 per minute")
 def login():
     data = request.get_json(force=True) or {}
-    if data.get("pin") == OPERATOR_PIN:
+    if hmac.compare_digest(str(data.get("pin", "")).encode(), OPERATOR_PIN.encode()):
         token = create_jwt("operator")
-        return jsonify({"token": token})
+        return jsonify({"token": token, "expires_in": keyring.ttl})
     return jsonify({"error": "invalid_credentials"}), 401
 
+def _job_error(p):
+    if not isinstance(p, dict):
+        return "invalid_item"
+    if not p.get("confirm"):
+        return "confirmation_required"
+    if not p.get("email"):
+        return "email_required"
+    return None
+
+def _new_receipt(p):
+    return Receipt(
+        job_id=p.get("job_id") or new_job_id(),
+        operator=p.get("operator"),
+        device=p.get("device") or {},
+        method=p.get("method"),
+        timestamp=datetime.datetime.utcnow(),
+        signature="",
+        payload=p,
+        status="created",
+        email=p.get("email"),
+    )
+
 @app.route("/api/create_job", methods=["POST"])
 @require_jwt
 @limiter.limit("10 per minute")
 def create_job():
     p = request.get_json(force=True) or {}
-    email = p.get("email")
-    if not p.get("confirm"):
-        return jsonify({"error": "confirmation_required"}), 400
-    if not email:
-        return jsonify({"error": "email_required"}), 400
-
-    job_id = p.get("job_id") or f"job-{int(time.time())}"
-    try:
-        r = Receipt(
-            job_id=job_id,
-            operator=p.get("operator"),
-            device=p.get("device"),
-            method=p.get("method"),
-            timestamp=datetime.datetime.utcnow(),
-            signature="",
-            signed_json="",
-            raw_payload=json.dumps(p),
-            status="created",
-            email=email,
-        )
+    err = _job_error(p)
+    if err:
+        return jsonify({"error": err}), 400
+
+    try:
+        r = _new_receipt(p)
         r.save()
-        logger.info("Created wipe job %s email=%s", job_id, email)
-        return jsonify({"status": "created", "job_id": job_id}), 201
+        dispatcher.notify()
+        logger.info("Created wipe job %s email=%s", r.job_id, r.email)
+        return jsonify({"status": "created", "job_id": r.job_id}), 201
     except Exception as e:
         logger.exception("DB error creating job")
         return jsonify({"error": "db_error", "detail": str(e)}), 500
 
+def _request_json():
+    # Agents gzip their batches (Content-Encoding: gzip). Inflated once per
+    # request (the limiter's cost function reads the body too) and capped.
+    if request.content_encoding != "gzip":
+        return request.get_json(force=True, silent=True)
+    if "inflated_json" not in g:
+        try:
+            raw = zlib.decompressobj(31).decompress(request.get_data(), REQUEST_INFLATE_MAX + 1)
+            g.inflated_json = json.loads(raw) if len(raw) <= REQUEST_INFLATE_MAX else None
+        except (zlib.error, ValueError):
+            g.inflated_json = None
+    return g.inflated_json
+
+def _batch_items():
+    p = _request_json() or {}
+    items = p.get("items") if isinstance(p, dict) else p
+    return items if isinstance(items, list) else None
+
+def _batch_cost():
+    # Charge the limiter one unit per item so a batch costs what its items would.
+    items = _batch_items()
+    return max(1, len(items)) if items else 1
+
+def _batch_error(items):
+    if not items:
+        return jsonify({"error": "items_required"}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({"error": "too_many_items", "max": BATCH_MAX_ITEMS}), 400
+    return None
+
+def _bulk_write_failures(e):
+    """Map a BulkWriteError to {op index: error string}."""
+    return {w["index"]: ("duplicate_job_id" if w.get("code") == 11000 else w.get("errmsg", "write_error"))
+            for w in e.details.get("writeErrors", [])}
+
+@app.route("/api/jobs:batch", methods=["POST"])
+@require_jwt
+@limiter.limit(BATCH_JOBS_RATE_LIMIT, cost=_batch_cost)
+def create_jobs_batch():
+    items = _batch_items()
+    bad = _batch_error(items)
+    if bad:
+        return bad
+    results = [None] * len(items)
+    docs, positions = [], []
+    for i, p in enumerate(items):
+        err = _job_error(p)
+        if not err:
+            r = _new_receipt(p)
+            try:
+                r.validate()
+            except ValidationError as e:
+                err = f"invalid: {e}"
+        if err:
+            results[i] = {"index": i, "error": err}
+            continue
+        docs.append(r.to_mongo())
+        positions.append(i)
+    failures = {}
+    if docs:
+        try:
+            Receipt._get_collection().insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            failures = _bulk_write_failures(e)
+        except Exception as e:
+            logger.exception("DB error creating job batch")
+            return jsonify({"error": "db_error", "detail": str(e)}), 500
+    for n, i in enumerate(positions):
+        job_id = docs[n]["job_id"]
+        if n in failures:
+            results[i] = {"index": i, "job_id": job_id, "error": failures[n]}
+        else:
+            results[i] = {"index": i, "job_id": job_id, "status": "created"}
+    created = len(positions) - len(failures)
+    if created:
+        dispatcher.notify()
+    logger.info("Created %d/%d wipe jobs in batch", created, len(items))
+    return jsonify({"created": created, "failed": len(items) - created, "results": results})
+
+# A report is taken until the pipeline has moved the receipt on; a
+# "finalize_failed" one takes a new report to try again.
+REPORTABLE = ("created", "claimed", "reported", "finalize_failed")
+
+def _report_error(p):
+    """Why a report payload cannot be stored, or None (both report endpoints)."""
+    job_id = p.get("job_id") if isinstance(p, dict) else None
+    if not job_id or not isinstance(job_id, str):
+        return "job_id_required"
+    try:
+        Receipt._fields["payload"].validate(p)
+    except ValidationError as e:
+        return f"invalid: {e}"
+    return None
+
+def _set_evidence(job, p):
+    ev = p.get("evidence")
+    if isinstance(ev, dict) and ev.get("evidence_id"):
+        job.evidence_id = ev["evidence_id"]
+        job.evidence_sha256 = ev.get("sha256")
+
 @app.route("/api/report", methods=["POST"])
 @require_jwt
 @limiter.limit("30 per minute")
 def report_result():
-    p = request.get_json(force=True) or {}
-    job_id = p.get("job_id")
+    p = request.get_json(force=True, silent=True)
+    err = _report_error(p)
+    if err:
+        return jsonify({"error": err}), 400
+    job_id = p["job_id"]
     try:
         job = Receipt.objects(job_id=job_id).first()
         if not job:
             return jsonify({"error": "not_found"}), 404
 
-        job.status = p.get("status", "done")
-        job.raw_payload = json.dumps(p)
-        receipt_json = p
+        if p.get("report_id") and (job.payload or {}).get("report_id") == p["report_id"]:
+            # re-sent after a lost response: already have it
+            return jsonify({"status": "reported", "job_id": job_id}), 202
+        if job.status not in REPORTABLE:
+            return jsonify({"error": "already_finalized", "job_id": job_id, "status": job.status}), 409
+        missing = evidence.attach_evidence([(job_id, p)])
+        if missing:
+            return jsonify({"error": missing[job_id]}), 400
+        job.status = "reported"
+        job.error = None
+        job.payload = p
+        job.finalize_at = datetime.datetime.utcnow()
+        job.finalize_attempts = 0
+        _set_evidence(job, p)
+        job.save()
+        pipeline.submit(job_id)
+        resp = jsonify({"status": "reported", "job_id": job_id})
+        resp.headers["Location"] = f"/api/jobs/{job_id}/status"
+        return resp, 202
+    except Exception as e:
+        logger.exception("DB error updating job")
+        return jsonify({"error": "db_error", "detail": str(e)}), 500
 
-        # Sign payload and generate PDF
-        try:
-            sig = sign_payload(PRIVATE_KEY, receipt_json)
-            job.signature = sig
-            job.signed_json = json.dumps(receipt_json)
-        except Exception:
-            logger.exception("Signing failed")
+@app.route("/api/reports:batch", methods=["POST"])
+@require_jwt
+@limiter.limit(BATCH_REPORTS_RATE_LIMIT, cost=_batch_cost)
+def report_results_batch():
+    items = _batch_items()
+    bad = _batch_error(items)
+    if bad:
+        return bad
+    results = [None] * len(items)
+    candidates = []
+    for i, p in enumerate(items):
+        err = _report_error(p)
+        if err:
+            results[i] = {"index": i, "error": err}
+            if err != "job_id_required":
+                results[i]["job_id"] = p["job_id"]
+            continue
+        candidates.append((i, p["job_id"], p))
+    coll = Receipt._get_collection()
+    try:
+        known = {d["job_id"]: d for d in coll.find({"job_id": {"$in": [c[1] for c in candidates]}},
+                                                   {"job_id": 1, "status": 1, "payload.report_id": 1})}
+        missing = evidence.attach_evidence([(job_id, p) for _, job_id, p in candidates if job_id in known])
+        ops, positions = [], []
+        for i, job_id, p in candidates:
+            doc = known.get(job_id)
+            if doc is None:
+                results[i] = {"index": i, "job_id": job_id, "error": "not_found"}
+                continue
+            if p.get("report_id") and (doc.get("payload") or {}).get("report_id") == p["report_id"]:
+                # re-sent after a lost response: already have it, and already queued
+                results[i] = {"index": i, "job_id": job_id, "status": "reported"}
+                continue
+            if doc.get("status") not in REPORTABLE:
+                results[i] = {"index": i, "job_id": job_id, "error": "already_finalized", "status": doc.get("status")}
+                continue
+            if job_id in missing:
+                results[i] = {"index": i, "job_id": job_id, "error": missing[job_id]}
+                continue
+            update = {"status": "reported", "payload": p, "finalize_at": datetime.datetime.utcnow(),
+                      "finalize_attempts": 0}
+            ev = p.get("evidence")
+            if isinstance(ev, dict) and ev.get("evidence_id"):
+                update.update(evidence_id=ev["evidence_id"], evidence_sha256=ev.get("sha256"))
+            # the same checks again in the update, for a report racing this one
+            query = {"job_id": job_id, "status": {"$in": list(REPORTABLE)}}
+            if p.get("report_id"):
+                query["payload.report_id"] = {"$ne": p["report_id"]}
+            ops.append(UpdateOne(query, {"$set": update, "$unset": {"error": ""}}))
+            positions.append((i, job_id, p.get("report_id")))
+        failures, matched = {}, 0
+        if ops:
+            try:
+                matched = coll.bulk_write(ops, ordered=False).matched_count
+            except BulkWriteError as e:
+                failures = _bulk_write_failures(e)
+                matched = e.details.get("nMatched", 0)
+        written = {n for n in range(len(positions)) if n not in failures}
+        if matched < len(written):
+            # Some updates matched nothing (lost a race): queue only the jobs now holding this batch's report.
+            now = {d["job_id"]: d for d in coll.find({"job_id": {"$in": [positions[n][1] for n in written]}},
+                                                     {"job_id": 1, "status": 1, "payload.report_id": 1})}
+            written = {n for n in written
+                       if (now.get(positions[n][1]) or {}).get("status") == "reported"
+                       and (not positions[n][2] or (now[positions[n][1]].get("payload") or {}).get("report_id") == positions[n][2])}
+    except Exception as e:
+        logger.exception("DB error reporting batch")
+        return jsonify({"error": "db_error", "detail": str(e)}), 500
+    for n, (i, job_id, _) in enumerate(positions):
+        if n in failures:
+            results[i] = {"index": i, "job_id": job_id, "error": failures[n]}
+            continue
+        if n in written:
+            pipeline.submit(job_id)
+        results[i] = {"index": i, "job_id": job_id, "status": "reported"}
+    reported = sum(1 for r in results if r and r.get("status") == "reported")
+    return jsonify({"reported": reported, "failed": len(items) - reported, "results": results}), 202
 
+@app.route("/api/progress:batch", methods=["POST"])
+@require_jwt
+@limiter.limit(BATCH_REPORTS_RATE_LIMIT, cost=_batch_cost)
+def report_progress_batch():
+    # Latest progress per job from agents' spools; older events never overwrite newer ones.
+    items = _batch_items()
+    bad = _batch_error(items)
+    if bad:
+        return bad
+    results, ops = [], []
+    for i, p in enumerate(items):
+        job_id = p.get("job_id") if isinstance(p, dict) else None
+        event = p.get("event") if isinstance(p, dict) else None
+        if not job_id or event is None:
+            results.append({"index": i, "error": "job_id_required"})
+            continue
         try:
-            pdf_path = build_pdf_for_receipt(receipt_json, sig, job_id)
-            job.pdf_path = pdf_path
-        except Exception:
-            logger.exception("PDF generation failed")
+            at = datetime.datetime.utcfromtimestamp(float(p.get("ts")))
+        except (TypeError, ValueError, OverflowError):
+            at = datetime.datetime.utcnow()
+        ops.append(UpdateOne({"job_id": job_id, "$or": [{"progress_at": None}, {"progress_at": {"$lt": at}}]},
+                             {"$set": {"progress": event if isinstance(event, dict) else {"line": str(event)},
+                                       "progress_at": at}}))
+        results.append({"index": i, "job_id": job_id, "status": "ok"})
+    try:
+        if ops:
+            Receipt._get_collection().bulk_write(ops, ordered=False)
+    except Exception as e:
+        logger.exception("DB error recording progress")
+        return jsonify({"error": "db_error", "detail": str(e)}), 500
+    return jsonify({"results": results})
 
-        job.save()
-        return jsonify({"status": "ok", "job_id": job_id, "signature": job.signature})
+# --- Evidence uploads: resumable, chunked, compressed (backend.evidence) ---
+def _evidence_error(e):
+    return jsonify(e.body()), e.status
+
+def _upload_state(upload):
+    return {"upload_id": upload.upload_id, "job_id": upload.job_id, "offset": upload.received,
+            "chunk_size": upload.chunk_size, "status": upload.status}
+
+@app.route("/api/evidence", methods=["POST"])
+@require_jwt
+def open_evidence_upload():
+    p = request.get_json(force=True) or {}
+    job_id = p.get("job_id")
+    try:
+        if not job_id or not Receipt.objects(job_id=job_id).only("id").first():
+            return jsonify({"error": "not_found"}), 404
+        upload = evidence.open_upload(job_id, p.get("encoding", "gzip"), EVIDENCE_CHUNK_SIZE)
+    except evidence.EvidenceError as e:
+        return _evidence_error(e)
     except Exception as e:
-        logger.exception("DB error updating job")
+        logger.exception("DB error opening evidence upload")
+        return jsonify({"error": "db_error", "detail": str(e)}), 500
+    resp = jsonify(_upload_state(upload))
+    resp.headers["Location"] = f"/api/evidence/{upload.upload_id}"
+    return resp, 201
+
+@app.route("/api/evidence/<string:upload_id>", methods=["GET"])
+@require_jwt
+def evidence_upload_state(upload_id):
+    try:
+        return jsonify(_upload_state(evidence.get_upload(upload_id)))
+    except evidence.EvidenceError as e:
+        return _evidence_error(e)
+
+@app.route("/api/evidence/<string:upload_id>", methods=["PUT"])
+@require_jwt
+@limiter.limit(EVIDENCE_RATE_LIMIT)
+def put_evidence_chunk(upload_id):
+    # Body is the next chunk_size bytes of the compressed log, starting at Upload-Offset.
+    try:
+        offset = int(request.headers.get("Upload-Offset", ""))
+    except ValueError:
+        return jsonify({"error": "upload_offset_required"}), 400
+    try:
+        upload = evidence.get_upload(upload_id)
+        new_offset = evidence.write_chunk(upload, offset, request.stream, EVIDENCE_MAX_BYTES)
+    except evidence.EvidenceError as e:
+        return _evidence_error(e)
+    except Exception as e:
+        logger.exception("DB error storing evidence chunk")
+        return jsonify({"error": "db_error", "detail": str(e)}), 500
+    return jsonify({"upload_id": upload_id, "offset": new_offset})
+
+@app.route("/api/evidence/<string:upload_id>/complete", methods=["POST"])
+@require_jwt
+def complete_evidence_upload(upload_id):
+    p = request.get_json(force=True) or {}
+    try:
+        upload = evidence.complete_upload(evidence.get_upload(upload_id), p.get("sha256"), p.get("size"))
+    except evidence.EvidenceError as e:
+        return _evidence_error(e)
+    except Exception as e:
+        logger.exception("DB error completing evidence upload")
+        return jsonify({"error": "db_error", "detail": str(e)}), 500
+    return jsonify(evidence.evidence_record(upload))
+
+@app.route("/api/evidence/<string:upload_id>/download", methods=["GET"])
+@require_jwt
+def download_evidence(upload_id):
+    try:
+        upload = evidence.get_upload(upload_id)
+        if upload.status != "complete":
+            return jsonify({"error": "upload_incomplete"}), 409
+    except evidence.EvidenceError as e:
+        return _evidence_error(e)
+    # Sent still compressed, chunk by chunk; clients decode the Content-Encoding.
+    resp = Response(stream_with_context(evidence.iter_chunks(upload_id)), mimetype="text/plain")
+    resp.headers["Content-Encoding"] = upload.encoding
+    resp.headers["Content-Length"] = str(upload.received)
+    resp.headers["Content-Disposition"] = f'attachment; filename="{upload.job_id}.log"'
+    return resp
+
+# Agent channel endpoints are JWT-authenticated and hold connections open, so
+# they are exempt from the per-IP limiter (many agents share a site NAT), and
+# capped per process at AGENT_CHANNEL_MAX instead.
+_agent_conns = 0
+_agent_conns_lock = threading.Lock()
+metrics.REGISTRY.gauge("agent_connections", "Agent SSE streams and long-polls held open", fn=lambda: _agent_conns)
+
+def _take_agent_slot():
+    global _agent_conns
+    with _agent_conns_lock:
+        if _agent_conns >= AGENT_CHANNEL_MAX:
+            return False
+        _agent_conns += 1
+        return True
+
+def _release_agent_slot():
+    global _agent_conns
+    with _agent_conns_lock:
+        _agent_conns -= 1
+
+def _agent_channel_full():
+    resp = jsonify({"error": "agent_channel_full"})
+    resp.headers["Retry-After"] = str(int(SSE_KEEPALIVE_SECONDS))
+    return resp, 503
+
+def _agent_args(src):
+    agent_id = src.get("agent_id")
+    try:
+        capacity = max(1, int(src.get("capacity", 1)))
+    except (TypeError, ValueError):
+        capacity = 1
+    return agent_id, src.get("platform") or None, capacity
+
+@app.route("/api/agent/claim", methods=["POST"])
+@require_jwt
+@limiter.exempt
+def agent_claim():
+    p = request.get_json(force=True, silent=True) or {}
+    agent_id, platform, capacity = _agent_args(p)
+    if not agent_id:
+        return jsonify({"error": "agent_id_required"}), 400
+    try:
+        wait = min(max(float(p.get("wait", DISPATCH_MAX_WAIT)), 0.0), DISPATCH_MAX_WAIT)
+    except (TypeError, ValueError):
+        wait = DISPATCH_MAX_WAIT
+    held = _take_agent_slot()
+    try:
+        # with no slot free, only look once instead of holding a thread
+        job = dispatcher.wait_for_job(agent_id, platform, capacity, timeout=wait if held else 0)
+    except Exception as e:
+        logger.exception("DB error claiming job")
+        return jsonify({"error": "db_error", "detail": str(e)}), 500
+    finally:
+        if held:
+            _release_agent_slot()
+    if not job:
+        return ("", 204) if held else _agent_channel_full()
+    logger.info("Job %s claimed by agent %s", job["job_id"], agent_id)
+    return jsonify(job_message(job))
+
+@app.route("/api/agent/stream", methods=["GET"])
+@require_jwt
+@limiter.exempt
+def agent_stream():
+    agent_id, platform, capacity = _agent_args(request.args)
+    if not agent_id:
+        return jsonify({"error": "agent_id_required"}), 400
+    if not _take_agent_slot():
+        return _agent_channel_full()
+
+    def generate():
+        yield ": connected\n\n"
+        while True:
+            try:
+                job = dispatcher.wait_for_job(agent_id, platform, capacity, timeout=SSE_KEEPALIVE_SECONDS)
+            except Exception:
+                logger.exception("DB error claiming job for stream")
+                yield sse_event("error", {"error": "db_error"})
+                return
+            if job:
+                try:
+                    yield sse_event("job", job_message(job))
+                except GeneratorExit:
+                    # The server closes us when writing the event failed (the agent
+                    # is gone): hand the job back instead of waiting out the lease.
+                    logger.info("Agent %s disconnected before job %s was delivered", agent_id, job["job_id"])
+                    dispatcher.release(agent_id, job["job_id"])
+                    raise
+                logger.info("Job %s pushed to agent %s", job["job_id"], agent_id)
+            else:
+                yield ": keepalive\n\n"
+
+    resp = Response(generate(), mimetype="text/event-stream")
+    resp.call_on_close(_release_agent_slot)  # also runs if the body was never started
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+@app.route("/api/agent/heartbeat", methods=["POST"])
+@require_jwt
+@limiter.exempt
+def agent_heartbeat():
+    p = request.get_json(force=True, silent=True) or {}
+    agent_id, job_id = p.get("agent_id"), p.get("job_id")
+    if not agent_id or not job_id:
+        return jsonify({"error": "agent_id_and_job_id_required"}), 400
+    try:
+        if not dispatcher.heartbeat(agent_id, job_id):
+            return jsonify({"error": "lease_lost", "job_id": job_id}), 409
+    except Exception as e:
+        logger.exception("DB error extending lease")
+        return jsonify({"error": "db_error", "detail": str(e)}), 500
+    return jsonify({"status": "ok", "job_id": job_id})
+
+@app.route("/api/jobs/<string:job_id>/status", methods=["GET"])
+@require_jwt
+def job_status(job_id):
+    try:
+        job = (Receipt.objects(job_id=job_id)
+               .only("job_id", "status", "error", "signature", "pdf_hash", "pdf_path", "progress", "progress_at").first())
+        if not job:
+            return jsonify({"error": "not_found"}), 404
+        mail = (EmailOutbox.objects(job_id=job_id).only("status", "attempts", "last_error")
+                .order_by("-created_at").first())
+        return jsonify({
+            "job_id": job.job_id,
+            "status": job.status,
+            "error": job.error,
+            "signature": job.signature,
+            "pdf_ready": bool(job.pdf_hash or job.pdf_path),
+            "progress": job.progress or None,
+            "progress_at": job.progress_at.isoformat() if job.progress_at else None,
+            "email_status": mail.status if mail else None,
+            "email_error": mail.last_error if mail else None,
+        })
+    except Exception as e:
+        logger.exception("DB error reading job status")
         return jsonify({"error": "db_error", "detail": str(e)}), 500
 
 @app.route("/api/send", methods=["POST"])
@@ -210,21 +899,86 @@ def send_receipt():
         if not job:
             return jsonify({"error": "not_found"}), 404
 
-        try:
-            # send email
-            send_receipt_email(
-                job.email,
-                "Your wipe certificate",
-                "Attached is your wipe certificate.",
-                job.pdf_path,
-            )
-        except Exception:
-            logger.exception("Email sending failed")
+        if not job.email:
+            return jsonify({"error": "email_required"}), 400
 
-        return jsonify({"status": "ok", "job_id": job.job_id, "signature": job.signature})
+        row = send_receipt_email(
+            job.email,
+            "Your wipe certificate",
+            "Attached is your wipe certificate.",
+            job.pdf_hash,
+            job_id=job.job_id,
+            attachment_path=None if job.pdf_hash else job.pdf_path,
+        )
+        return jsonify({"status": "queued", "job_id": job.job_id, "email_id": str(row.id),
+                        "signature": job.signature}), 202
     except Exception as e:
         logger.exception("DB error sending job")
         return jsonify({"error": "db_error", "detail": str(e)}), 500
 
+def _listing_queryset(query):
+    # as_pymongo + no_cache: plain dicts straight off the cursor, nothing retained
+    return (Receipt.objects(__raw__=query)
+            .only(*LISTING_FIELDS)
+            .order_by("-timestamp", "-id")
+            .as_pymongo()
+            .no_cache())
+
+@app.route("/api/receipts", methods=["GET"])
+@require_jwt
+def list_receipts():
+    try:
+        limit = min(max(int(request.args.get("limit", 50)), 1), LIST_PAGE_MAX)
+        query = build_query(request.args, request.args.get("cursor"))
+    except (QueryError, ValueError) as e:
+        return jsonify({"error": str(e) if isinstance(e, QueryError) else "invalid_limit"}), 400
+    try:
+        docs = list(_listing_queryset(query).limit(limit + 1))
+    except Exception as e:
+        logger.exception("DB error listing receipts")
+        return jsonify({"error": "db_error", "detail": str(e)}), 500
+    more = len(docs) > limit
+    docs = docs[:limit]
+    return jsonify({
+        "items": [shape_row(d) for d in docs],
+        "next_cursor": encode_cursor(docs[-1]) if more else None,
+    })
+
+@app.route("/api/receipts/export", methods=["GET"])
+@require_jwt
+def export_receipts():
+    fmt = request.args.get("format", "ndjson")
+    if fmt not in ("ndjson", "csv"):
+        return jsonify({"error": "invalid_format"}), 400
+    try:
+        query = build_query(request.args)
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+    cursor = _listing_queryset(query).batch_size(EXPORT_BATCH_SIZE)
+
+    def generate():
+        if fmt == "csv":
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            writer.writerow(LISTING_FIELDS)
+            for doc in cursor:
+                row = shape_row(doc)
+                writer.writerow([row[f] for f in LISTING_FIELDS])
+                if buf.tell() > 64 * 1024:
+                    yield buf.getvalue()
+                    buf.seek(0)
+                    buf.truncate()
+            yield buf.getvalue()
+        else:
+            for doc in cursor:
+                yield json.dumps(shape_row(doc)) + "\n"
+
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    resp = Response(stream_with_context(generate()), mimetype=mimetype)
+    resp.headers["Content-Disposition"] = f'attachment; filename="receipts.{fmt}"'
+    return resp
+
+boot.mark("import")
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5001)))
+    create_app().run(host="0.0.0.0", port=int(os.environ.get("PORT", 5001)))
@@ -0,0 +1,165 @@
+"""Job assignment for agents.
+
+Agents claim jobs atomically with find_one_and_update: a job is claimable
+when it is still "created", or when it is "claimed" but its lease has run
+out (the agent died or lost connectivity). A claimed job carries the agent
+id and a lease expiry that the agent extends with heartbeats while it works.
+
+Waiting agents (long-poll or SSE) sleep on a condition that create_job
+wakes. With a Redis URI the wake-up is also published so waiters in other
+devapi processes are woken; a periodic re-check covers anything missed.
+"""
+import json
+import logging
+import datetime
+import threading
+
+from pymongo import ReturnDocument
+
+from verifier.models import Receipt
+
+logger = logging.getLogger("devapi.dispatch")
+
+CHANNEL = "securewipe:jobs"
+
+
+class JobDispatcher:
+    def __init__(self, lease_seconds=120, recheck_seconds=5.0, redis_uri=None, retry_seconds=30.0):
+        self.lease_seconds = lease_seconds
+        self.recheck_seconds = recheck_seconds
+        self.retry_seconds = retry_seconds
+        self._cond = threading.Condition()
+        self._generation = 0
+        self._redis = None
+        self._redis_uri = redis_uri
+        self._started = False
+        self._start_lock = threading.Lock()
+        self._retry = None
+
+    def start(self):
+        """Subscribe to cross-process notifications (if Redis is configured); until then wake-ups are local.
+
+        If Redis cannot be reached this raises (for the readiness check) and
+        tries again every retry_seconds in the background.
+        """
+        with self._start_lock:
+            if self._started:
+                return
+            if self._redis_uri:
+                try:
+                    self._start_redis(self._redis_uri)
+                except Exception as e:
+                    self._redis = None
+                    logger.warning("Redis dispatch notifications unavailable at %s — local wake-ups only, "
+                                   "retrying in %.0fs. Reason: %s", self._redis_uri, self.retry_seconds, e)
+                    if self._retry is None:
+                        self._retry = threading.Timer(self.retry_seconds, self._retry_start)
+                        self._retry.daemon = True
+                        self._retry.start()
+                    raise
+            self._started = True
+
+    def _retry_start(self):
+        with self._start_lock:
+            self._retry = None
+        try:
+            self.start()
+        except Exception:
+            pass  # logged, and the next retry scheduled, by start()
+
+    def _start_redis(self, uri):
+        import redis
+        client = redis.from_url(uri, socket_connect_timeout=5)
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{CHANNEL: lambda msg: self._wake()})
+        pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+        self._redis = client
+        logger.info("Job dispatch notifications via Redis: %s", uri)
+
+    def _wake(self):
+        with self._cond:
+            self._generation += 1
+            self._cond.notify_all()
+
+    def notify(self):
+        """Call after creating jobs so waiting agents look again."""
+        if self._redis is not None:
+            try:
+                self._redis.publish(CHANNEL, "1")
+                return
+            except Exception:
+                logger.exception("Dispatch notify via Redis failed")
+        self._wake()
+
+    def _lease_expiry(self):
+        return datetime.datetime.utcnow() + datetime.timedelta(seconds=self.lease_seconds)
+
+    def claim(self, agent_id, platform=None, capacity=1):
+        """Atomically claim the oldest claimable job, or return None."""
+        coll = Receipt._get_collection()
+        now = datetime.datetime.utcnow()
+        if capacity and coll.count_documents(
+                {"agent_id": agent_id, "status": "claimed", "lease_expires": {"$gte": now}}) >= capacity:
+            return None
+        query = {"$or": [
+            {"status": "created"},
+            {"status": "claimed", "lease_expires": {"$lt": now}},
+        ]}
+        if platform:
+            query = {"$and": [query, {"device.platform": platform}]}
+        return coll.find_one_and_update(
+            query,
+            {"$set": {"status": "claimed", "agent_id": agent_id, "lease_expires": self._lease_expiry()}},
+            sort=[("timestamp", 1), ("_id", 1)],
+            projection={"job_id": 1, "device": 1, "method": 1, "payload": 1, "lease_expires": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def wait_for_job(self, agent_id, platform=None, capacity=1, timeout=30.0):
+        """Long-poll: claim a job, waiting up to `timeout` seconds for one to appear."""
+        deadline = datetime.datetime.utcnow() + datetime.timedelta(seconds=timeout)
+        while True:
+            with self._cond:
+                seen = self._generation
+            job = self.claim(agent_id, platform, capacity)
+            if job:
+                return job
+            remaining = (deadline - datetime.datetime.utcnow()).total_seconds()
+            if remaining <= 0:
+                return None
+            with self._cond:
+                if self._generation == seen:
+                    self._cond.wait(min(remaining, self.recheck_seconds))
+
+    def release(self, agent_id, job_id):
+        """Hand a claimed job back (it never reached the agent) and wake the other waiters."""
+        res = Receipt._get_collection().update_one(
+            {"job_id": job_id, "agent_id": agent_id, "status": "claimed"},
+            {"$set": {"status": "created"}, "$unset": {"agent_id": "", "lease_expires": ""}},
+        )
+        if res.modified_count:
+            self.notify()
+        return res.modified_count == 1
+
+    def heartbeat(self, agent_id, job_id):
+        """Extend the lease; False means the lease was lost (expired and reclaimed)."""
+        res = Receipt._get_collection().update_one(
+            {"job_id": job_id, "agent_id": agent_id, "status": "claimed"},
+            {"$set": {"lease_expires": self._lease_expiry()}},
+        )
+        return res.matched_count == 1
+
+
+def job_message(doc):
+    payload = doc.get("payload") or {}
+    return {
+        "job_id": doc["job_id"],
+        "device": doc.get("device") or {},
+        "method": doc.get("method"),
+        "params": payload.get("params") or {},
+        "lease_expires": doc["lease_expires"].isoformat(),
+    }
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,260 @@
+"""Chunked, resumable evidence uploads into GridFS.
+
+Agents compress the wipe tool's output (gzip) while it runs and upload the
+file in fixed-size chunks instead of inlining it in /api/report:
+
+    POST /api/evidence                    {"job_id"}  -> upload_id, chunk_size
+    PUT  /api/evidence/<id>               Upload-Offset: N, body = next chunk
+    GET  /api/evidence/<id>               -> current offset (to resume)
+    POST /api/evidence/<id>/complete      {"sha256", "size"} -> summary
+
+Each chunk goes straight into <bucket>.chunks as GridFS chunk n of file
+upload_id, so nothing is assembled in memory. Every chunk but the last must
+be exactly chunk_size (as GridFS requires); a PUT claims its offset with a
+conditional update before storing anything, so a duplicate or out-of-order
+PUT gets 409 and the current offset. Open uploads left untouched for a while
+are deleted with their chunks (expire_uploads). Completion
+streams the chunks back through a decompressor to check the agent's SHA-256
+of the uncompressed log and build a short summary, then writes the GridFS
+file document. The report then carries only {sha256, size, lines, tail}.
+"""
+import zlib
+import hashlib
+import datetime
+from collections import deque
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from mongoengine.connection import get_db
+
+from verifier.models import EvidenceUpload
+
+BUCKET = "evidence"
+ENCODINGS = {"gzip": 31, "deflate": 15}  # zlib wbits
+TAIL_LINES = 10
+TAIL_LINE_MAX = 200
+INFLATE_STEP = 1 << 20
+CURSOR_BATCH = 4  # chunks per getMore: a few MiB in flight, not the whole file
+WRITE_LEASE_SECONDS = 120  # how long a PUT may hold its offset while storing the chunk
+
+
+class EvidenceError(Exception):
+    def __init__(self, code, status=400, **extra):
+        super().__init__(code)
+        self.code = code
+        self.status = status
+        self.extra = extra
+
+    def body(self):
+        return dict(self.extra, error=self.code)
+
+
+def _chunks():
+    return get_db()[f"{BUCKET}.chunks"]
+
+
+def _files():
+    return get_db()[f"{BUCKET}.files"]
+
+
+def ensure_indexes():
+    # The index GridFS drivers create on first write; chunk writes rely on it
+    # to keep (files_id, n) unique.
+    _chunks().create_index([("files_id", 1), ("n", 1)], unique=True)
+
+
+def open_upload(job_id, encoding, chunk_size):
+    if encoding not in ENCODINGS:
+        raise EvidenceError("unsupported_encoding", supported=sorted(ENCODINGS))
+    return EvidenceUpload(upload_id=str(ObjectId()), job_id=job_id, encoding=encoding,
+                          chunk_size=chunk_size).save()
+
+
+def get_upload(upload_id):
+    upload = EvidenceUpload.objects(upload_id=upload_id).first()
+    if upload is None:
+        raise EvidenceError("not_found", 404)
+    return upload
+
+
+def write_chunk(upload, offset, stream, max_bytes, lease_seconds=WRITE_LEASE_SECONDS):
+    """Store the request body as the chunk at `offset`; returns the new offset.
+
+    The offset is claimed before anything is written: of two PUTs for the
+    same offset only the one holding the claim stores its data and advances
+    the offset, so a duplicate can never replace a chunk already counted.
+    The claim is a lease, so a request that dies holding it does not block
+    the upload for longer than `lease_seconds`.
+    """
+    if upload.status != "open":
+        raise EvidenceError("upload_complete", 409, offset=upload.received)
+    if offset != upload.received or upload.sealed:
+        raise EvidenceError("offset_mismatch", 409, offset=upload.received)
+    data = stream.read(upload.chunk_size + 1)  # bounded: one chunk, never the whole file
+    if len(data) > upload.chunk_size:
+        raise EvidenceError("chunk_too_large", 413, chunk_size=upload.chunk_size)
+    if not data:
+        raise EvidenceError("empty_chunk")
+    if offset + len(data) > max_bytes:
+        raise EvidenceError("evidence_too_large", 413, max_bytes=max_bytes)
+    coll = EvidenceUpload._get_collection()
+    now = datetime.datetime.utcnow()
+    writer = str(ObjectId())
+    claimed = coll.update_one(
+        {"_id": upload.pk, "received": offset, "sealed": False, "status": "open",
+         "$or": [{"writer": None}, {"writer_until": {"$lt": now}}]},
+        {"$set": {"writer": writer, "writer_until": now + datetime.timedelta(seconds=lease_seconds),
+                  "updated_at": now}},
+    )
+    if not claimed.modified_count:
+        # Another request has this offset (duplicate PUT) or moved past it; tell the client where we are.
+        raise EvidenceError("offset_mismatch", 409, offset=get_upload(upload.upload_id).received)
+    n = offset // upload.chunk_size
+    files_id = ObjectId(upload.upload_id)
+    try:
+        _chunks().replace_one({"files_id": files_id, "n": n}, {"files_id": files_id, "n": n, "data": data},
+                              upsert=True)
+    except Exception:
+        coll.update_one({"_id": upload.pk, "writer": writer}, {"$unset": {"writer": "", "writer_until": ""}})
+        raise
+    advanced = coll.find_one_and_update(
+        {"_id": upload.pk, "writer": writer, "received": offset},
+        {"$inc": {"received": len(data), "chunks": 1},
+         "$set": {"sealed": len(data) < upload.chunk_size, "updated_at": datetime.datetime.utcnow()},
+         "$unset": {"writer": "", "writer_until": ""}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if advanced is None:
+        # Our lease ran out before the chunk was stored and another request took the offset over.
+        raise EvidenceError("offset_mismatch", 409, offset=get_upload(upload.upload_id).received)
+    return advanced["received"]
+
+
+def expire_uploads(max_age, limit=500):
+    """Delete open uploads untouched for `max_age` seconds, and their chunks; returns the upload ids.
+
+    Agents resume an upload by its id, so an open upload nobody has written
+    to for that long has been abandoned. The upload row goes first, on the
+    same condition, so one that is written to meanwhile is left alone.
+    """
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=max_age)
+    coll = EvidenceUpload._get_collection()
+    stale = {"status": "open", "updated_at": {"$lt": cutoff}}
+    expired = []
+    for row in coll.find(stale, {"upload_id": 1}).limit(limit):
+        if coll.delete_one(dict(stale, _id=row["_id"])).deleted_count:
+            _chunks().delete_many({"files_id": ObjectId(row["upload_id"])})
+            expired.append(row["upload_id"])
+    return expired
+
+
+def _scan(upload):
+    """Stream the stored chunks through the decompressor: sha256, size, line count and tail."""
+    files_id = ObjectId(upload.upload_id)
+    inflate = zlib.decompressobj(ENCODINGS[upload.encoding])
+    digest = hashlib.sha256()
+    size = lines = 0
+    tail = deque(maxlen=TAIL_LINES)
+    partial = b""
+
+    def feed(data):
+        nonlocal size, lines, partial
+        digest.update(data)
+        size += len(data)
+        lines += data.count(b"\n")
+        parts = (partial + data).split(b"\n")
+        partial = parts.pop()[:TAIL_LINE_MAX]
+        tail.extend(p[:TAIL_LINE_MAX] for p in parts[-TAIL_LINES:])
+
+    expected = 0
+    for chunk in _chunks().find({"files_id": files_id}, sort=[("n", 1)]).batch_size(CURSOR_BATCH):
+        if chunk["n"] != expected:
+            raise EvidenceError("missing_chunk", 409, n=expected)
+        expected += 1
+        data = chunk["data"]
+        try:
+            # bounded steps: logs compress very well, a chunk may inflate 100x
+            while data:
+                feed(inflate.decompress(data, INFLATE_STEP))
+                data = inflate.unconsumed_tail
+        except zlib.error:
+            raise EvidenceError("corrupt_evidence", 422)
+    try:
+        feed(inflate.flush())
+    except zlib.error:
+        raise EvidenceError("corrupt_evidence", 422)
+    if not inflate.eof:
+        raise EvidenceError("truncated_evidence", 422)
+    if partial:
+        lines += 1
+        tail.append(partial)
+    return digest.hexdigest(), size, {"lines": lines, "tail": [t.decode(errors="replace") for t in tail]}
+
+
+def complete_upload(upload, sha256=None, size=None):
+    """Check the stored log against the agent's hash and publish it as a GridFS file."""
+    if upload.status == "complete":
+        if sha256 and sha256 != upload.sha256:
+            raise EvidenceError("evidence_hash_mismatch", 422, sha256=upload.sha256)
+        return upload
+    actual, actual_size, summary = _scan(upload)
+    if (sha256 and sha256 != actual) or (size is not None and size != actual_size):
+        raise EvidenceError("evidence_hash_mismatch", 422, sha256=actual, size=actual_size)
+    now = datetime.datetime.utcnow()
+    _files().replace_one({"_id": ObjectId(upload.upload_id)}, {
+        "_id": ObjectId(upload.upload_id),
+        "length": upload.received,
+        "chunkSize": upload.chunk_size,
+        "uploadDate": now,
+        "filename": f"{upload.job_id}.log.{'gz' if upload.encoding == 'gzip' else 'zz'}",
+        "metadata": {"job_id": upload.job_id, "encoding": upload.encoding, "sha256": actual, "size": actual_size},
+    }, upsert=True)
+    upload.update(set__status="complete", set__sealed=True, set__sha256=actual, set__size=actual_size,
+                  set__summary=summary, set__updated_at=now)
+    upload.reload()
+    return upload
+
+
+def evidence_record(upload):
+    """What goes into the signed report payload in place of the raw log."""
+    return {
+        "evidence_id": upload.upload_id,
+        "sha256": upload.sha256,
+        "size": upload.size,
+        "encoding": upload.encoding,
+        "lines": (upload.summary or {}).get("lines"),
+        "tail": (upload.summary or {}).get("tail", []),
+    }
+
+
+def attach_evidence(reports):
+    """Replace "evidence_id" in report payloads with the stored evidence record.
+
+    `reports` is a list of (job_id, payload); payloads are edited in place.
+    Returns {job_id: error code} for references that do not resolve to a
+    completed upload for that job.
+    """
+    wanted = {p["evidence_id"]: job_id for job_id, p in reports if p.get("evidence_id")}
+    if not wanted:
+        return {}
+    found = {u.upload_id: u for u in EvidenceUpload.objects(upload_id__in=list(wanted), status="complete")}
+    errors = {}
+    for job_id, p in reports:
+        upload_id = p.get("evidence_id")
+        if not upload_id:
+            continue
+        upload = found.get(upload_id)
+        if upload is None or upload.job_id != job_id:
+            errors[job_id] = "evidence_not_found"
+            continue
+        p.pop("evidence_id")
+        p["evidence"] = evidence_record(upload)
+    return errors
+
+
+def iter_chunks(upload_id):
+    """Yield the stored (compressed) log chunk by chunk, as GridFS reads it."""
+    cursor = (_chunks().find({"files_id": ObjectId(upload_id)}, {"data": 1}, sort=[("n", 1)])
+              .batch_size(CURSOR_BATCH))
+    for chunk in cursor:
+        yield chunk["data"]
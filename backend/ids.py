@@ -0,0 +1,77 @@
+"""Sortable, collision-free job IDs.
+
+IDs are 128-bit, ULID-style values rendered as 26 Crockford base32
+characters behind a "job-" prefix, so string order is creation order:
+
+    48 bits  milliseconds since the epoch
+    16 bits  node id (one per devapi process)
+    16 bits  sequence within the millisecond
+    48 bits  random
+
+The node id is a hash of the replica name and the pid, so the gunicorn
+workers of one replica differ even though they share its environment. The
+replica name is JOB_ID_NODE when set, otherwise the hostname. A 16-bit hash
+can still collide between two processes; the sequence makes IDs from one
+process strictly increasing, even if the wall clock steps backwards, and
+the random tail keeps two processes that share a node id apart.
+"""
+import os
+import time
+import socket
+import hashlib
+import threading
+
+_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_SEQ_MAX = 0xFFFF
+
+
+def _encode(value):
+    chars = []
+    for _ in range(26):
+        chars.append(_ALPHABET[value & 31])
+        value >>= 5
+    return "".join(reversed(chars))
+
+
+def _default_node():
+    replica = os.environ.get("JOB_ID_NODE") or socket.gethostname()
+    seed = f"{replica}:{os.getpid()}".encode()
+    return int.from_bytes(hashlib.sha256(seed).digest()[:2], "big")
+
+
+class JobIdGenerator:
+    def __init__(self, node=None, prefix="job-"):
+        self.prefix = prefix
+        self._fixed_node = node
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self.node = (self._fixed_node if self._fixed_node is not None else _default_node()) & 0xFFFF
+        self._last_ms = 0
+        self._seq = 0
+
+    def new_id(self):
+        with self._lock:
+            if os.getpid() != self._pid:
+                # forked: the child must not share the parent's node/sequence state
+                self._reset()
+            now = int(time.time() * 1000)
+            if now > self._last_ms:
+                self._last_ms, self._seq = now, 0
+            else:
+                # same millisecond, or the clock went backwards: keep counting
+                self._seq += 1
+                if self._seq > _SEQ_MAX:
+                    self._last_ms, self._seq = self._last_ms + 1, 0
+            ms, seq = self._last_ms, self._seq
+        value = (ms << 80) | (self.node << 64) | (seq << 48) | int.from_bytes(os.urandom(6), "big")
+        return self.prefix + _encode(value)
+
+
+_generator = JobIdGenerator()
+
+
+def new_job_id():
+    return _generator.new_id()
@@ -0,0 +1,77 @@
+"""Receipt listing helpers: filter parsing, keyset cursors and row shaping.
+
+Listings are ordered newest first on (timestamp, _id) and paginated by
+keyset: the cursor is the (timestamp, _id) of the last row returned, so each
+page is an index range scan instead of a skip over everything before it.
+Legacy receipts without a timestamp sort after every dated one; their cursor
+carries an empty timestamp.
+"""
+import base64
+import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+LISTING_FIELDS = ("job_id", "operator", "method", "status", "email", "timestamp")
+SORT = [("timestamp", -1), ("_id", -1)]
+
+
+class QueryError(ValueError):
+    pass
+
+
+def _parse_date(value, name):
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise QueryError(f"invalid_{name}")
+
+
+def encode_cursor(row):
+    ts = row.get("timestamp")
+    raw = f"{ts.isoformat() if ts else ''}|{row['_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ts, oid = raw.split("|", 1)
+        return (datetime.datetime.fromisoformat(ts) if ts else None), ObjectId(oid)
+    except (ValueError, InvalidId, UnicodeDecodeError):
+        raise QueryError("invalid_cursor")
+
+
+def build_query(args, cursor=None):
+    """Mongo filter from request args (status, operator, method, from, to)."""
+    clauses = []
+    for name in ("status", "operator", "method"):
+        if args.get(name):
+            clauses.append({name: args[name]})
+    ts = {}
+    if args.get("from"):
+        ts["$gte"] = _parse_date(args["from"], "from")
+    if args.get("to"):
+        ts["$lt"] = _parse_date(args["to"], "to")
+    if ts:
+        clauses.append({"timestamp": ts})
+    if cursor:
+        last_ts, last_id = decode_cursor(cursor)
+        if last_ts is None:
+            clauses.append({"timestamp": None, "_id": {"$lt": last_id}})
+        else:
+            clauses.append({"$or": [
+                {"timestamp": {"$lt": last_ts}},
+                {"timestamp": last_ts, "_id": {"$lt": last_id}},
+                {"timestamp": None},
+            ]})
+    if not clauses:
+        return {}
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def shape_row(doc):
+    row = {f: doc.get(f) for f in LISTING_FIELDS}
+    if row["timestamp"] is not None:
+        row["timestamp"] = row["timestamp"].isoformat()
+    return row
@@ -0,0 +1,162 @@
+"""Durable email outbox.
+
+Requests and the receipt pipeline only insert an EmailOutbox row; sender
+threads drain the collection in batches over a pooled SMTP connection
+(tools.emailer.SMTPPool), so a slow or flaky mail server never holds up an
+API call and one bad message does not sink the rest of the batch.
+
+A row is claimed with find_one_and_update (pending -> sending, with a lease
+in next_attempt_at, so a crashed sender's rows become claimable again). On
+failure it goes back to pending with exponential backoff and jitter; after
+max_attempts, or on a permanent 5xx refusal, it is marked failed.
+"""
+import os
+import random
+import logging
+import smtplib
+import datetime
+import threading
+
+from pymongo import ReturnDocument
+
+from verifier.models import EmailOutbox
+from verifier.metrics import REGISTRY
+
+logger = logging.getLogger("devapi.outbox")
+
+deliveries = REGISTRY.counter("outbox_deliveries_total", "Outbox send attempts by outcome (sent / retry / failed)")
+
+
+def enqueue(to, subject, body, attachment_path=None, job_id=None, attachment_key=None):
+    """Queue one email for delivery; returns the outbox row."""
+    return EmailOutbox(to=to, subject=subject, body=body, attachment_path=attachment_path,
+                       attachment_key=attachment_key, job_id=job_id).save()
+
+
+class SMTPTransport:
+    def __init__(self, pool, sender, store=None):
+        self.pool = pool
+        self.sender = sender
+        self.store = store
+
+    def send(self, row):
+        from tools.emailer import build_message
+        attachment = None
+        if row.get("attachment_key") and self.store is not None:
+            name = f"securewipe_{row.get('job_id') or row['attachment_key'][:16]}.pdf"
+            attachment = (self.store.get(row["attachment_key"]), name)
+        self.pool.send(build_message(self.sender, row["to"], row.get("subject") or "",
+                                     row.get("body") or "", row.get("attachment_path"), attachment))
+
+
+class LoggingTransport:
+    """Used when SMTP is not configured (development)."""
+
+    def send(self, row):
+        logger.info("Pretend-sending email to %s subj=%s attachment=%s",
+                    row["to"], row.get("subject"), row.get("attachment_key") or row.get("attachment_path"))
+
+
+def transport_from_env(store=None):
+    if not os.environ.get("SMTP_SERVER"):
+        logger.info("SMTP_SERVER not set — outbox emails are logged, not sent")
+        return LoggingTransport()
+    from tools.emailer import get_pool
+    return SMTPTransport(get_pool(), os.environ.get("EMAIL_FROM", os.environ.get("SMTP_USER")), store)
+
+
+def _permanent(exc):
+    # 5xx replies (bad recipient, message rejected) will not get better on retry
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in exc.recipients.values())
+    return isinstance(exc, smtplib.SMTPResponseException) and exc.smtp_code >= 500
+
+
+class OutboxSender:
+    def __init__(self, transport, workers=1, batch_size=50, max_attempts=8,
+                 base_delay=30.0, max_delay=3600.0, lease_seconds=300, idle_seconds=2.0):
+        self.transport = transport
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease_seconds = lease_seconds
+        self.idle_seconds = idle_seconds
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._stop.clear()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"outbox-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        logger.info("Started %d outbox senders", self.workers)
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        self._wake.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def notify(self):
+        """Call after enqueueing so an idle sender looks again straight away."""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                sent = self.drain_once()
+            except Exception:
+                logger.exception("Outbox drain failed")
+                sent = 0
+            if not sent:
+                self._wake.wait(self.idle_seconds)
+                self._wake.clear()
+
+    def _claim(self, now):
+        coll = EmailOutbox._get_collection()
+        due = {"$or": [{"status": "pending"}, {"status": "sending"}], "next_attempt_at": {"$lte": now}}
+        lease = now + datetime.timedelta(seconds=self.lease_seconds)
+        return coll.find_one_and_update(
+            due,
+            {"$set": {"status": "sending", "next_attempt_at": lease}, "$inc": {"attempts": 1}},
+            sort=[("next_attempt_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def backoff(self, attempts):
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempts - 1)))
+        return delay * random.uniform(0.5, 1.0)
+
+    def drain_once(self):
+        """Claim and send up to batch_size due messages; returns how many were processed."""
+        coll = EmailOutbox._get_collection()
+        done = 0
+        while done < self.batch_size and not self._stop.is_set():
+            now = datetime.datetime.utcnow()
+            row = self._claim(now)
+            if row is None:
+                break
+            done += 1
+            try:
+                self.transport.send(row)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"[:512]
+                if _permanent(e) or row["attempts"] >= self.max_attempts:
+                    logger.warning("Email %s to %s failed for good: %s", row["_id"], row["to"], error)
+                    update = {"status": "failed", "last_error": error}
+                    deliveries.inc(outcome="failed")
+                else:
+                    retry_at = now + datetime.timedelta(seconds=self.backoff(row["attempts"]))
+                    update = {"status": "pending", "last_error": error, "next_attempt_at": retry_at}
+                    deliveries.inc(outcome="retry")
+                coll.update_one({"_id": row["_id"]}, {"$set": update})
+                continue
+            deliveries.inc(outcome="sent")
+            coll.update_one({"_id": row["_id"]},
+                            {"$set": {"status": "sent", "sent_at": datetime.datetime.utcnow(), "last_error": None}})
+        return done
@@ -0,0 +1,380 @@
+"""Receipt finalization pipeline.
+
+/api/report stores the agent's result and queues a "finalize" task; worker
+threads pick it up and move the receipt through
+
+    reported -> signed -> rendered -> emailed
+
+persisting after every stage so the status can be polled and a re-queued
+task resumes where the previous attempt stopped. Only a successful wipe goes
+past "signed": other outcomes are signed as reported, with no certificate
+and no email. "emailed" means the
+certificate is in the email outbox (backend.outbox), which handles delivery
+and retries on its own.
+
+A task leaves the queue before it is processed, so one held by a worker
+that crashes (or a process that restarts) is gone. Every stage stamps
+finalize_at on the receipt, and a sweep re-queues receipts that have sat in
+a stage for stale_seconds; the stages are status-guarded, so a re-queued
+job only runs what is left.
+
+Tasks travel through a pluggable queue: an in-process queue.Queue for single
+process deployments and tests, or a Redis list (normally the same Redis the
+rate limiter uses) so any devapi process can pick up work.
+"""
+import json
+import time
+import queue
+import datetime
+import logging
+import threading
+from urllib.parse import urlparse
+
+from verifier.models import Receipt, encode_signed
+from verifier.metrics import REGISTRY, timed
+
+logger = logging.getLogger("devapi.pipeline")
+
+STAGES = ("reported", "signed", "rendered", "emailed")
+
+stage_failures = REGISTRY.counter("pipeline_failures_total", "Finalize failures by stage")
+requeued = REGISTRY.counter("pipeline_requeued_total", "Stuck receipts re-queued by the sweep")
+
+# Agent results that earn a certificate. Any other outcome (failed,
+# dry-run, refused) is signed as reported and stops at "signed": no
+# certificate is rendered and nothing is emailed.
+CERTIFIED = ("success",)
+
+# Receipts the pipeline still owes work: signing, rendering, or the email (if there is an address).
+PENDING = {"$or": [
+    {"status": "reported"},
+    {"status": "signed", "payload.status": {"$in": list(CERTIFIED)}},
+    {"status": "rendered", "payload.status": {"$in": list(CERTIFIED)}, "email": {"$nin": [None, ""]}},
+]}
+
+
+class InProcessQueue:
+    def __init__(self):
+        self._q = queue.Queue()
+
+    def put(self, task):
+        self._q.put(task)
+
+    def get(self, timeout=1.0):
+        try:
+            if timeout <= 0:
+                return self._q.get_nowait()
+            return self._q.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def depth(self):
+        return self._q.qsize()
+
+
+class RedisQueue:
+    def __init__(self, uri, key="securewipe:pipeline"):
+        import redis
+        self.key = key
+        self._r = redis.from_url(uri)
+
+    def put(self, task):
+        self._r.lpush(self.key, json.dumps(task))
+
+    def get(self, timeout=1.0):
+        if timeout <= 0:
+            item = self._r.rpop(self.key)
+            return json.loads(item) if item is not None else None
+        item = self._r.brpop(self.key, timeout=max(1, int(timeout)))
+        if item is None:
+            return None
+        return json.loads(item[1])
+
+    def depth(self):
+        return self._r.llen(self.key)
+
+
+class LazyQueue:
+    """Builds the queue with `factory` on first use, so choosing it (and
+    pinging Redis) happens on a worker thread rather than at import.
+
+    If the factory raises, an InProcessQueue stands in and the factory is
+    tried again every retry_seconds; once it succeeds, tasks queued in the
+    meantime move over to the real queue.
+    """
+
+    def __init__(self, factory, retry_seconds=30.0):
+        self._factory = factory
+        self.retry_seconds = retry_seconds
+        self._queue = None
+        self._fallback = None
+        self._retry_at = 0.0
+        self.error = None  # why the stand-in is in use, None once the real queue is built
+        self._lock = threading.Lock()
+
+    def _get(self):
+        if self._queue is None:
+            with self._lock:
+                if self._queue is None and time.monotonic() >= self._retry_at:
+                    self._build()
+            if self._queue is None:
+                return self._fallback
+        return self._queue
+
+    def _build(self):
+        try:
+            built = self._factory()
+        except Exception as e:
+            if self._fallback is None:
+                self._fallback = InProcessQueue()
+            self._retry_at = time.monotonic() + self.retry_seconds
+            self.error = f"{type(e).__name__}: {e}"
+            logger.warning("Pipeline queue unavailable, using an in-process queue and retrying in %.0fs: %s",
+                           self.retry_seconds, e)
+            return
+        if self._fallback is not None:
+            moved = 0
+            while True:
+                task = self._fallback.get(timeout=0)
+                if task is None:
+                    break
+                built.put(task)
+                moved += 1
+            logger.info("Pipeline queue is back; moved %d task(s) queued in process", moved)
+        self._queue, self.error = built, None
+
+    def put(self, task):
+        self._get().put(task)
+
+    def get(self, timeout=1.0):
+        return self._get().get(timeout)
+
+    def depth(self):
+        return self._get().depth()
+
+
+def make_queue(uri, fallback=True):
+    """memory:// (or empty) -> InProcessQueue, redis(s)://... -> RedisQueue.
+
+    Without `fallback` an unreachable Redis raises instead of giving an
+    InProcessQueue (LazyQueue then retries it).
+    """
+    scheme = urlparse(uri or "").scheme
+    if scheme in ("redis", "rediss"):
+        try:
+            q = RedisQueue(uri)
+            q._r.ping()
+            logger.info("Using Redis pipeline queue: %s", uri)
+            return q
+        except Exception as e:
+            if not fallback:
+                raise
+            logger.warning("Redis pipeline queue unavailable at %s — using in-process queue. Reason: %s", uri, e)
+    return InProcessQueue()
+
+
+class ReceiptPipeline:
+    """Runs the finalize stages on a pool of worker threads.
+
+    sign(payload) -> signature, render(payload, signature, job_id) -> blob
+    store key of the PDF and email(to, subject, body, attachment_key,
+    job_id=...) are supplied by the service so the
+    pipeline does not care which signer / renderer / mailer is configured.
+
+    With sign_batch(payloads) -> [{"signature", "batch_id", "proof"}, ...]
+    and batch_window > 0, each worker collects the tasks arriving within the
+    window (up to batch_max) and signs them with one Merkle-batched
+    signature; anything the batch could not sign falls back to sign().
+
+    With sweep_interval > 0, start() also runs sweep() that often. A
+    receipt whose stages have failed max_attempts times is parked as
+    "finalize_failed" and left alone.
+    """
+
+    def __init__(self, task_queue, sign, render, email, workers=2, sign_batch=None, batch_window=0.0, batch_max=256,
+                 stale_seconds=900.0, sweep_interval=60.0, sweep_batch=500, max_attempts=8):
+        self.queue = task_queue
+        self.sign = sign
+        self.render = render
+        self.email = email
+        self.workers = workers
+        self.sign_batch = sign_batch
+        self.batch_window = batch_window
+        self.batch_max = batch_max
+        self.stale_seconds = stale_seconds
+        self.sweep_interval = sweep_interval
+        self.sweep_batch = sweep_batch
+        self.max_attempts = max_attempts
+        self._threads = []
+        self._stop = threading.Event()
+
+    def submit(self, job_id):
+        self.queue.put({"task": "finalize", "job_id": job_id})
+
+    def start(self):
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"pipeline-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        if self.sweep_interval > 0:
+            t = threading.Thread(target=self._sweep_loop, name="pipeline-sweep", daemon=True)
+            t.start()
+            self._threads.append(t)
+        logger.info("Started %d pipeline workers", self.workers)
+
+    def _sweep_loop(self):
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("Pipeline sweep failed")
+
+    def sweep(self):
+        """Re-queue receipts whose finalize_at is older than stale_seconds; returns their job ids.
+
+        Each one is claimed by moving its finalize_at forward with a
+        conditional update, so with several devapi processes sweeping only
+        one of them re-queues a given receipt.
+        """
+        now = datetime.datetime.utcnow()
+        cutoff = now - datetime.timedelta(seconds=self.stale_seconds)
+        coll = Receipt._get_collection()
+        stale = {"$or": [{"finalize_at": None}, {"finalize_at": {"$lt": cutoff}}]}
+        job_ids = []
+        for doc in coll.find({"$and": [PENDING, stale]}, {"job_id": 1, "finalize_at": 1}).limit(self.sweep_batch):
+            res = coll.update_one({"_id": doc["_id"], "finalize_at": doc.get("finalize_at")},
+                                  {"$set": {"finalize_at": now}})
+            if res.modified_count:
+                self.submit(doc["job_id"])
+                job_ids.append(doc["job_id"])
+        if job_ids:
+            requeued.inc(len(job_ids))
+            logger.warning("Re-queued %d receipts stuck in the pipeline: %s", len(job_ids), ", ".join(job_ids[:10]))
+        return job_ids
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                task = self.queue.get(timeout=1.0)
+            except Exception:
+                logger.exception("Pipeline queue read failed")
+                self._stop.wait(1.0)
+                continue
+            if not task:
+                continue
+            job_ids = self._finalize_ids([task])
+            if job_ids and self.sign_batch and self.batch_window > 0:
+                job_ids += self._collect_window(len(job_ids))
+                try:
+                    self.sign_window(job_ids)
+                except Exception:
+                    logger.exception("Batch signing of %d jobs crashed", len(job_ids))
+            for job_id in job_ids:
+                try:
+                    self.finalize(job_id)
+                except Exception:
+                    logger.exception("Finalize %s crashed", job_id)
+
+    @staticmethod
+    def _finalize_ids(tasks):
+        ids = []
+        for task in tasks:
+            if task.get("task") != "finalize":
+                logger.warning("Unknown pipeline task: %r", task)
+                continue
+            ids.append(task.get("job_id"))
+        return ids
+
+    def _collect_window(self, have):
+        tasks = []
+        deadline = time.monotonic() + self.batch_window
+        while have + len(tasks) < self.batch_max:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            task = self.queue.get(timeout=0)
+            if task:
+                tasks.append(task)
+            else:
+                time.sleep(min(remaining, 0.01))
+        return self._finalize_ids(tasks)
+
+    @timed("pipeline.sign_batch")
+    def sign_window(self, job_ids):
+        """Sign every still-unsigned job in job_ids under one Merkle batch signature."""
+        jobs = list(Receipt.objects(job_id__in=job_ids, status="reported"))
+        if not jobs:
+            return
+        try:
+            signed = self.sign_batch([job.payload or {} for job in jobs])
+        except Exception:
+            # finalize() signs them one by one instead
+            logger.exception("Batch signing failed for %d jobs", len(jobs))
+            stage_failures.inc(stage="sign_batch")
+            return
+        for job, s in zip(jobs, signed):
+            job.signature = s["signature"]
+            job.batch_id = s["batch_id"]
+            job.merkle_proof = s["proof"]
+            job.signed_blob = encode_signed(job.payload or {})
+            job.status = "signed"
+            job.error = None
+            job.finalize_at = datetime.datetime.utcnow()
+            job.save()
+
+    @timed("pipeline.finalize")
+    def finalize(self, job_id):
+        job = Receipt.objects(job_id=job_id).first()
+        if not job:
+            logger.warning("Finalize: job %s not found", job_id)
+            return
+        stage = "sign"
+        try:
+            payload = job.payload or {}
+            if job.status == "reported":
+                with timed("pipeline.sign"):
+                    job.signature = self.sign(payload)
+                job.batch_id = None
+                job.merkle_proof = []
+                job.signed_blob = encode_signed(payload)
+                job.status = "signed"
+                job.error = None
+                job.finalize_at = datetime.datetime.utcnow()
+                job.save()
+            if payload.get("status") not in CERTIFIED:
+                return
+            stage = "render"
+            if job.status == "signed":
+                with timed("pipeline.render"):
+                    job.pdf_hash = self.render(payload, job.signature, job_id)
+                job.status = "rendered"
+                job.error = None
+                job.finalize_at = datetime.datetime.utcnow()
+                job.save()
+            stage = "email"
+            if job.status == "rendered" and job.email:
+                with timed("pipeline.email"):
+                    self.email(job.email, "Your wipe certificate",
+                               "Attached is your wipe certificate.", job.pdf_hash, job_id=job_id)
+                job.status = "emailed"
+                job.error = None
+                job.finalize_at = datetime.datetime.utcnow()
+                job.save()
+        except Exception as e:
+            # Status stays at the last completed stage so a re-submit (or the
+            # sweep, stale_seconds from now) resumes, up to max_attempts.
+            logger.exception("Finalize %s failed during %s", job_id, stage)
+            stage_failures.inc(stage=stage)
+            job.error = f"{stage}: {e}"[:512]
+            job.finalize_attempts = (job.finalize_attempts or 0) + 1
+            if job.finalize_attempts >= self.max_attempts:
+                logger.error("Finalize %s failed %d times, giving up", job_id, job.finalize_attempts)
+                job.status = "finalize_failed"
+            job.finalize_at = datetime.datetime.utcnow()
+            job.save()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""Auth overhead per request: full jwt.decode (old require_jwt) vs the
+JWTKeyring claim cache, and API key checks, both as bare calls and through a
+Flask test client (so the number is comparable to a whole request).
+
+USAGE:
+  python3 bench/bench_auth.py -n 20000
+"""
+import os, sys, time, argparse
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + '/../'))
+import jwt
+from flask import Flask, request, jsonify
+from backend.auth import JWTKeyring, AuthError
+from verifier.auth import APIKeySet
+
+def per_call(label, n, fn):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    dt = time.perf_counter() - t0
+    print(f"{label:<36} {dt / n * 1e6:8.2f} us/call")
+
+def app_with(check):
+    app = Flask(__name__)
+
+    @app.route('/ping')
+    def ping():
+        token = request.headers.get('Authorization', '')[7:]
+        try:
+            check(token)
+        except (AuthError, jwt.PyJWTError):
+            return jsonify({'error': 'invalid_token'}), 401
+        return jsonify({'ok': True})
+    return app.test_client()
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser()
+    p.add_argument('-n', type=int, default=20000)
+    args = p.parse_args()
+    secret = 'bench-secret-' + 'x' * 32
+    keyring = JWTKeyring({'k2': secret, 'k1': 'old-' + secret}, active_kid='k2')
+    token = keyring.issue({'role': 'agent', 'sub': 'bench-01'})
+    legacy = jwt.encode({'role': 'agent'}, secret, algorithm='HS256')
+
+    per_call('jwt.decode (old require_jwt)', args.n, lambda: jwt.decode(legacy, secret, algorithms=['HS256']))
+    per_call('JWTKeyring.decode (uncached)', args.n, lambda: keyring.decode(token))
+    per_call('JWTKeyring.verify (cached)', args.n, lambda: keyring.verify(token))
+
+    keys = APIKeySet([f'key-{i}' for i in range(8)])
+    per_call('api key: plain != (old)', args.n, lambda: 'key-7' != 'changeme')
+    per_call('APIKeySet.check (8 keys)', args.n, lambda: keys.check('key-7'))
+
+    n = max(1, args.n // 10)
+    headers = {'Authorization': f'Bearer {token}'}
+    old = app_with(lambda t: jwt.decode(legacy, secret, algorithms=['HS256']))
+    new = app_with(keyring.verify)
+    per_call('request: jwt.decode', n, lambda: old.get('/ping', headers=headers))
+    per_call('request: keyring.verify (cached)', n, lambda: new.get('/ping', headers=headers))
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""Receipts signed/sec and verified/sec: one RSA signature per receipt vs one
+per Merkle batch (verifier.merkle), at a few batch sizes.
+
+USAGE:
+  python3 bench/bench_batch_signing.py --key private_prod.pem --pub public.pem -n 2000
+"""
+import os, sys, time, argparse
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + '/../'))
+from cryptography.hazmat.primitives import serialization, hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+from tools.signer import Signer, canonical_bytes
+from verifier.merkle import build_tree, root_from_proof, batch_statement
+
+def rate(label, n, fn):
+    t0 = time.perf_counter()
+    fn()
+    dt = time.perf_counter() - t0
+    print(f"{label:<34} {n / dt:10.1f} receipts/s  ({dt:.3f}s for {n})")
+
+def sign_batched(signer, payloads, size):
+    out = []
+    for start in range(0, len(payloads), size):
+        chunk = payloads[start:start + size]
+        root, proofs = build_tree([canonical_bytes(p) for p in chunk])
+        sig = signer.sign(batch_statement(f'batch-{start}', root.hex(), len(chunk)))
+        out.extend((p, sig, f'batch-{start}', root.hex(), len(chunk), proof) for p, proof in zip(chunk, proofs))
+    return out
+
+def verify_batched(pub, signed):
+    verified_roots = set()  # the verifier's root cache
+    for payload, sig, batch_id, root, size, proof in signed:
+        if (batch_id, sig) not in verified_roots:
+            pub.verify(bytes.fromhex(sig), canonical_bytes(batch_statement(batch_id, root, size)),
+                       padding.PKCS1v15(), hashes.SHA256())
+            verified_roots.add((batch_id, sig))
+        assert root_from_proof(canonical_bytes(payload), proof).hex() == root
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser()
+    p.add_argument('--key', default='private_prod.pem')
+    p.add_argument('--pub', default='public.pem')
+    p.add_argument('-n', type=int, default=2000)
+    args = p.parse_args()
+    payloads = [{'job_id': f'job-{i}', 'status': 'success', 'device': {'serial': f'SN{i:06d}'},
+                 'evidence': [{'cmd': 'wipe', 'out': 'ok ' * 30}]} for i in range(args.n)]
+    signer = Signer(args.key, workers=1)
+    with open(args.pub, 'rb') as f:
+        pub = serialization.load_pem_public_key(f.read())
+    signer.sign(payloads[0])
+    single = []
+    rate('sign: RSA per receipt', args.n, lambda: single.extend(signer.sign(p) for p in payloads))
+    for size in (16, 64, 256):
+        rate(f'sign: Merkle batch of {size}', args.n, lambda: sign_batched(signer, payloads, size))
+    rate('verify: RSA per receipt', args.n, lambda: [pub.verify(bytes.fromhex(s), canonical_bytes(p), padding.PKCS1v15(),
+                                                                hashes.SHA256()) for p, s in zip(payloads, single)])
+    signed = sign_batched(signer, payloads, 256)
+    rate('verify: proof + cached root (256)', args.n, lambda: verify_batched(pub, signed))
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""Receipt blob store: render+put throughput, first write vs deduplicated
+re-render, for the local store and for S3 (against a local moto server).
+
+USAGE:
+  python3 bench/bench_blobstore.py -n 200            # local only
+  python3 bench/bench_blobstore.py -n 200 --s3       # also S3 (needs boto3 + moto[server])
+"""
+import os, sys, time, tempfile, argparse
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + '/../'))
+from tools.pdf_receipt import CertificateRenderer
+from verifier.blobstore import LocalBlobStore, S3BlobStore
+
+def rate(label, n, fn):
+    t0 = time.perf_counter()
+    fn()
+    dt = time.perf_counter() - t0
+    print(f"{label:<32} {n / dt:10.1f} put/s  ({dt:.3f}s for {n})")
+
+def run(name, store, renderer, receipts):
+    keys = []
+    rate(f'{name}: render + first put', len(receipts),
+         lambda: keys.extend(renderer.render_to_store(store, *r) for r in receipts))
+    again = []
+    rate(f'{name}: re-render (dedup)', len(receipts),
+         lambda: again.extend(renderer.render_to_store(store, *r) for r in receipts))
+    assert keys == again, 'rendering is not deterministic'
+    blobs = [renderer.render_bytes(*r) for r in receipts]
+    rate(f'{name}: put only (dedup)', len(blobs), lambda: [store.put(b) for b in blobs])
+
+def s3_store():
+    import boto3
+    from moto.server import ThreadedMotoServer
+    server = ThreadedMotoServer(port=0)
+    server.start()
+    host, port = server.get_host_and_port()
+    client = boto3.client('s3', endpoint_url=f'http://{host}:{port}', region_name='us-east-1',
+                          aws_access_key_id='bench', aws_secret_access_key='bench')
+    client.create_bucket(Bucket='receipts')
+    return S3BlobStore('receipts', 'pdfs', client=client), server
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser()
+    p.add_argument('-n', type=int, default=200)
+    p.add_argument('--s3', action='store_true')
+    args = p.parse_args()
+    renderer = CertificateRenderer()
+    receipts = [({'operator': 'bench', 'device': {'model': 'SSD', 'serial': f'SN{i:06d}'}, 'method': 'purge'},
+                 f'{i:064x}', f'job-{i}') for i in range(args.n)]
+    with tempfile.TemporaryDirectory() as root:
+        run('local', LocalBlobStore(root), renderer, receipts)
+    if args.s3:
+        store, server = s3_store()
+        try:
+            run('s3 (moto)', store, renderer, receipts)
+        finally:
+            server.stop()
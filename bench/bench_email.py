@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""Certificate emails/sec against a local SMTP sink: a fresh connection per
+message (the old send_certificate) vs one SMTPPool connection.
+
+USAGE:
+  python3 bench/bench_email.py -n 500 --ehlo-delay 0.02 --attachment static/pdfs/receipt-x.pdf
+"""
+import os, sys, time, smtplib, argparse
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + '/../'))
+from tools.emailer import SMTPPool, build_message
+from bench.smtp_sink import start_sink
+
+def send_unpooled(host, port, msg):
+    # What tools.emailer.send_certificate used to do for every message.
+    with smtplib.SMTP(host, port) as s:
+        s.send_message(msg)
+
+def rate(label, n, fn):
+    t0 = time.perf_counter()
+    fn()
+    dt = time.perf_counter() - t0
+    print(f"{label:<24} {n / dt:10.1f} msg/s  ({dt:.3f}s for {n})")
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser()
+    p.add_argument('-n', type=int, default=500)
+    p.add_argument('--port', type=int, default=8025)
+    p.add_argument('--ehlo-delay', type=float, default=0.0, help='simulated per-connection handshake cost (s)')
+    p.add_argument('--attachment', default=None)
+    args = p.parse_args()
+    controller, handler = start_sink(port=args.port, ehlo_delay=args.ehlo_delay)
+    try:
+        msgs = [build_message('bench@localhost', f'user{i}@example.com', 'Your wipe certificate',
+                              'Attached is your wipe certificate.', args.attachment) for i in range(args.n)]
+        rate('connection per message', args.n, lambda: [send_unpooled('127.0.0.1', args.port, m) for m in msgs])
+        pool = SMTPPool('127.0.0.1', args.port, starttls=False, size=1)
+        rate('pooled connection', args.n, lambda: [pool.send(m) for m in msgs])
+        pool.close()
+        print(f"sink received {handler.count} messages over {handler.sessions} sessions")
+    finally:
+        controller.stop()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""Concurrency check for backend.ids: many processes x threads creating job IDs.
+
+Fails (exit 1) on any duplicate, or if a thread ever sees its IDs go
+backwards. With --mongo, every ID is also inserted as a Receipt so the
+unique job_id index is exercised the way create_job exercises it.
+
+USAGE:
+  python3 bench/bench_job_ids.py --procs 4 --threads 8 -n 2000
+  python3 bench/bench_job_ids.py --procs 4 --threads 8 -n 500 --mongo mongodb://localhost:27017/securewipe_bench
+"""
+import os, sys, time, argparse, threading
+from concurrent.futures import ProcessPoolExecutor
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + '/../'))
+from backend.ids import new_job_id
+
+def worker(threads, n, mongo):
+    if mongo:
+        from mongoengine import connect
+        from verifier.models import Receipt
+        connect(host=mongo)
+    out, errors = [], []
+    def run():
+        ids = [new_job_id() for _ in range(n)]
+        if ids != sorted(ids):
+            errors.append('non-monotonic ids within a thread')
+        if mongo:
+            for job_id in ids:
+                try:
+                    Receipt(job_id=job_id, status='created').save()
+                except Exception as e:
+                    errors.append(f'{job_id}: {e}')
+        out.extend(ids)
+    ts = [threading.Thread(target=run) for _ in range(threads)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    return out, errors
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser()
+    p.add_argument('--procs', type=int, default=4)
+    p.add_argument('--threads', type=int, default=8)
+    p.add_argument('-n', type=int, default=2000, help='ids per thread')
+    p.add_argument('--mongo', default='')
+    args = p.parse_args()
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(args.procs) as ex:
+        results = list(ex.map(worker, [args.threads] * args.procs, [args.n] * args.procs, [args.mongo] * args.procs))
+    dt = time.perf_counter() - t0
+    ids = [i for r, _ in results for i in r]
+    errors = [e for _, errs in results for e in errs]
+    dupes = len(ids) - len(set(ids))
+    print(f"{len(ids)} ids in {dt:.2f}s ({len(ids) / dt:.0f}/s), duplicates={dupes}, errors={len(errors)}")
+    for e in errors[:10]:
+        print('  ', e)
+    sys.exit(1 if dupes or errors else 0)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""Rate limiter overhead at high request rates: memory://, a Redis round
+trip per request (what redis:// does), and the hybrid storage
+(verifier.ratelimit), all against fakeredis with a simulated network
+round trip (--rtt-ms). Also checks how far the hybrid storage overshoots a
+shared quota with several processes, and that it keeps answering with
+Redis down.
+
+redis:// runs a Lua script per hit, which fakeredis cannot execute without
+lupa, so the per-request case is emulated with the same pipeline the
+hybrid sync sends, issued synchronously on every hit (one round trip, like
+the Lua call).
+
+USAGE:
+  pip install fakeredis
+  python3 bench/bench_limiter.py -n 20000 -c 8 --rtt-ms 0.3
+"""
+import os, sys, time, argparse, threading
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + '/../'))
+import fakeredis, redis
+from flask import Flask, jsonify
+from flask_limiter import Limiter
+from limits import parse
+from limits.storage import MemoryStorage
+from limits.strategies import FixedWindowRateLimiter
+from verifier.ratelimit import HybridRedisStorage
+
+class SlowRedis(fakeredis.FakeRedis):
+    """fakeredis with a fixed delay per round trip (command or pipeline)."""
+    rtt = 0.0
+
+    def execute_command(self, *args, **kwargs):
+        time.sleep(self.rtt)
+        return super().execute_command(*args, **kwargs)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        pipe = super().pipeline(transaction, shard_hint)
+        execute = pipe.execute
+        def slow_execute(raise_on_error=True):
+            time.sleep(self.rtt)
+            return execute(raise_on_error)
+        pipe.execute = slow_execute
+        return pipe
+
+class DownRedis(fakeredis.FakeRedis):
+    def pipeline(self, transaction=True, shard_hint=None):
+        pipe = super().pipeline(transaction, shard_hint)
+        def fail(raise_on_error=True):
+            raise redis.ConnectionError('redis is down')
+        pipe.execute = fail
+        return pipe
+
+class RoundTripStorage(HybridRedisStorage):
+    """Stand-in for redis://: every hit waits for Redis."""
+    STORAGE_SCHEME = ['bench-roundtrip+redis']
+
+    def incr(self, key, expiry, amount=1):
+        k = self._key(key)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.set(k, 0, ex=expiry, nx=True)
+        pipe.incrby(k, amount)
+        return pipe.execute()[1]
+
+    def get(self, key):
+        return int(self.client.get(self._key(key)) or 0)
+
+def run(fn, n, concurrency):
+    """Call fn n times over `concurrency` threads; returns (rps, p50 us, p99 us)."""
+    lat = []
+    def worker(count):
+        mine = []
+        for _ in range(count):
+            t0 = time.perf_counter()
+            fn()
+            mine.append(time.perf_counter() - t0)
+        lat.extend(mine)
+    per = n // concurrency
+    threads = [threading.Thread(target=worker, args=(per,)) for _ in range(concurrency)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    dt = time.perf_counter() - t0
+    lat.sort()
+    return len(lat) / dt, lat[len(lat) // 2] * 1e6, lat[int(len(lat) * 0.99)] * 1e6
+
+def report(label, stats):
+    print(f"{label:<34} {stats[0]:10.0f} req/s   p50 {stats[1]:8.1f} us   p99 {stats[2]:8.1f} us")
+
+def storages(server, rtt):
+    """label -> (storage_uri, storage_options)"""
+    SlowRedis.rtt = rtt
+    return {
+        'memory://': ('memory://', {}),
+        'redis (round trip per hit)': ('bench-roundtrip+redis://', {'client': SlowRedis(server=server)}),
+        'hybrid+redis': ('hybrid+redis://', {'client': SlowRedis(server=server)}),
+    }
+
+def flask_client(uri, options):
+    app = Flask(__name__)
+    Limiter(key_func=lambda: 'bench', app=app, default_limits=['100000000 per minute'],
+            storage_uri=uri, storage_options=options)
+
+    @app.route('/ping')
+    def ping():
+        return jsonify({'ok': True})
+    return app.test_client()
+
+def overshoot(server, rtt, processes, limit, rate, seconds):
+    """`processes` hybrid storages share one quota; each fires `rate` hits/s at it. Returns hits admitted."""
+    SlowRedis.rtt = rtt
+    item = parse(f'{limit} per minute')
+    admitted = [0] * processes
+    def proc(i):
+        storage = HybridRedisStorage('hybrid+redis://', client=SlowRedis(server=server), sync_interval=0.25)
+        limiter = FixedWindowRateLimiter(storage)
+        end = time.time() + seconds
+        while time.time() < end:
+            if limiter.hit(item, 'shared'):
+                admitted[i] += 1
+            time.sleep(1.0 / rate)
+        storage.close()
+    threads = [threading.Thread(target=proc, args=(i,)) for i in range(processes)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sum(admitted)
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser()
+    p.add_argument('-n', type=int, default=20000)
+    p.add_argument('-c', '--concurrency', type=int, default=8)
+    p.add_argument('--rtt-ms', type=float, default=0.3, help='simulated Redis round trip')
+    args = p.parse_args()
+    rtt = args.rtt_ms / 1000.0
+    item = parse('100000000 per minute')
+
+    print(f'-- storage.hit, {args.concurrency} threads, {args.rtt_ms} ms Redis RTT')
+    makers = {'memory://': MemoryStorage, 'redis (round trip per hit)': RoundTripStorage,
+              'hybrid+redis': HybridRedisStorage}
+    for label, (uri, options) in storages(fakeredis.FakeServer(), rtt).items():
+        limiter = FixedWindowRateLimiter(makers[label](uri, **options))
+        report(label, run(lambda: limiter.hit(item, 'bench'), args.n, args.concurrency))
+
+    print(f'-- Flask request through flask-limiter, {args.concurrency} threads')
+    n = max(args.concurrency, args.n // 4)
+    for label, (uri, options) in storages(fakeredis.FakeServer(), rtt).items():
+        client = flask_client(uri, options)
+        report(label, run(lambda: client.get('/ping'), n, args.concurrency))
+
+    print('-- Redis down')
+    down = HybridRedisStorage('hybrid+redis://', client=DownRedis())
+    limiter = FixedWindowRateLimiter(down)
+    report('hybrid+redis (unreachable)', run(lambda: limiter.hit(item, 'bench'), args.n, args.concurrency))
+    time.sleep(0.6)
+    print(f'   redis up: {down.up}, hits still decided: {down.get(item.key_for("bench"))}')
+
+    print('-- quota accuracy: 4 processes x 200 hits/s against 300 per minute for 3 s')
+    got = overshoot(fakeredis.FakeServer(), rtt, 4, 300, 200, 3.0)
+    print(f'   admitted {got} (limit 300, overshoot {max(0, got - 300)})')
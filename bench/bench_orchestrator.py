@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Aggregate wipe throughput of agents.orchestrator against simulated devices.
+
+Creates --devices temp files of --size-mb each (or uses the --device paths
+given, e.g. loop devices set up with `losetup -f --show img`), spreads them
+over --buses synthetic controllers and wipes them all through
+tools/wipe_linux.py with dry_run off.
+
+USAGE:
+  python3 bench/bench_orchestrator.py --devices 8 --size-mb 64 --buses 2 --per-bus 2
+  sudo python3 bench/bench_orchestrator.py --device /dev/loop0 --device /dev/loop1
+"""
+import os, sys, time, json, asyncio, argparse, tempfile, shutil
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + '/../'))
+from agents.orchestrator import WipeOrchestrator
+
+def make_files(n, size_mb, directory):
+    chunk = b'\xa5' * (1 << 20)
+    paths = []
+    for i in range(n):
+        path = os.path.join(directory, f'disk{i}.img')
+        with open(path, 'wb') as f:
+            for _ in range(size_mb):
+                f.write(chunk)
+        paths.append(path)
+    return paths
+
+def device_size(path):
+    with open(path, 'rb') as f:
+        return f.seek(0, os.SEEK_END)
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser()
+    p.add_argument('--devices', type=int, default=8)
+    p.add_argument('--size-mb', type=int, default=64)
+    p.add_argument('--device', action='append', default=[], help='real device/loop path (repeatable)')
+    p.add_argument('--buses', type=int, default=2, help='synthetic controllers for temp files (0 = detect)')
+    p.add_argument('--per-bus', type=int, default=2)
+    p.add_argument('--max-parallel', type=int, default=16)
+    p.add_argument('--passes', type=int, default=1)
+    p.add_argument('--params', default='{}', help='extra JSON params for the wipe tool')
+    args = p.parse_args()
+    tmp = None
+    if args.device:
+        paths = args.device
+    else:
+        tmp = tempfile.mkdtemp(prefix='bench_orch_')
+        paths = make_files(args.devices, args.size_mb, tmp)
+    extra = json.loads(args.params)
+    devices = []
+    for i, path in enumerate(paths):
+        d = {'path': path, 'params': dict(extra, device=path, passes=args.passes, dry_run=False)}
+        if tmp and args.buses:
+            d['bus'] = f'bus{i % args.buses}'
+        devices.append(d)
+    done = []
+    orch = WipeOrchestrator(args.max_parallel, args.per_bus,
+                            on_result=lambda d, r: done.append((time.perf_counter(), d['path'], r['status'])))
+    total = sum(device_size(x) for x in paths) * args.passes
+    t0 = time.perf_counter()
+    results = asyncio.run(orch.run(devices))
+    dt = time.perf_counter() - t0
+    for t, path, status in done:
+        print(f'  {t - t0:7.2f}s  {status:<8} {path}')
+    ok = sum(r.get('status') == 'SUCCESS' for r in results)
+    print(f'{ok}/{len(results)} ok, {total / (1 << 20):.0f} MiB written in {dt:.2f}s = {total / (1 << 20) / dt:.1f} MiB/s aggregate')
+    if tmp:
+        shutil.rmtree(tmp)
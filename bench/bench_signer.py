@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""Signatures/sec: per-call PEM load (old path) vs cached Signer vs sign_many.
+
+USAGE:
+  python3 bench/bench_signer.py --key private_prod.pem -n 500
+"""
+import os, sys, time, argparse
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + '/../'))
+from tools.signer import Signer, load_private_key, canonical_bytes, _sign_bytes
+
+def sign_uncached(path, payload):
+    # What tools.signer.sign_payload used to do on every call.
+    return _sign_bytes(load_private_key(path), canonical_bytes(payload))
+
+def rate(label, n, fn):
+    t0 = time.perf_counter()
+    fn()
+    dt = time.perf_counter() - t0
+    print(f"{label:<28} {n / dt:10.1f} sig/s  ({dt:.3f}s for {n})")
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser()
+    p.add_argument('--key', default='private_prod.pem')
+    p.add_argument('-n', type=int, default=500)
+    p.add_argument('--workers', type=int, default=os.cpu_count())
+    args = p.parse_args()
+    payloads = [{'job_id': f'job-{i}', 'status': 'done', 'device': {'serial': f'SN{i:06d}'}} for i in range(args.n)]
+    signer = Signer(args.key, workers=args.workers)
+    signer.sign(payloads[0])  # warm the key cache
+    rate('uncached (load per call)', args.n, lambda: [sign_uncached(args.key, p) for p in payloads])
+    rate('Signer.sign', args.n, lambda: [signer.sign(p) for p in payloads])
+    signer.sign_many(payloads[:signer.min_batch])  # spin up the pool outside the timing
+    rate(f'Signer.sign_many ({args.workers}w)', args.n, lambda: signer.sign_many(payloads))
+    signer.close()
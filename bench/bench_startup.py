@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""Boot time of the devapi and the verifier, each in a fresh interpreter:
+seconds to import the service module, to return from create_app(), and
+until /readyz first answers 200 (all required dependencies warm). Also
+lists the slowest imports (python -X importtime) to show where import
+time goes.
+
+Mongo is mongomock and Redis is fakeredis unless --mongo-url is given, so
+the numbers are Python start-up cost, not network. To see what an
+unreachable database costs, point --mongo-url at a dead address: import
+and create_app should not move, /readyz stays 503.
+
+USAGE:
+  pip install mongomock fakeredis
+  python3 bench/bench_startup.py -n 5
+  python3 bench/bench_startup.py --service devapi --mongo-url mongodb://10.255.255.1/x --out boot.json
+"""
+import os, sys, json, time, argparse, subprocess, statistics
+REPO_ROOT = os.path.abspath(os.path.dirname(__file__) + '/../')
+
+SERVICES = {'devapi': 'backend.dev_api_prod', 'verifier': 'verifier.app_prod'}
+
+# Runs in the child. Stand-ins are installed before the service module is
+# imported, the same way bench/loadtest.py does it; they load mongoengine and
+# redis early, so phases are timed from before the stand-ins and their own
+# cost is shown separately ('standins', zero with --mongo-url).
+CHILD = r'''
+import os, sys, json, time
+sys.path.insert(0, {root!r})
+t0 = time.perf_counter()
+if not os.environ.get('MONGO_URL'):
+    import mongoengine, mongomock, redis, fakeredis
+    real_register = mongoengine.register_connection
+    def register_connection(alias='default', db=None, **kwargs):
+        return real_register(alias, db='bench', host='mongodb://localhost', mongo_client_class=mongomock.MongoClient)
+    mongoengine.register_connection = register_connection
+    server = fakeredis.FakeServer()
+    redis.from_url = lambda url, **kwargs: fakeredis.FakeRedis(server=server)
+t1 = time.perf_counter()
+import importlib
+mod = importlib.import_module({module!r})
+t2 = time.perf_counter()
+client = mod.create_app().test_client()
+t3 = time.perf_counter()
+ready, status = None, None
+while time.perf_counter() - t3 < {ready_timeout}:
+    r = client.get('/readyz')
+    status = r.get_json()
+    if r.status_code == 200:
+        ready = time.perf_counter() - t0
+        break
+    time.sleep(0.005)
+print(json.dumps({{'import': t2 - t0, 'create_app': t3 - t0, 'ready': ready, 'standins': t1 - t0, 'readyz': status}}))
+'''
+
+def env_for(args):
+    env = dict(os.environ, JWT_SECRET='bench-' + 'x' * 32, OUTBOX_WORKERS='0', PIPELINE_WORKERS='0',
+               SIGNING_KEY_PATH=os.path.join(REPO_ROOT, 'private_prod.pem'),
+               VERIFIER_PUBKEY_PATH=os.path.join(REPO_ROOT, 'public.pem'), VERIFIER_API_KEY='bench-key',
+               RATE_LIMIT_STORAGE='redis://bench/0', VERIFIER_RATE_LIMIT_STORAGE='redis://bench/0',
+               MONGO_SERVER_SELECTION_TIMEOUT_MS=str(int(args.ready_timeout * 1000)))
+    env.pop('MONGO_URL', None)
+    if args.mongo_url:
+        env['MONGO_URL'] = env['MONGO_URI'] = args.mongo_url
+    return env
+
+def boot_once(module, args):
+    code = CHILD.format(root=REPO_ROOT, module=module, ready_timeout=args.ready_timeout)
+    out = subprocess.run([sys.executable, '-c', code], env=env_for(args), capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def slowest_imports(module, args, top):
+    """[(cumulative ms, module)] of the service import, outermost packages first."""
+    code = f'import sys; sys.path.insert(0, {REPO_ROOT!r}); import {module}'
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], env=env_for(args),
+                         capture_output=True, text=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth <= 1:  # the service module itself and what it imports directly
+            rows.append((int(parts[1]) / 1000.0, name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+def fmt(values):
+    values = [v for v in values if v is not None]
+    if not values:
+        return '     never'
+    return f'{statistics.median(values) * 1000:8.1f} ms (max {max(values) * 1000:.1f})'
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser()
+    p.add_argument('-n', type=int, default=5, help='fresh processes per service')
+    p.add_argument('--service', choices=sorted(SERVICES), action='append')
+    p.add_argument('--mongo-url', default='', help='real (or unreachable) MongoDB instead of mongomock')
+    p.add_argument('--ready-timeout', type=float, default=10.0)
+    p.add_argument('--top', type=int, default=12, help='slowest imports to list')
+    p.add_argument('--out', help='write the results as JSON')
+    args = p.parse_args()
+
+    results = {}
+    for name in args.service or sorted(SERVICES):
+        module = SERVICES[name]
+        runs = [boot_once(module, args) for _ in range(args.n)]
+        results[name] = {'runs': runs, 'imports': slowest_imports(module, args, args.top)}
+        print(f'-- {name} ({module}), {args.n} fresh processes, medians')
+        for phase in ('standins', 'import', 'create_app', 'ready'):
+            print(f'   {phase:<11} {fmt([r[phase] for r in runs])}')
+        checks = (runs[-1]['readyz'] or {}).get('checks', {})
+        print('   checks     ' + ', '.join(f"{c} {'ok' if r['ok'] else 'FAIL'} {r['ms']:.0f} ms" for c, r in checks.items()))
+        print('   slowest imports (cumulative):')
+        for ms, mod in results[name]['imports']:
+            print(f'     {ms:8.1f} ms  {mod}')
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'at': time.time(), 'mongo_url': args.mongo_url or 'mongomock', 'results': results}, f, indent=2)
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""End-to-end load test: login -> create_job -> report -> (pipeline) -> send
+-> verifier PDF download -> verify, at a given concurrency.
+
+By default both services run in this process on threaded werkzeug servers,
+backed by local stand-ins: mongomock (or --mongo-url for a real mongod),
+fakeredis for the pipeline queue and an aiosmtpd sink for the outbox. With
+--devapi-url / --verifier-url an already running deployment is driven instead.
+
+Reports requests/sec and p50/p95/p99 latency per endpoint and writes the
+numbers as JSON, so runs on two commits can be compared:
+
+  python3 bench/loadtest.py -c 8 -n 200 --out /tmp/before.json
+  python3 bench/loadtest.py -c 8 -n 200 --out /tmp/after.json --compare /tmp/before.json
+"""
+import os, sys, json, time, socket, platform, tempfile, argparse, threading, subprocess
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, REPO_ROOT)
+import requests
+
+def percentile(sorted_values, q):
+    # nearest-rank
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, int(round(q / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, name, seconds, status, ok):
+        with self._lock:
+            self.samples[name].append(seconds)
+            self.statuses[name][status] += 1
+            if not ok:
+                self.errors[name] += 1
+
+    def summary(self, wall):
+        out = {}
+        for name, values in self.samples.items():
+            values = sorted(values)
+            ms = lambda v: round(v * 1000, 3) if v is not None else None
+            out[name] = {
+                'count': len(values),
+                'errors': self.errors[name],
+                'statuses': {str(k): v for k, v in self.statuses[name].items()},
+                'rps': round(len(values) / wall, 2) if wall else None,
+                'mean_ms': ms(sum(values) / len(values)),
+                'p50_ms': ms(percentile(values, 50)),
+                'p95_ms': ms(percentile(values, 95)),
+                'p99_ms': ms(percentile(values, 99)),
+                'max_ms': ms(values[-1]),
+            }
+        return out
+
+class VirtualUser:
+    def __init__(self, devapi, verifier, api_key, pin, recorder, pipeline_timeout):
+        self.devapi = devapi.rstrip('/')
+        self.verifier = verifier.rstrip('/')
+        self.api_key = api_key
+        self.pin = pin
+        self.rec = recorder
+        self.pipeline_timeout = pipeline_timeout
+        self.session = requests.Session()
+
+    def call(self, name, method, url, expect, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            r = self.session.request(method, url, timeout=30, **kwargs)
+        except requests.RequestException:
+            self.rec.record(name, time.perf_counter() - t0, 'exception', False)
+            raise
+        self.rec.record(name, time.perf_counter() - t0, r.status_code, r.status_code in expect)
+        if r.status_code not in expect:
+            raise RuntimeError(f'{name}: HTTP {r.status_code} {r.text[:200]}')
+        return r
+
+    def iteration(self, i):
+        r = self.call('login', 'POST', f'{self.devapi}/api/login', (200,), json={'pin': self.pin})
+        auth = {'Authorization': f"Bearer {r.json()['token']}"}
+        r = self.call('create_job', 'POST', f'{self.devapi}/api/create_job', (201,), headers=auth,
+                      json={'confirm': True, 'email': f'user{i}@example.com', 'operator': 'loadtest',
+                            'device': {'model': 'LT-SSD', 'serial': f'LT{i:08d}', 'platform': 'linux'}})
+        job_id = r.json()['job_id']
+        report = {'job_id': job_id, 'status': 'success', 'operator': 'loadtest', 'email': f'user{i}@example.com',
+                  'device': {'model': 'LT-SSD', 'serial': f'LT{i:08d}'},
+                  'evidence': [{'cmd': 'wipe --passes 1', 'out': 'ok ' * 40}]}
+        self.call('report', 'POST', f'{self.devapi}/api/report', (200, 202), headers=auth, json=report)
+        # The pipeline signs / renders / queues email off the request path; time until it is done.
+        t0 = time.perf_counter()
+        while True:
+            s = self.call('status', 'GET', f'{self.devapi}/api/jobs/{job_id}/status', (200,), headers=auth).json()
+            if s.get('status') == 'emailed' or s.get('error'):
+                break
+            if time.perf_counter() - t0 > self.pipeline_timeout:
+                self.rec.record('pipeline', time.perf_counter() - t0, 'timeout', False)
+                raise RuntimeError(f'pipeline did not finish {job_id}')
+            time.sleep(0.02)
+        self.rec.record('pipeline', time.perf_counter() - t0, s.get('status'), not s.get('error'))
+        self.call('send', 'POST', f'{self.devapi}/api/send', (200, 202), headers=auth, json={'job_id': job_id})
+        self.call('pdf_download', 'GET', f'{self.verifier}/receipts/{job_id}.pdf', (200,),
+                  headers={'X-API-KEY': self.api_key})
+        r = self.call('verify', 'GET', f'{self.verifier}/receipts/verify', (200,), params={'job_id': job_id})
+        if not r.json().get('valid'):
+            self.rec.record('verify_invalid', 0.0, 'invalid', False)
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def start_local_stack(args, workdir):
+    """Import both services against local stand-ins and serve them; returns (devapi_url, verifier_url, stop)."""
+    from werkzeug.serving import make_server
+    from bench.smtp_sink import start_sink
+    smtp_port = _free_port()
+    sink, sink_handler = start_sink(port=smtp_port)
+    os.environ.update({
+        'SIGNING_KEY_PATH': os.path.join(REPO_ROOT, 'private_prod.pem'),
+        'VERIFIER_PUBKEY_PATH': os.path.join(REPO_ROOT, 'public.pem'),
+        'VERIFIER_API_KEY': args.api_key,
+        'OPERATOR_PIN': args.pin,
+        'RECEIPT_STORE': os.path.join(workdir, 'pdfs'),
+        'VERIFIER_PDF_ROOT': os.path.join(workdir, 'pdfs'),
+        'SMTP_SERVER': '127.0.0.1', 'SMTP_PORT': str(smtp_port), 'SMTP_STARTTLS': '0', 'EMAIL_FROM': 'loadtest@localhost',
+        'PIPELINE_WORKERS': str(args.pipeline_workers),
+        'PIPELINE_QUEUE': 'redis://fakeredis/0',
+        'RATE_LIMIT_STORAGE': '', 'VERIFIER_RATE_LIMIT_STORAGE': 'memory://',
+        'JWT_SECRET': 'loadtest-' + 'x' * 32,
+    })
+    import redis, fakeredis
+    server = fakeredis.FakeServer()
+    redis.from_url = lambda url, **kwargs: fakeredis.FakeRedis(server=server)
+    if args.mongo_url:
+        os.environ['MONGO_URL'] = os.environ['MONGO_URI'] = args.mongo_url
+    else:
+        import mongoengine, mongomock
+        real_register = mongoengine.register_connection
+
+        def register_connection(alias='default', db=None, **kwargs):
+            return real_register(alias, db='loadtest', host='mongodb://localhost',
+                                 mongo_client_class=mongomock.MongoClient)
+        mongoengine.register_connection = register_connection
+    import backend.dev_api_prod as devapi
+    import verifier.app_prod as verifier
+    devapi.create_app()
+    verifier.create_app()
+    if not args.with_limits:
+        devapi.limiter.enabled = False
+        verifier.limiter.enabled = False
+    servers = []
+    for app in (devapi.app, verifier.app):
+        srv = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=srv.serve_forever, daemon=True).start()
+        servers.append(srv)
+
+    def stop():
+        for srv in servers:
+            srv.shutdown()
+        devapi.pipeline.stop()
+        devapi.outbox.stop()
+        sink.stop()
+        return sink_handler.count
+    return (f'http://127.0.0.1:{servers[0].server_port}', f'http://127.0.0.1:{servers[1].server_port}', stop)
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_table(endpoints):
+    print(f"{'endpoint':<14} {'count':>6} {'err':>4} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, e in endpoints.items():
+        print(f"{name:<14} {e['count']:>6} {e['errors']:>4} {e['rps']:>8} {e['p50_ms']:>9} {e['p95_ms']:>9} "
+              f"{e['p99_ms']:>9} {e['max_ms']:>9}")
+
+def print_comparison(current, baseline):
+    print(f"\n{'endpoint':<14} {'p50 before':>11} {'after':>9} {'p95 before':>11} {'after':>9} {'change':>8}")
+    for name, e in current['endpoints'].items():
+        b = baseline.get('endpoints', {}).get(name)
+        if not b:
+            continue
+        change = (e['p95_ms'] - b['p95_ms']) / b['p95_ms'] * 100 if b['p95_ms'] else 0.0
+        print(f"{name:<14} {b['p50_ms']:>11} {e['p50_ms']:>9} {b['p95_ms']:>11} {e['p95_ms']:>9} {change:>+7.1f}%")
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser()
+    p.add_argument('-c', '--concurrency', type=int, default=4)
+    p.add_argument('-n', '--iterations', type=int, default=50, help='scenario runs in total')
+    p.add_argument('--warmup', type=int, default=2, help='runs before measuring (not recorded)')
+    p.add_argument('--devapi-url', default=None, help='drive a running devapi instead of the local stack')
+    p.add_argument('--verifier-url', default=None)
+    p.add_argument('--mongo-url', default=None, help='real mongod for the local stack instead of mongomock')
+    p.add_argument('--pipeline-workers', type=int, default=2)
+    p.add_argument('--pipeline-timeout', type=float, default=30.0)
+    p.add_argument('--with-limits', action='store_true', help='keep the rate limiters on (local stack)')
+    p.add_argument('--api-key', default=os.environ.get('VERIFIER_API_KEY', 'loadtest-key'))
+    p.add_argument('--pin', default=os.environ.get('OPERATOR_PIN', '1234'))
+    p.add_argument('--out', default=None, help='write results JSON here')
+    p.add_argument('--compare', default=None, help='baseline results JSON to compare against')
+    args = p.parse_args()
+
+    stop = None
+    workdir = tempfile.mkdtemp(prefix='loadtest-')
+    if args.devapi_url:
+        devapi_url, verifier_url = args.devapi_url, args.verifier_url or args.devapi_url
+    else:
+        import logging
+        logging.disable(logging.INFO)  # per-request service logging would dominate the run
+        devapi_url, verifier_url, stop = start_local_stack(args, workdir)
+
+    warm = Recorder()
+    for i in range(args.warmup):
+        VirtualUser(devapi_url, verifier_url, args.api_key, args.pin, warm, args.pipeline_timeout).iteration(-1 - i)
+
+    rec = Recorder()
+    users = threading.local()
+    failures = []
+
+    def run(i):
+        if not hasattr(users, 'vu'):
+            users.vu = VirtualUser(devapi_url, verifier_url, args.api_key, args.pin, rec, args.pipeline_timeout)
+        try:
+            users.vu.iteration(i)
+        except Exception as e:
+            failures.append(str(e))
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(run, range(args.iterations)))
+    wall = time.perf_counter() - t0
+    emails = stop() if stop else None
+
+    result = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': platform.python_version(),
+            'host': platform.node(),
+            'cpus': os.cpu_count(),
+            'concurrency': args.concurrency,
+            'iterations': args.iterations,
+            'stack': 'external' if args.devapi_url else ('mongod' if args.mongo_url else 'mongomock') + '+fakeredis+aiosmtpd',
+            'rate_limits': bool(args.with_limits or args.devapi_url),
+        },
+        'scenario': {
+            'seconds': round(wall, 3),
+            'iterations_per_sec': round(args.iterations / wall, 2),
+            'failed_iterations': len(failures),
+            'emails_delivered': emails,
+        },
+        'endpoints': rec.summary(wall),
+    }
+    print_table(result['endpoints'])
+    print(f"\n{args.iterations} iterations in {wall:.2f}s ({result['scenario']['iterations_per_sec']} it/s), "
+          f"{len(failures)} failed" + (f", {emails} emails delivered" if emails is not None else ''))
+    for f in failures[:5]:
+        print('  failure:', f)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(result, f, indent=2)
+        print('wrote', args.out)
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(result, json.load(f))
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""Local SMTP sink (aiosmtpd) that accepts and counts every message.
+
+Used by bench_email.py and handy for pointing a dev devapi at:
+  python3 bench/smtp_sink.py --port 8025
+  SMTP_SERVER=localhost SMTP_PORT=8025 SMTP_STARTTLS=0 python3 backend/dev_api_prod.py
+
+--ehlo-delay adds a pause to every EHLO, standing in for the TLS handshake
+and AUTH round trips a real relay costs per connection.
+"""
+import time, asyncio, argparse, threading
+from aiosmtpd.controller import Controller
+
+class CountingHandler:
+    def __init__(self, ehlo_delay=0.0, keep=False):
+        self.ehlo_delay = ehlo_delay
+        self.keep = keep
+        self.count = 0
+        self.sessions = 0
+        self.messages = []
+        self._lock = threading.Lock()
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        if self.ehlo_delay:
+            await asyncio.sleep(self.ehlo_delay)
+        with self._lock:
+            self.sessions += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        with self._lock:
+            self.count += 1
+            if self.keep:
+                self.messages.append(envelope.content)
+        return '250 OK'
+
+def start_sink(host='127.0.0.1', port=8025, ehlo_delay=0.0, keep=False):
+    """Start a sink in a background thread; returns (controller, handler). Call controller.stop() when done."""
+    handler = CountingHandler(ehlo_delay, keep)
+    controller = Controller(handler, hostname=host, port=port, server_kwargs={'data_size_limit': 0})
+    controller.start()
+    return controller, handler
+
+if __name__ == '__main__':
+    p = argparse.ArgumentParser()
+    p.add_argument('--host', default='127.0.0.1')
+    p.add_argument('--port', type=int, default=8025)
+    p.add_argument('--ehlo-delay', type=float, default=0.0)
+    args = p.parse_args()
+    controller, handler = start_sink(args.host, args.port, args.ehlo_delay)
+    print(f'SMTP sink on {args.host}:{args.port}', flush=True)
+    try:
+        while True:
+            time.sleep(5)
+            print(f'{handler.count} messages over {handler.sessions} sessions', flush=True)
+    except KeyboardInterrupt:
+        controller.stop()
@@ -0,0 +1,32 @@
+"""Shared fixtures. Mongo is mongomock and Redis is fakeredis, the same
+stand-ins bench/loadtest.py uses, so the suite needs no services:
+
+  pip install pytest mongomock fakeredis aiosmtpd
+  python -m pytest -q
+"""
+import os, sys
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__) + '/../'))
+import mongoengine, mongomock, pytest
+
+ROOT = os.path.abspath(os.path.dirname(__file__) + '/../')
+# Service configuration, read when backend.dev_api_prod / verifier.app_prod are imported
+for key, value in {
+    'JWT_SECRET': 'test-' + 'x' * 32,
+    'RATE_LIMIT_STORAGE': '',
+    'VERIFIER_RATE_LIMIT_STORAGE': 'memory://',
+    'VERIFIER_PUBKEY_PATH': os.path.join(ROOT, 'public.pem'),
+    'VERIFIER_API_KEY': 'test-key',
+}.items():
+    os.environ.setdefault(key, value)
+
+# Before any service module registers its own connection: the first client wins.
+mongoengine.connect('securewipe_test', host='mongodb://localhost', mongo_client_class=mongomock.MongoClient,
+                    uuidRepresentation='standard')
+
+@pytest.fixture
+def db():
+    """The test database, emptied before each test."""
+    database = mongoengine.get_db()
+    for name in database.list_collection_names():
+        database.drop_collection(name)
+    return database
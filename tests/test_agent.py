@@ -0,0 +1,96 @@
+import time, asyncio, threading
+import pytest
+import agents.agent as agent
+import backend.dev_api_prod as devapi
+from agents.evidence import EvidenceSpool
+from verifier.models import Receipt
+from test_spool import DevapiSession
+
+class FakeOrchestrator:
+    def __init__(self):
+        self.devices = []
+
+    async def wipe_one(self, device):
+        self.devices.append(device)
+        return {'status': 'DRY-RUN' if device['params']['dry_run'] else 'SUCCESS', 'evidence': []}
+
+@pytest.fixture
+def orch(monkeypatch):
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    fake = FakeOrchestrator()
+    monkeypatch.setattr(agent, '_orch_loop', loop)
+    monkeypatch.setattr(agent, 'orchestrator', lambda: fake)
+    yield fake
+    loop.call_soon_threadsafe(loop.stop)
+
+def job(**params):
+    return {'job_id': 'job-1', 'device': {'platform': 'linux'}, 'params': dict(device='/dev/sdz', **params)}
+
+def test_server_cannot_start_a_destructive_wipe_on_its_own(orch, monkeypatch):
+    monkeypatch.setattr(agent, 'ALLOW_DESTRUCTIVE', False)
+    report = agent.perform_local_action(job(confirm_local=True, dry_run=False))
+    assert report['status'] == 'refused' and 'allow-destructive' in report['error']
+    assert orch.devices == []
+
+def test_destructive_wipe_needs_both_the_job_and_the_host(orch, monkeypatch):
+    monkeypatch.setattr(agent, 'ALLOW_DESTRUCTIVE', True)
+    assert agent.perform_local_action(job(confirm_local=True))['status'] == 'success'
+    assert agent.perform_local_action(job(dry_run=False))['status'] == 'dry-run'
+    assert [d['params']['dry_run'] for d in orch.devices] == [False, True]
+
+class EvidenceOrchestrator(FakeOrchestrator):
+    """Finishes at once, leaving a log that takes a while to upload."""
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+
+    async def wipe_one(self, device):
+        log = EvidenceSpool(self.path)
+        for i in range(3000):
+            log.write(f'pass 1 block {i} {i * 7919 % 10007:05d} ok')
+        return {'status': 'DRY-RUN', 'evidence': [], 'evidence_spool': log.close()}
+
+def test_lease_is_held_until_the_report_after_a_slow_evidence_upload_is_delivered(db, tmp_path, monkeypatch):
+    devapi.limiter.enabled = False
+    monkeypatch.setattr(devapi, 'EVIDENCE_CHUNK_SIZE', 4096)
+    monkeypatch.setattr(devapi.dispatcher, 'lease_seconds', 0.5)
+    Receipt(job_id='job-1', status='created', device={'platform': 'linux'}).save()
+    session = DevapiSession(devapi.app.test_client())
+    claimed = session.post('http://devapi/api/agent/claim', json={'agent_id': 'a1', 'wait': 0}).json()
+
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    fake = EvidenceOrchestrator(str(tmp_path / 'job-1.log.gz'))
+    put = session.put
+    def slow_put(url, **kwargs):
+        time.sleep(0.3)  # the upload as a whole outlasts the lease several times
+        return put(url, **kwargs)
+    session.put = slow_put
+    for name, value in {'session': session, 'API_BASE': 'http://devapi', 'AGENT_ID': 'a1', 'HEARTBEAT_INTERVAL': 0.1,
+                        'SPOOL_PATH': str(tmp_path / 'spool.db'), '_spool': None, '_uploader': None,
+                        '_delivering': {}, '_orch_loop': loop, 'orchestrator': lambda: fake}.items():
+        monkeypatch.setattr(agent, name, value)
+    try:
+        agent.run_job(claimed)
+        others = []
+        deadline = time.monotonic() + 20
+        while Receipt.objects(job_id='job-1').first().status == 'claimed' and time.monotonic() < deadline:
+            others.append(session.post('http://devapi/api/agent/claim', json={'agent_id': 'a2', 'wait': 0}).status_code)
+            time.sleep(0.1)
+        job = Receipt.objects(job_id='job-1').first()
+        assert job.status == 'reported' and job.evidence_id
+        assert len(others) > 10 and set(others) == {204}  # never handed to another agent
+        while agent._delivering and time.monotonic() < deadline:  # the uploader settles after the server answers
+            time.sleep(0.02)
+        assert agent._delivering == {}  # heartbeats stopped once the report was taken
+    finally:
+        agent._uploader.stop()
+        agent._spool.close()
+        loop.call_soon_threadsafe(loop.stop)
+
+def test_real_wipes_have_no_time_limit_by_default(orch, monkeypatch):
+    monkeypatch.setattr(agent, 'ALLOW_DESTRUCTIVE', True)
+    agent.perform_local_action(job(confirm_local=True))
+    agent.perform_local_action(job())
+    assert [d['timeout'] for d in orch.devices] == [0, 600]
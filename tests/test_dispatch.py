@@ -0,0 +1,60 @@
+import time
+import pytest
+import backend.dev_api_prod as devapi
+from verifier.models import Receipt
+
+@pytest.fixture
+def client(db, monkeypatch):
+    devapi.limiter.enabled = False
+    monkeypatch.setattr(devapi, 'SSE_KEEPALIVE_SECONDS', 0.05)
+    return devapi.app.test_client()
+
+@pytest.fixture
+def agent_headers():
+    return {'Authorization': 'Bearer ' + devapi.create_jwt('agent')}
+
+def test_agent_channel_is_capped_per_process(client, agent_headers, monkeypatch):
+    monkeypatch.setattr(devapi, 'AGENT_CHANNEL_MAX', 1)
+    first = client.get('/api/agent/stream?agent_id=a1', headers=agent_headers, buffered=False)
+    assert first.status_code == 200
+    full = client.get('/api/agent/stream?agent_id=a2', headers=agent_headers, buffered=False)
+    assert full.status_code == 503 and full.headers['Retry-After']
+    # long-polls look once without waiting and are told to come back too
+    poll = client.post('/api/agent/claim', json={'agent_id': 'a3', 'wait': 30}, headers=agent_headers)
+    assert poll.status_code == 503
+    first.close()
+    assert devapi._agent_conns == 0
+    assert client.post('/api/agent/claim', json={'agent_id': 'a3', 'wait': 0}, headers=agent_headers).status_code == 204
+
+def test_job_pushed_to_a_dead_stream_is_released(client, agent_headers):
+    Receipt(job_id='job-1', status='created', device={'platform': 'linux'}).save()
+    resp = client.get('/api/agent/stream?agent_id=gone', headers=agent_headers, buffered=False)
+    body = resp.response
+    assert next(body).startswith(b': connected')
+    assert b'event: job' in next(body)
+    assert Receipt.objects(job_id='job-1').first().status == 'claimed'
+    resp.close()  # what the server does when writing the event fails
+    job = Receipt.objects(job_id='job-1').first()
+    assert (job.status, job.agent_id) == ('created', None)
+    claimed = client.post('/api/agent/claim', json={'agent_id': 'other', 'wait': 0}, headers=agent_headers)
+    assert claimed.json['job_id'] == 'job-1'
+
+def test_dispatcher_keeps_retrying_redis_until_it_subscribes(monkeypatch):
+    import redis, fakeredis
+    from backend.dispatch import JobDispatcher
+    server, up = fakeredis.FakeServer(), []
+    def from_url(uri, **kwargs):
+        if not up:
+            raise redis.ConnectionError('redis down')
+        return fakeredis.FakeRedis(server=server)
+    monkeypatch.setattr(redis, 'from_url', from_url)
+    dispatcher = JobDispatcher(redis_uri='redis://redis/0', retry_seconds=0.05)
+    with pytest.raises(redis.ConnectionError):
+        dispatcher.start()
+    assert dispatcher._redis is None
+    up.append(1)
+    deadline = time.monotonic() + 5
+    while dispatcher._redis is None and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert dispatcher._redis is not None
+    dispatcher.start()  # started: a no-op from now on
@@ -0,0 +1,85 @@
+import io, gzip, hashlib, datetime
+import pytest
+from backend import evidence
+from verifier.models import EvidenceUpload
+import agents.evidence as agent_evidence
+
+CHUNK = 16
+
+def open_upload():
+    return evidence.open_upload('job-1', 'gzip', CHUNK)
+
+def put(upload_id, offset, data):
+    return evidence.write_chunk(evidence.get_upload(upload_id), offset, io.BytesIO(data), 1 << 20)
+
+def stored(upload_id):
+    return [c['data'] for c in evidence._chunks().find({'files_id': evidence.ObjectId(upload_id)}, sort=[('n', 1)])]
+
+def test_duplicate_put_never_replaces_a_counted_chunk(db):
+    upload = open_upload()
+    assert put(upload.upload_id, 0, b'a' * CHUNK) == CHUNK
+    stale = EvidenceUpload.objects(upload_id=upload.upload_id).first()
+    stale.received = 0  # a second request that read the upload before the first advanced it
+    with pytest.raises(evidence.EvidenceError) as e:
+        evidence.write_chunk(stale, 0, io.BytesIO(b'b' * CHUNK), 1 << 20)
+    assert (e.value.status, e.value.extra['offset']) == (409, CHUNK)
+    assert stored(upload.upload_id) == [b'a' * CHUNK]
+
+def test_only_the_claiming_request_writes_and_a_dead_claim_expires(db):
+    upload = open_upload()
+    coll = EvidenceUpload._get_collection()
+    later = datetime.datetime.utcnow() + datetime.timedelta(minutes=1)
+    coll.update_one({'_id': upload.pk}, {'$set': {'writer': 'other', 'writer_until': later}})
+    with pytest.raises(evidence.EvidenceError):
+        put(upload.upload_id, 0, b'b' * CHUNK)
+    assert stored(upload.upload_id) == []
+
+    earlier = datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+    coll.update_one({'_id': upload.pk}, {'$set': {'writer_until': earlier}})
+    assert put(upload.upload_id, 0, b'b' * CHUNK) == CHUNK
+    assert stored(upload.upload_id) == [b'b' * CHUNK]
+    assert coll.find_one({'_id': upload.pk}).get('writer') is None
+
+def test_abandoned_open_uploads_are_expired_with_their_chunks(db):
+    old, fresh, done = open_upload(), open_upload(), open_upload()
+    for upload in (old, fresh, done):
+        put(upload.upload_id, 0, b'c' * CHUNK)
+    long_ago = datetime.datetime.utcnow() - datetime.timedelta(days=2)
+    EvidenceUpload.objects(upload_id__in=[old.upload_id, done.upload_id]).update(set__updated_at=long_ago)
+    EvidenceUpload.objects(upload_id=done.upload_id).update(set__status='complete')
+
+    assert evidence.expire_uploads(24 * 3600) == [old.upload_id]
+    assert EvidenceUpload.objects(upload_id=old.upload_id).first() is None and stored(old.upload_id) == []
+    assert stored(fresh.upload_id) and stored(done.upload_id)
+
+class Response:
+    def __init__(self, status_code, body):
+        self.status_code, self.body, self.headers = status_code, body, {}
+
+    def json(self):
+        return self.body
+
+    def raise_for_status(self):
+        pass
+
+class StuckServer:
+    """Answers every chunk with 409 and the same offset."""
+    def __init__(self):
+        self.puts = 0
+
+    def post(self, url, **kwargs):
+        return Response(201, {'upload_id': 'u1', 'chunk_size': CHUNK, 'offset': 0})
+
+    def put(self, url, **kwargs):
+        self.puts += 1
+        return Response(409, {'error': 'offset_mismatch', 'offset': 0})
+
+def test_agent_gives_up_on_a_server_that_keeps_answering_409(tmp_path, monkeypatch):
+    monkeypatch.setattr(agent_evidence, '_wait', lambda r, backoff: None)
+    path = tmp_path / 'job-1.log.gz'
+    path.write_bytes(gzip.compress(b'line\n' * 100))
+    spool = {'path': str(path), 'sha256': hashlib.sha256(b'line\n' * 100).hexdigest(), 'size': 500}
+    server = StuckServer()
+    with pytest.raises(RuntimeError):
+        agent_evidence.upload_evidence(server, 'http://devapi', 'job-1', spool, attempts=4)
+    assert server.puts == 4
@@ -0,0 +1,101 @@
+"""Job ids handed out by create_job and /api/jobs:batch stay unique under
+concurrent requests, across threads and across forked processes (the way
+gunicorn workers share one imported generator)."""
+import multiprocessing, threading
+import pytest
+import backend.dev_api_prod as devapi
+from backend import ids
+from verifier.models import Receipt
+
+THREADS = 8
+PER_THREAD = 10  # single creates per thread; each thread also posts one batch of BATCH items
+BATCH = 20
+
+def job(n):
+    return {'confirm': True, 'email': f'user{n}@example.com', 'device': {'platform': 'linux'}}
+
+def create_jobs():
+    """Hammer both endpoints from THREADS threads; returns (job ids, errors)."""
+    devapi.limiter.enabled = False
+    headers = {'Authorization': 'Bearer ' + devapi.create_jwt('operator')}
+    ids, errors = [], []
+    lock = threading.Lock()
+
+    def run(t):
+        client = devapi.app.test_client()
+        mine = []
+        for n in range(PER_THREAD):
+            r = client.post('/api/create_job', json=job(n), headers=headers)
+            if r.status_code != 201:
+                errors.append(r.get_json())
+                continue
+            mine.append(r.json['job_id'])
+        r = client.post('/api/jobs:batch', json={'items': [job(n) for n in range(BATCH)]}, headers=headers)
+        for res in r.json['results']:
+            if res.get('status') != 'created':
+                errors.append(res)
+            else:
+                mine.append(res['job_id'])
+        with lock:
+            ids.extend(mine)
+
+    threads = [threading.Thread(target=run, args=(t,)) for t in range(THREADS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return ids, errors
+
+def _child(conn):
+    # forked: has a copy of the parent's mongomock database and id generator
+    ids, errors = create_jobs()
+    conn.send((ids, errors, Receipt.objects(job_id__in=ids).count()))
+    conn.close()
+
+def _generate(conn, count):
+    made = [ids.new_job_id() for _ in range(count)]
+    conn.send((ids._generator.node, made))
+    conn.close()
+
+def _forked(target, *args, processes=4):
+    """Run target(conn, *args) in forked children and collect what each sends."""
+    ctx = multiprocessing.get_context('fork')
+    procs = []
+    for _ in range(processes):
+        parent, child = ctx.Pipe()
+        p = ctx.Process(target=target, args=(child,) + args)
+        p.start()
+        procs.append((p, parent))
+    results = [conn.recv() for _, conn in procs]
+    for p, _ in procs:
+        p.join(30)
+    return results
+
+def test_concurrent_requests_get_unique_job_ids(db):
+    ids, errors = create_jobs()
+    assert errors == []
+    assert len(ids) == THREADS * (PER_THREAD + BATCH)
+    assert len(set(ids)) == len(ids)
+    assert Receipt.objects(job_id__in=ids).count() == len(ids)
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='needs fork')
+def test_forked_processes_get_unique_job_ids(db):
+    devapi.new_job_id()  # the generator is in use before the fork, as in a preloading server
+    all_ids = []
+    for ids, errors, stored in _forked(_child):
+        assert errors == []
+        assert stored == len(ids) == THREADS * (PER_THREAD + BATCH)
+        all_ids += ids
+    assert len(set(all_ids)) == len(all_ids)
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='needs fork')
+def test_workers_sharing_job_id_node_get_distinct_nodes_and_ids(monkeypatch):
+    # gunicorn workers inherit one environment, so JOB_ID_NODE alone would give them one node
+    monkeypatch.setenv('JOB_ID_NODE', 'replica-1')
+    ids.new_job_id()
+    results = _forked(_generate, 10000)
+    assert len({node for node, _ in results}) > 1
+    all_ids = [i for _, made in results for i in made]
+    assert len(all_ids) == 4 * 10000
+    assert len(set(all_ids)) == len(all_ids)
+    assert all(made == sorted(made) for _, made in results)
@@ -0,0 +1,70 @@
+import csv, io, json, datetime
+import pytest
+import backend.dev_api_prod as devapi
+from verifier.models import Receipt
+
+T0 = datetime.datetime(2024, 5, 1, 12, 0, 0)
+
+@pytest.fixture
+def client(db):
+    devapi.limiter.enabled = False
+    client = devapi.app.test_client()
+    client.environ_base['HTTP_AUTHORIZATION'] = 'Bearer ' + devapi.create_jwt('operator')
+    return client
+
+def seed():
+    """Three receipts sharing one timestamp, two older ones and two legacy ones without any."""
+    coll = Receipt._get_collection()
+    stamps = [T0, T0, T0, T0 - datetime.timedelta(hours=1), T0 - datetime.timedelta(hours=2), None, None]
+    for n, ts in enumerate(stamps):
+        doc = {'job_id': f'job-{n}', 'status': 'emailed', 'operator': 'op', 'method': 'zero'}
+        if ts:
+            doc['timestamp'] = ts
+        coll.insert_one(doc)
+    return [d['job_id'] for d in coll.find({}, sort=[('timestamp', -1), ('_id', -1)])]
+
+def pages(client, limit, **args):
+    cursor, seen = None, []
+    while True:
+        query = dict(args, limit=limit, **({'cursor': cursor} if cursor else {}))
+        r = client.get('/api/receipts', query_string=query)
+        assert r.status_code == 200
+        seen.append([row['job_id'] for row in r.json['items']])
+        cursor = r.json['next_cursor']
+        if not cursor:
+            return seen
+
+@pytest.mark.parametrize('limit', [1, 2, 3])
+def test_paging_walks_ties_and_undated_receipts_once_in_order(client, limit):
+    order = seed()
+    assert order[:3] == ['job-2', 'job-1', 'job-0'] and order[-2:] == ['job-6', 'job-5']
+    walked = pages(client, limit)
+    assert [job for page in walked for job in page] == order
+    assert all(0 < len(page) <= limit for page in walked)
+
+def test_paging_with_a_date_filter_leaves_undated_receipts_out(client):
+    seed()
+    walked = pages(client, 2, **{'from': (T0 - datetime.timedelta(hours=3)).isoformat()})
+    assert [job for page in walked for job in page] == ['job-2', 'job-1', 'job-0', 'job-3', 'job-4']
+
+def test_csv_export(client):
+    order = seed()
+    r = client.get('/api/receipts/export', query_string={'format': 'csv'})
+    assert r.status_code == 200 and r.mimetype == 'text/csv'
+    assert r.headers['Content-Disposition'] == 'attachment; filename="receipts.csv"'
+    rows = list(csv.DictReader(io.StringIO(r.get_data(as_text=True))))
+    assert [row['job_id'] for row in rows] == order
+    assert rows[0]['timestamp'] == T0.isoformat() and rows[-1]['timestamp'] == ''
+
+def test_ndjson_export_with_filter(client):
+    seed()
+    Receipt.objects(job_id='job-1').update(set__status='reported')
+    r = client.get('/api/receipts/export', query_string={'status': 'emailed'})
+    assert r.status_code == 200 and r.mimetype == 'application/x-ndjson'
+    rows = [json.loads(line) for line in r.get_data(as_text=True).splitlines()]
+    assert [row['job_id'] for row in rows] == ['job-2', 'job-0', 'job-3', 'job-4', 'job-6', 'job-5']
+    assert rows[-1] == {'job_id': 'job-5', 'operator': 'op', 'method': 'zero', 'status': 'emailed',
+                        'email': None, 'timestamp': None}
+
+def test_export_rejects_unknown_format(client):
+    assert client.get('/api/receipts/export', query_string={'format': 'xml'}).status_code == 400
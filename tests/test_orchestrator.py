@@ -0,0 +1,51 @@
+import sys, json, time, asyncio
+from agents.orchestrator import WipeOrchestrator
+
+# Stands in for tools/wipe_*.py: prints when it starts and stops, then its result line.
+FAKE_WIPE = ('import sys, time, json; print("start", time.time(), flush=True); time.sleep(0.2); '
+             'print("stop", time.time()); print(json.dumps({"status": "SUCCESS", "device": sys.argv[1]}))')
+
+def fake_command(device):
+    return [sys.executable, '-c', FAKE_WIPE, device['path']], None
+
+def run(devices, max_parallel, per_bus):
+    spans = {}
+    def on_progress(device, line):
+        kind, _, at = line.partition(' ')
+        if kind in ('start', 'stop'):
+            spans.setdefault(device['path'], {})[kind] = float(at)
+    orch = WipeOrchestrator(max_parallel, per_bus, timeout=30, on_progress=on_progress, command=fake_command)
+    results = asyncio.run(orch.run(devices))
+    return results, spans
+
+def peak(spans, paths):
+    """Most wipes among `paths` that were running at the same moment."""
+    edges = sorted([(spans[p]['start'], 1) for p in paths] + [(spans[p]['stop'], -1) for p in paths])
+    running = top = 0
+    for _, step in edges:
+        running += step
+        top = max(top, running)
+    return top
+
+def test_per_bus_and_global_caps_hold():
+    devices = [{'path': f'disk{i}', 'bus': f'bus{i % 2}'} for i in range(8)]
+    results, spans = run(devices, max_parallel=3, per_bus=2)
+    assert [r['status'] for r in results] == ['SUCCESS'] * 8
+    assert [r['device'] for r in results] == [d['path'] for d in devices]
+    assert {r['bus'] for r in results} == {'bus0', 'bus1'}
+    assert peak(spans, list(spans)) == 3
+    for bus in ('bus0', 'bus1'):
+        assert peak(spans, [d['path'] for d in devices if d['bus'] == bus]) <= 2
+
+def test_devices_on_one_bus_are_serialised_by_the_bus_cap():
+    devices = [{'path': f'disk{i}', 'bus': 'hba0'} for i in range(3)]
+    started = time.monotonic()
+    _, spans = run(devices, max_parallel=8, per_bus=1)
+    assert peak(spans, list(spans)) == 1
+    assert time.monotonic() - started >= 0.6
+
+def test_device_timeout_overrides_the_default():
+    devices = [{'path': 'slow', 'bus': 'b0', 'timeout': 0.1}, {'path': 'unbounded', 'bus': 'b1', 'timeout': 0}]
+    results, _ = run(devices, max_parallel=2, per_bus=1)
+    assert results[0]['status'] == 'FAILED' and results[0]['error'] == 'TimeoutError'
+    assert results[1]['status'] == 'SUCCESS'
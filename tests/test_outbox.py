@@ -0,0 +1,59 @@
+import socket, datetime
+import pytest
+from backend.outbox import OutboxSender, SMTPTransport, enqueue
+from bench.smtp_sink import start_sink
+from tools.emailer import SMTPPool
+from verifier.models import EmailOutbox
+
+@pytest.fixture
+def sink():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    controller, handler = start_sink(port=port, keep=True)
+    pool = SMTPPool('127.0.0.1', port, starttls=False, size=1)
+    yield handler, OutboxSender(SMTPTransport(pool, 'securewipe@example.com'), workers=0, base_delay=60)
+    pool.close()
+    controller.stop()
+
+def reply_first(handler, replies):
+    """Answer the next DATA commands with `replies` (e.g. '451 ...') before accepting again."""
+    accept, pending = handler.handle_DATA, list(replies)
+    async def handle_DATA(server, session, envelope):
+        return pending.pop(0) if pending else await accept(server, session, envelope)
+    handler.handle_DATA = handle_DATA
+
+def test_queued_emails_are_delivered_over_one_session(db, sink):
+    handler, sender = sink
+    for i in range(3):
+        enqueue(f'user{i}@example.com', f'Receipt {i}', 'body', job_id=f'job-{i}')
+    assert sender.drain_once() == 3
+    assert handler.count == 3 and handler.sessions == 1
+    assert b'Subject: Receipt 0' in handler.messages[0]
+    assert {(r.status, r.attempts) for r in EmailOutbox.objects} == {('sent', 1)}
+    assert sender.drain_once() == 0
+
+def test_temporary_refusal_is_retried_after_backoff(db, sink):
+    handler, sender = sink
+    reply_first(handler, ['451 4.3.0 try again later'])
+    row = enqueue('user@example.com', 'Receipt', 'body')
+    assert sender.drain_once() == 1
+    row.reload()
+    assert row.status == 'pending' and row.attempts == 1 and '451' in row.last_error
+    assert row.next_attempt_at > datetime.datetime.utcnow() + datetime.timedelta(seconds=20)
+    assert sender.drain_once() == 0  # not due yet
+
+    row.update(next_attempt_at=datetime.datetime.utcnow())
+    assert sender.drain_once() == 1
+    row.reload()
+    assert row.status == 'sent' and row.attempts == 2 and row.last_error is None
+    assert handler.count == 1
+
+def test_permanent_refusal_fails_without_retry(db, sink):
+    handler, sender = sink
+    reply_first(handler, ['550 5.7.1 message rejected'])
+    row = enqueue('user@example.com', 'Receipt', 'body')
+    assert sender.drain_once() == 1
+    row.reload()
+    assert row.status == 'failed' and row.attempts == 1 and '550' in row.last_error
+    assert handler.count == 0
@@ -0,0 +1,94 @@
+import time, datetime
+import pytest
+from backend.pipeline import InProcessQueue, LazyQueue, ReceiptPipeline
+from verifier.models import Receipt
+
+def make_pipeline(**kwargs):
+    calls = []
+    pipeline = ReceiptPipeline(InProcessQueue(), sign=lambda payload: 'sig',
+                               render=lambda payload, sig, job_id: calls.append(('render', job_id)) or 'pdfkey',
+                               email=lambda *a, **k: calls.append(a[0]), workers=0, **kwargs)
+    return pipeline, calls
+
+def receipt(job_id, status, finalize_at=None, email='a@example.com', outcome='success'):
+    Receipt(job_id=job_id, status=status, email=email, payload={'job_id': job_id, 'status': outcome},
+            finalize_at=finalize_at).save()
+
+def test_sweep_requeues_receipts_stuck_in_a_stage(db):
+    pipeline, calls = make_pipeline(stale_seconds=600)
+    old = datetime.datetime.utcnow() - datetime.timedelta(hours=1)
+    receipt('stuck-reported', 'reported', old)
+    receipt('stuck-rendered', 'rendered', old)
+    receipt('legacy', 'signed')  # reported before finalize_at existed
+    receipt('fresh', 'reported', datetime.datetime.utcnow())
+    receipt('no-email', 'rendered', old, email=None)
+    receipt('done', 'emailed', old)
+    receipt('waiting', 'created', old)
+
+    assert sorted(pipeline.sweep()) == ['legacy', 'stuck-rendered', 'stuck-reported']
+    # claimed: a second sweep (another process) finds nothing
+    assert pipeline.sweep() == []
+
+    while True:
+        task = pipeline.queue.get(timeout=0)
+        if not task:
+            break
+        pipeline.finalize(task['job_id'])
+    assert {r.job_id: r.status for r in Receipt.objects(job_id__in=['stuck-reported', 'stuck-rendered', 'legacy'])} == \
+        {'stuck-reported': 'emailed', 'stuck-rendered': 'emailed', 'legacy': 'emailed'}
+    assert [c for c in calls if isinstance(c, str)] == ['a@example.com'] * 3
+
+def test_failed_stage_is_retried_by_a_later_sweep(db):
+    pipeline, _ = make_pipeline(stale_seconds=600)
+    pipeline.render = lambda *a: 1 / 0
+    receipt('flaky', 'reported')
+    pipeline.finalize('flaky')
+    job = Receipt.objects(job_id='flaky').first()
+    assert (job.status, job.error.startswith('render')) == ('signed', True)
+    pipeline.render = lambda *a: 'pdfkey'
+    assert pipeline.sweep() == []
+    Receipt.objects(job_id='flaky').update(finalize_at=datetime.datetime.utcnow() - datetime.timedelta(hours=1))
+    assert pipeline.sweep() == ['flaky']
+    pipeline.finalize(pipeline.queue.get(timeout=0)['job_id'])
+    assert Receipt.objects(job_id='flaky').first().status == 'emailed'
+
+def test_lazy_queue_retries_redis_and_moves_tasks_queued_meanwhile():
+    real = InProcessQueue()
+    attempts = []
+    def factory():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ConnectionError('redis down')
+        return real
+    q = LazyQueue(factory, retry_seconds=0.05)
+    q.put({'job_id': 'a'})
+    assert q.error and real.depth() == 0
+    q.put({'job_id': 'b'})
+    assert len(attempts) == 1  # not before retry_seconds
+    time.sleep(0.06)
+    assert q.depth() == 2 and q.error is None
+    assert [real.get(0)['job_id'], real.get(0)['job_id']] == ['a', 'b']
+
+@pytest.mark.parametrize('outcome', ['failed', 'dry-run', 'refused'])
+def test_only_successful_wipes_get_a_certificate(db, outcome):
+    pipeline, calls = make_pipeline(stale_seconds=600)
+    receipt('job-1', 'reported', outcome=outcome)
+    pipeline.finalize('job-1')
+    job = Receipt.objects(job_id='job-1').first()
+    assert (job.status, job.signature, job.pdf_hash) == ('signed', 'sig', None)
+    assert calls == []
+    Receipt.objects(job_id='job-1').update(finalize_at=datetime.datetime.utcnow() - datetime.timedelta(hours=1))
+    assert pipeline.sweep() == []  # nothing left to do for it
+
+def test_stage_that_keeps_failing_is_parked_after_max_attempts(db):
+    pipeline, _ = make_pipeline(stale_seconds=600, max_attempts=3)
+    pipeline.render = lambda *a: 1 / 0
+    receipt('broken', 'reported')
+    for attempt in range(3):
+        Receipt.objects(job_id='broken').update(finalize_at=datetime.datetime.utcnow() - datetime.timedelta(hours=1))
+        assert pipeline.sweep() == ['broken']
+        pipeline.finalize(pipeline.queue.get(timeout=0)['job_id'])
+    job = Receipt.objects(job_id='broken').first()
+    assert (job.status, job.finalize_attempts) == ('finalize_failed', 3)
+    Receipt.objects(job_id='broken').update(finalize_at=datetime.datetime.utcnow() - datetime.timedelta(hours=1))
+    assert pipeline.sweep() == []
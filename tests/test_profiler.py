@@ -0,0 +1,40 @@
+import pytest
+import backend.dev_api_prod as devapi
+import verifier.app_prod as verifier
+
+@pytest.fixture
+def profilers(monkeypatch):
+    devapi.limiter.enabled = verifier.limiter.enabled = False
+    for service in (devapi, verifier):
+        monkeypatch.setattr(service, 'PROFILER_SWITCH', True)
+        monkeypatch.setattr(service.profiler, 'enabled', False)
+        monkeypatch.setattr(service.profiler, 'max_seconds', 0.2)
+
+SERVICES = pytest.mark.parametrize('service, prefix, headers', [
+    (devapi, '/api', lambda: {'Authorization': 'Bearer ' + devapi.create_jwt('operator')}),
+    (verifier, '', lambda: {'X-API-KEY': 'test-key'}),
+])
+
+@SERVICES
+def test_profiler_is_switched_at_runtime_by_an_authenticated_caller(profilers, service, prefix, headers):
+    client = service.app.test_client()
+    switch, profile = prefix + '/debug/profiler', prefix + '/debug/profile?seconds=0.1'
+    assert client.put(switch, json={'enabled': True}).status_code == 401
+    assert client.post(profile, headers=headers()).status_code == 404
+
+    assert client.put(switch, json={'enabled': 'yes'}, headers=headers()).status_code == 400
+    assert client.put(switch, json={'enabled': True}, headers=headers()).json['enabled'] is True
+    assert client.post(profile, headers=headers()).status_code == 200
+
+    assert client.put(switch, json={'enabled': False}, headers=headers()).json['enabled'] is False
+    assert client.get(switch, headers=headers()).json['enabled'] is False
+    assert client.post(profile, headers=headers()).status_code == 404
+
+@SERVICES
+def test_runtime_switch_is_off_unless_configured(profilers, monkeypatch, service, prefix, headers):
+    monkeypatch.setattr(service, 'PROFILER_SWITCH', False)
+    client = service.app.test_client()
+    r = client.put(prefix + '/debug/profiler', json={'enabled': True}, headers=headers())
+    assert (r.status_code, r.json['error']) == (403, 'profiler_switch_disabled')
+    assert client.get(prefix + '/debug/profiler', headers=headers()).json['enabled'] is False
+    assert client.post(prefix + '/debug/profile?seconds=0.1', headers=headers()).status_code == 404
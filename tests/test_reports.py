@@ -0,0 +1,72 @@
+import pytest
+import backend.dev_api_prod as devapi
+from verifier.models import Receipt
+
+@pytest.fixture
+def client(db, monkeypatch):
+    devapi.limiter.enabled = False
+    submitted = []
+    monkeypatch.setattr(devapi.pipeline, 'submit', submitted.append)
+    client = devapi.app.test_client()
+    client.submitted = submitted
+    client.environ_base['HTTP_AUTHORIZATION'] = 'Bearer ' + devapi.create_jwt('agent')
+    return client
+
+def job(job_id, status='claimed', **kwargs):
+    return Receipt(job_id=job_id, status=status, **kwargs).save()
+
+def test_single_report_is_validated_like_the_batch(client):
+    job('job-1')
+    assert client.post('/api/report', json=['not', 'a', 'dict']).status_code == 400
+    r = client.post('/api/report', json={'job_id': 'job-1', '$bad': 1})
+    assert r.status_code == 400 and r.get_json()['error'].startswith('invalid: ')
+    assert Receipt.objects(job_id='job-1').first().status == 'claimed' and client.submitted == []
+
+def test_single_report_after_the_pipeline_moved_on_is_refused(client):
+    job('job-1', status='emailed', payload={'job_id': 'job-1', 'report_id': 'r1', 'status': 'success'})
+    r = client.post('/api/report', json={'job_id': 'job-1', 'report_id': 'r2', 'status': 'failed'})
+    assert r.status_code == 409 and r.get_json()['error'] == 'already_finalized'
+    # the report it already has is still acknowledged
+    assert client.post('/api/report', json={'job_id': 'job-1', 'report_id': 'r1'}).status_code == 202
+    stored = Receipt.objects(job_id='job-1').first()
+    assert stored.status == 'emailed' and stored.payload['report_id'] == 'r1' and client.submitted == []
+
+def test_resent_batch_queues_only_what_it_changed(client):
+    job('job-1')
+    job('job-2')
+    batch = {'items': [{'job_id': 'job-1', 'report_id': 'r1', 'status': 'success'},
+                       {'job_id': 'job-2', 'report_id': 'r2', 'status': 'success'}]}
+    r = client.post('/api/reports:batch', json=batch)
+    assert r.status_code == 202 and r.get_json()['reported'] == 2
+    assert client.submitted == ['job-1', 'job-2']
+
+    Receipt.objects(job_id='job-1').update(set__status='emailed')
+    r = client.post('/api/reports:batch', json=batch)
+    assert r.get_json()['reported'] == 2 and client.submitted == ['job-1', 'job-2']
+    assert Receipt.objects(job_id='job-1').first().status == 'emailed'
+
+def test_batch_refuses_new_reports_for_finalized_jobs(client):
+    job('job-1', status='signed', payload={'job_id': 'job-1', 'report_id': 'r1', 'status': 'success'})
+    job('job-2', status='finalize_failed')
+    r = client.post('/api/reports:batch', json={'items': [
+        {'job_id': 'job-1', 'report_id': 'r9', 'status': 'failed'},
+        {'job_id': 'job-2', 'report_id': 'r2', 'status': 'success'},
+        {'job_id': 'job-3', 'report_id': 'r3'}]})
+    results = r.get_json()['results']
+    assert [x.get('error') for x in results] == ['already_finalized', None, 'not_found']
+    assert Receipt.objects(job_id='job-1').first().payload['report_id'] == 'r1'
+    assert client.submitted == ['job-2']
+
+def test_batch_update_that_loses_a_race_is_not_queued(client, monkeypatch):
+    job('job-1')
+    job('job-2')
+    real = devapi.evidence.attach_evidence
+
+    def finalized_meanwhile(pairs):  # runs between the status read and the write
+        Receipt.objects(job_id='job-1').update(set__status='signed')
+        return real(pairs)
+    monkeypatch.setattr(devapi.evidence, 'attach_evidence', finalized_meanwhile)
+    client.post('/api/reports:batch', json={'items': [{'job_id': 'job-1', 'report_id': 'r1'},
+                                                      {'job_id': 'job-2', 'report_id': 'r2'}]})
+    assert Receipt.objects(job_id='job-1').first().status == 'signed'
+    assert client.submitted == ['job-2']
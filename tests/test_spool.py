@@ -0,0 +1,108 @@
+import requests
+import pytest
+import backend.dev_api_prod as devapi
+from agents.evidence import EvidenceSpool
+from agents.spool import ResultSpool, SpoolUploader
+from verifier.models import Receipt
+
+class Response:
+    def __init__(self, resp):
+        self.status_code, self.headers, self.text = resp.status_code, resp.headers, resp.get_data(as_text=True)
+        self._resp = resp
+
+    def json(self):
+        return self._resp.get_json()
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f'HTTP {self.status_code}', response=self)
+
+class DevapiSession:
+    """requests.Session look-alike over the devapi test client; `down` fails the next calls."""
+    def __init__(self, client):
+        self.client = client
+        self.headers = {'Authorization': 'Bearer ' + devapi.create_jwt('agent')}
+        self.down = 0
+        self.calls = []
+
+    def _call(self, method, url, headers=None, timeout=None, **kwargs):
+        path = url.split('http://devapi', 1)[1]
+        self.calls.append((method, path))
+        if self.down:
+            self.down -= 1
+            raise requests.ConnectionError('devapi unreachable')
+        return Response(self.client.open(path, method=method, headers=dict(self.headers, **(headers or {})), **kwargs))
+
+    def get(self, url, **kwargs):
+        return self._call('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self._call('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self._call('PUT', url, **kwargs)
+
+@pytest.fixture
+def agent(db, tmp_path, monkeypatch):
+    devapi.limiter.enabled = False
+    monkeypatch.setattr(devapi, 'EVIDENCE_CHUNK_SIZE', 4096)
+    monkeypatch.setattr('agents.evidence._wait', lambda r, backoff: None)
+    Receipt(job_id='job-1', status='claimed', device={'platform': 'linux'}).save()
+    spool = ResultSpool(str(tmp_path / 'spool.db'))
+    session = DevapiSession(devapi.app.test_client())
+    yield spool, session, SpoolUploader(spool, session, 'http://devapi', evidence_attempts=3)
+    spool.close()
+
+def evidence_log(tmp_path):
+    log = EvidenceSpool(str(tmp_path / 'job-1.log.gz'))
+    for i in range(5000):
+        log.write(f'pass 1 block {i} {i * 7919 % 10007:05d} ok')  # a few chunks once gzipped
+    return log.close()
+
+def report():
+    return {'job_id': 'job-1', 'status': 'success', 'result': {'status': 'SUCCESS'}, 'out': 'tail', 'evidence': []}
+
+def test_report_is_sent_after_its_evidence_upload_retries_and_resumes(agent, tmp_path):
+    spool, session, uploader = agent
+    log = evidence_log(tmp_path)
+    spool.put_evidence(report(), log)
+    assert spool.pending('report') == 0
+
+    session.down = 1  # the first POST /api/evidence fails: retried later, not lost
+    assert uploader.upload_evidence_once() > 0
+    spool._db.execute('UPDATE spool SET next_at = 0')
+    session.down = 0
+    puts = []
+    def put_then_drop(url, **kwargs):  # one chunk is stored, then the connection goes for good
+        puts.append(url)
+        if len(puts) > 1:
+            raise requests.ConnectionError('dropped')
+        return session._call('PUT', url, **kwargs)
+    session.put = put_then_drop
+    assert uploader.upload_evidence_once() > 0
+    body = spool._db.execute("SELECT body FROM spool WHERE kind = 'evidence'").fetchone()[0]
+    assert '"upload_id": "' in body and len(puts) > 1
+
+    spool._db.execute('UPDATE spool SET next_at = 0')
+    del session.put
+    session.calls.clear()
+    assert uploader.upload_evidence_once() == 0
+    # resumed the recorded upload instead of opening another one
+    assert ('POST', '/api/evidence') not in session.calls and session.calls[0][0] == 'GET'
+    assert not (tmp_path / 'job-1.log.gz').exists() and spool.pending('evidence') == 0
+
+    uploader.flush_once()
+    job = Receipt.objects(job_id='job-1').first()
+    assert job.status == 'reported' and job.evidence_sha256 == log['sha256']
+    assert job.payload['evidence']['lines'] == 5000 and 'out' not in job.payload
+
+def test_evidence_the_server_refuses_falls_back_to_the_tail(agent, tmp_path):
+    spool, session, uploader = agent
+    log = evidence_log(tmp_path)
+    r = report()
+    r['job_id'] = 'unknown-job'  # POST /api/evidence answers 404
+    spool.put_evidence(r, log)
+    assert uploader.upload_evidence_once() == 0
+    assert spool.pending('evidence') == 0 and not (tmp_path / 'job-1.log.gz').exists()
+    (row,) = spool.due('report', 10)
+    assert '"out": "tail"' in row[1] and 'evidence_id' not in row[1]
@@ -0,0 +1,50 @@
+import os
+import pytest
+import verifier.app_prod as verifier
+from tools.signer import sign_payload
+from verifier.models import Receipt, encode_signed
+from conftest import ROOT
+
+@pytest.fixture
+def client(db):
+    verifier.verify_cache.clear()
+    verifier.limiter.enabled = False
+    return verifier.app.test_client()
+
+def signed_receipt(job_id, payload):
+    sig = sign_payload(os.path.join(ROOT, 'private_prod.pem'), payload)
+    Receipt(job_id=job_id, status='emailed', payload=payload, signature=sig, signed_blob=encode_signed(payload)).save()
+
+def test_receipt_rewritten_elsewhere_is_not_served_from_the_cache(client):
+    # Receipts are written by the devapi: the verifier sees no save signal, only the new document.
+    signed_receipt('job-1', {'job_id': 'job-1', 'status': 'success'})
+    assert client.get('/receipts/verify?job_id=job-1').json['valid'] is True
+    Receipt._get_collection().update_one(
+        {'job_id': 'job-1'}, {'$set': {'signed_blob': encode_signed({'job_id': 'job-1', 'status': 'failed'})}})
+    body = client.get('/receipts/verify?job_id=job-1').json
+    assert (body['valid'], body['reason']) == (False, 'bad_signature')
+
+def test_verdict_is_cached_for_unchanged_receipts(client, monkeypatch):
+    signed_receipt('job-2', {'job_id': 'job-2'})
+    assert client.get('/receipts/verify?job_id=job-2').json['valid'] is True
+    monkeypatch.setattr(verifier, '_rsa_valid', lambda *a: pytest.fail('verified twice'))
+    assert client.get('/receipts/verify?job_id=job-2').json['valid'] is True
+
+def test_without_a_configured_key_routes_stay_closed(client, monkeypatch):
+    assert client.get('/receipts/job-3.pdf', headers={'X-API-KEY': 'test-key'}).status_code == 404
+    monkeypatch.setattr(verifier, 'api_keys', verifier.APIKeySet())
+    for key in ('test-key', 'changeme', ''):
+        assert client.get('/receipts/job-3.pdf', headers={'X-API-KEY': key}).status_code == 401
+    verifier.readiness.refresh()
+    ready, checks = verifier.readiness.ready()
+    assert not ready and checks['api_keys']['ok'] is False
+
+@pytest.mark.parametrize('job_ids', [[{'a': 1}], ['job-1', None], ['job-1', ''], [['job-1']], [7]])
+def test_bulk_verify_rejects_job_ids_that_are_not_strings(client, job_ids):
+    r = client.post('/receipts/verify', json={'job_ids': job_ids}, headers={'X-API-KEY': 'test-key'})
+    assert (r.status_code, r.json['error']) == (400, 'invalid_job_ids')
+
+def test_bulk_verify_reports_each_job(client):
+    signed_receipt('job-4', {'job_id': 'job-4'})
+    r = client.post('/receipts/verify', json={'job_ids': ['job-4', 'missing']}, headers={'X-API-KEY': 'test-key'})
+    assert [(x['valid'], x.get('reason')) for x in r.json['results']] == [(True, None), (False, 'not_found')]
@@ -1,23 +1,118 @@
-import os, smtplib
+import os, time, queue, smtplib, threading
 from email.message import EmailMessage
+from tools.timing import timed
 
-def send_certificate(recipient, subject, body, attachment_path):
-    smtp_server = os.getenv('SMTP_SERVER')
-    smtp_port = int(os.getenv('SMTP_PORT', '587'))
-    smtp_user = os.getenv('SMTP_USER')
-    smtp_pass = os.getenv('SMTP_PASS')
-    sender = os.getenv('EMAIL_FROM', smtp_user)
-    if not smtp_server or not smtp_user or not smtp_pass:
-        raise RuntimeError('SMTP not configured via env variables')
+def build_message(sender, recipient, subject, body, attachment_path=None, attachment=None):
+    """`attachment` is an optional (bytes, filename) pair, for PDFs that are not files on disk."""
     msg = EmailMessage()
     msg['From'] = sender
     msg['To'] = recipient
     msg['Subject'] = subject
     msg.set_content(body)
-    with open(attachment_path, 'rb') as f:
-        data = f.read()
-    msg.add_attachment(data, maintype='application', subtype='pdf', filename=os.path.basename(attachment_path))
-    with smtplib.SMTP(smtp_server, smtp_port) as s:
-        s.starttls()
-        s.login(smtp_user, smtp_pass)
-        s.send_message(msg)
+    if attachment_path:
+        with open(attachment_path, 'rb') as f:
+            attachment = (f.read(), os.path.basename(attachment_path))
+    if attachment:
+        data, filename = attachment
+        msg.add_attachment(data, maintype='application', subtype='pdf', filename=filename)
+    return msg
+
+class SMTPPool:
+    """A few long-lived SMTP connections reused across messages.
+
+    Connections are opened (and STARTTLS + login done) on first use, handed
+    back after each send and dropped when they fail or sit idle longer than
+    `max_idle` seconds, since servers close idle sessions on their own.
+    """
+
+    def __init__(self, host, port=587, user=None, password=None, starttls=True, size=2, timeout=30, max_idle=120):
+        self.host, self.port = host, port
+        self.user, self.password = user, password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    @classmethod
+    def from_env(cls):
+        server = os.getenv('SMTP_SERVER')
+        if not server:
+            raise RuntimeError('SMTP not configured via env variables')
+        return cls(server, int(os.getenv('SMTP_PORT', '587')), os.getenv('SMTP_USER'), os.getenv('SMTP_PASS'),
+                   starttls=os.getenv('SMTP_STARTTLS', '1') not in ('0', 'false', 'no'),
+                   size=int(os.getenv('SMTP_POOL_SIZE', '2')))
+
+    def _connect(self):
+        s = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            s.starttls()
+        if self.user and self.password:
+            s.login(self.user, self.password)
+        return s
+
+    def _acquire(self):
+        while True:
+            try:
+                s, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            if time.monotonic() - last_used < self.max_idle:
+                return s
+            self._close(s)
+
+    def _release(self, s):
+        try:
+            self._idle.put_nowait((s, time.monotonic()))
+        except queue.Full:
+            self._close(s)
+
+    @staticmethod
+    def _close(s):
+        try:
+            s.quit()
+        except Exception:
+            s.close()
+
+    @timed("smtp.send")
+    def send(self, msg):
+        """Send one message; a dropped connection is replaced and the send retried once."""
+        for attempt in (1, 2):
+            s = self._acquire()
+            try:
+                s.send_message(msg)
+            except smtplib.SMTPServerDisconnected:
+                s.close()
+                if attempt == 2:
+                    raise
+                continue
+            except smtplib.SMTPException:
+                # refused by the server: the session itself is still usable
+                self._release(s)
+                raise
+            except OSError:
+                s.close()
+                raise
+            self._release(s)
+            return
+
+    def close(self):
+        while True:
+            try:
+                s, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._close(s)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SMTPPool.from_env()
+        return _pool
+
+def send_certificate(recipient, subject, body, attachment_path):
+    sender = os.getenv('EMAIL_FROM', os.getenv('SMTP_USER'))
+    get_pool().send(build_message(sender, recipient, subject, body, attachment_path))
@@ -2,73 +2,179 @@ import os, io, json
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
 import qrcode
+from tools.timing import timed
 
 PDF_OUT_DIR = os.environ.get('PDF_OUT_DIR', './data/pdfs')
 os.makedirs(PDF_OUT_DIR, exist_ok=True)
 
+class CertificateRenderer:
+    """Certificate renderer that lays the page out once.
+
+    Fixed text (headings, labels, footer) is computed up front and, when
+    several certificates share a document, drawn once into a PDF form
+    XObject that each page references. A form lives inside its document, so
+    a single-certificate render draws the static layer directly. Per job
+    only the field values and a vector QR code (filled rectangles, no raster
+    round trip) are drawn.
+
+    Output is deterministic (ReportLab's invariant mode pins the creation
+    date and document ID), so the same receipt always renders to the same
+    bytes and a content-addressed store can skip unchanged re-renders.
+    """
+
+    def __init__(self, out_dir=None, pagesize=A4, margin=50):
+        self.out_dir = out_dir or PDF_OUT_DIR
+        self.pagesize = pagesize
+        self.margin = margin
+        w, h = pagesize
+        m = margin
+        y = h - m
+        # (font, size, x, y, text) for everything that never changes
+        self._static = [
+            ('Helvetica-Bold', 20, m, y, 'BitShred'),
+            ('Helvetica', 12, m + 120, y, 'Secure Data Wipe Certificate'),
+            ('Helvetica-Bold', 11, m, y - 40, 'Device Information'),
+            ('Helvetica-Bold', 11, w / 2, y - 40, 'Operator / Contact'),
+            ('Helvetica-Bold', 11, m, y - 90, 'Wipe Details'),
+            ('Helvetica-Bold', 11, m, y - 136, 'Evidence (sample)'),
+            ('Helvetica-Oblique', 8, m, m + 10, 'This certificate is digitally signed and verifiable via BitShred verifier.'),
+        ]
+        self._y = {'model': y - 56, 'serial': y - 70, 'method': y - 104, 'nist': y - 116, 'evidence': y - 150}
+        self._col2 = w / 2
+        self._qr_box = (w - m - 120, m + 20, 110)
+
+    def _draw_static(self, c):
+        for font, size, x, y, text in self._static:
+            c.setFont(font, size)
+            c.drawString(x, y, text)
+
+    def _draw_qr(self, c, url):
+        # A fixed mask skips qrcode's 8-way mask scoring, which otherwise
+        # dominates the per-page cost; any mask yields a valid symbol.
+        qr = qrcode.QRCode(border=4, mask_pattern=0)
+        qr.add_data(url)
+        qr.make(fit=True)
+        matrix = qr.get_matrix()
+        x0, y0, size = self._qr_box
+        cell = size / len(matrix)
+        # Work in module units (origin top-left, y down) so the path
+        # coordinates are small integers.
+        c.saveState()
+        c.translate(x0, y0 + size)
+        c.scale(cell, -cell)
+        p = c.beginPath()
+        for r, row in enumerate(matrix):
+            # one rectangle per horizontal run of dark modules
+            col, n = 0, len(row)
+            while col < n:
+                if not row[col]:
+                    col += 1
+                    continue
+                start = col
+                while col < n and row[col]:
+                    col += 1
+                p.rect(start, r, col - start, 1)
+        c.drawPath(p, stroke=0, fill=1)
+        c.restoreState()
+
+    def _draw_fields(self, c, receipt_json, signature_hex, job_id):
+        m, col2, y = self.margin, self._col2, self._y
+        dev = receipt_json.get('device') or {}
+        c.setFont('Helvetica', 10)
+        c.drawString(m, y['model'], f"Model: {dev.get('model','-')}")
+        c.drawString(col2, y['model'], f"Operator: {receipt_json.get('operator','-')}")
+        c.drawString(m, y['serial'], f"Serial: {dev.get('serial','-')}")
+        c.drawString(col2, y['serial'], f"Email: {receipt_json.get('email','-')}")
+        c.drawString(m, y['method'], f"Method: {receipt_json.get('method','auto')}")
+        c.drawString(m, y['nist'], f"NIST Category: {receipt_json.get('nist_category','purge')}")
+        c.setFont('Helvetica', 9)
+        ev = receipt_json.get('evidence',[])
+        ey = y['evidence']
+        if isinstance(ev, dict):
+            # uploaded log (backend.evidence): hash and summary only
+            c.drawString(m, ey, (f"Evidence log: sha256 {str(ev.get('sha256',''))[:32]}..., "
+                                 f"{ev.get('size',0)} bytes, {ev.get('lines',0)} lines"))
+            last = (ev.get('tail') or [''])[-1][:200]
+            c.drawString(m, ey - 12, f"Last line: {last}")
+            ey -= 30
+        elif ev:
+            sample = ev[0]
+            c.drawString(m, ey, f"Cmd: {sample.get('cmd')}")
+            out = sample.get('out','')[:200].replace('\n',' ')
+            c.drawString(m, ey - 12, f"Out: {out}")
+            ey -= 30
+        else:
+            c.drawString(m, ey, 'No evidence captured.')
+            ey -= 18
+        ver = receipt_json.get('verification')
+        if ver:
+            c.drawString(m, ey + 6, (f"Read-back: {ver.get('status','-')}, {ver.get('sectors_sampled',0)} sectors sampled "
+                                     f"({ver.get('confidence',0):.0%} confidence), {ver.get('mismatches',0)} mismatches, "
+                                     f"sample sha256 {str(ver.get('sample_sha256',''))[:16]}"))
+            ey -= 12
+        c.setFont('Helvetica-Bold', 10)
+        c.drawString(m, ey, 'Digital Signature:')
+        c.setFont('Helvetica', 8)
+        c.drawString(m, ey - 12, signature_hex[:120] + ('...' if len(signature_hex)>120 else ''))
+        verifier = receipt_json.get('verifier','')
+        if verifier:
+            url = f"{verifier.rstrip('/')}/receipts/verify?job_id={job_id}"
+        else:
+            url = f"urn:bitshred:{job_id}"
+        self._draw_qr(c, url)
+
+    def _canvas(self, target):
+        return canvas.Canvas(target, pagesize=self.pagesize, invariant=1)
+
+    def _render_one(self, target, receipt_json, signature_hex, job_id):
+        c = self._canvas(target)
+        self._draw_static(c)
+        self._draw_fields(c, receipt_json, signature_hex, job_id)
+        c.save()
+
+    @timed("pdf.render")
+    def render(self, receipt_json: dict, signature_hex: str, job_id: str, path: str = None) -> str:
+        path = path or os.path.join(self.out_dir, f"bitshred_{job_id}.pdf")
+        self._render_one(path, receipt_json, signature_hex, job_id)
+        return path
+
+    @timed("pdf.render")
+    def render_bytes(self, receipt_json: dict, signature_hex: str, job_id: str) -> bytes:
+        buf = io.BytesIO()
+        self._render_one(buf, receipt_json, signature_hex, job_id)
+        return buf.getvalue()
+
+    def render_to_store(self, store, receipt_json: dict, signature_hex: str, job_id: str) -> str:
+        """Render into a blob store (verifier.blobstore); returns the content key."""
+        return store.put(self.render_bytes(receipt_json, signature_hex, job_id))
+
+    def render_many(self, receipts, path: str = None):
+        """Render (receipt_json, signature_hex, job_id) tuples.
+
+        With `path`, writes one multi-page PDF whose pages all reference a
+        single static-layer form and returns `path`; otherwise writes one file
+        per receipt into out_dir and returns the list of paths.
+        """
+        if path is None:
+            return [self.render(r, s, j) for r, s, j in receipts]
+        c = self._canvas(path)
+        c.beginForm('static')
+        self._draw_static(c)
+        c.endForm()
+        for receipt_json, signature_hex, job_id in receipts:
+            c.doForm('static')
+            self._draw_fields(c, receipt_json, signature_hex, job_id)
+            c.showPage()
+        c.save()
+        return path
+
+_default_renderer = None
+
+def get_renderer() -> CertificateRenderer:
+    global _default_renderer
+    if _default_renderer is None:
+        _default_renderer = CertificateRenderer()
+    return _default_renderer
+
 def build_pdf_for_receipt(receipt_json: dict, signature_hex: str, job_id: str) -> str:
-    filename = f"bitshred_{job_id}.pdf"
-    path = os.path.join(PDF_OUT_DIR, filename)
-    c = canvas.Canvas(path, pagesize=A4)
-    w, h = A4
-    margin = 50
-    y = h - margin
-    c.setFont('Helvetica-Bold', 20)
-    c.drawString(margin, y, 'BitShred')
-    c.setFont('Helvetica', 12)
-    c.drawString(margin+120, y, 'Secure Data Wipe Certificate')
-    y -= 40
-    c.setFont('Helvetica-Bold', 11)
-    c.drawString(margin, y, 'Device Information')
-    c.drawString(w/2, y, 'Operator / Contact')
-    y -= 16
-    c.setFont('Helvetica', 10)
-    dev = receipt_json.get('device') or {}
-    c.drawString(margin, y, f"Model: {dev.get('model','-')}")
-    c.drawString(w/2, y, f"Operator: {receipt_json.get('operator','-')}")
-    y -= 14
-    c.drawString(margin, y, f"Serial: {dev.get('serial','-')}")
-    c.drawString(w/2, y, f"Email: {receipt_json.get('email','-')}")
-    y -= 20
-    c.setFont('Helvetica-Bold', 11)
-    c.drawString(margin, y, 'Wipe Details')
-    y -= 14
-    c.setFont('Helvetica', 10)
-    c.drawString(margin, y, f"Method: {receipt_json.get('method','auto')}")
-    y -= 12
-    c.drawString(margin, y, f"NIST Category: {receipt_json.get('nist_category','purge')}")
-    y -= 20
-    c.setFont('Helvetica-Bold', 11)
-    c.drawString(margin, y, 'Evidence (sample)')
-    y -= 14
-    c.setFont('Helvetica', 9)
-    ev = receipt_json.get('evidence',[])
-    if ev:
-        sample = ev[0]
-        c.drawString(margin, y, f"Cmd: {sample.get('cmd')}")
-        y -= 12
-        out = sample.get('out','')[:200].replace('\n',' ')
-        c.drawString(margin, y, f"Out: {out}")
-        y -= 18
-    else:
-        c.drawString(margin, y, 'No evidence captured.')
-        y -= 18
-    c.setFont('Helvetica-Bold', 10)
-    c.drawString(margin, y, 'Digital Signature:')
-    y -= 12
-    c.setFont('Helvetica', 8)
-    c.drawString(margin, y, signature_hex[:120] + ('...' if len(signature_hex)>120 else ''))
-    verifier = receipt_json.get('verifier','')
-    if verifier:
-        url = f"{verifier.rstrip('/')}/receipts/verify?job_id={job_id}"
-    else:
-        url = f"urn:bitshred:{job_id}"
-    qr = qrcode.make(url)
-    bio = io.BytesIO()
-    qr.save(bio, format='PNG')
-    bio.seek(0)
-    c.drawInlineImage(bio, w - margin - 120, margin + 20, width=110, height=110)
-    c.setFont('Helvetica-Oblique', 8)
-    c.drawString(margin, margin+10, 'This certificate is digitally signed and verifiable via BitShred verifier.')
-    c.save()
-    return path
+    return get_renderer().render(receipt_json, signature_hex, job_id)
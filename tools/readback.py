@@ -0,0 +1,90 @@
+"""Sampled read-back verification of an overwrite.
+
+Reads a random sample of sectors and compares them with what the final pass
+should have left there (zeros, or the keyed AES-CTR stream regenerated from
+tools.overwrite's recorded key/nonce). The sample size is the smallest n
+for which, if at least `max_bad_fraction` of all sectors were not
+overwritten, at least one would be sampled with probability `confidence`:
+
+    n = ceil(ln(1 - confidence) / ln(1 - max_bad_fraction))
+
+which is 4603 sectors for 99% confidence at a 0.1% defect rate, whatever
+the size of the disk.
+"""
+import os, math, mmap, random, hashlib
+try:
+    from tools.overwrite import pattern_bytes, device_size
+except ImportError:  # run from tools/ as a script
+    from overwrite import pattern_bytes, device_size
+try:
+    import numpy as np
+except ImportError:  # optional: bytes comparison is used instead
+    np = None
+
+def sample_size(confidence=0.99, max_bad_fraction=0.001, population=None):
+    n = math.ceil(math.log(1 - confidence) / math.log(1 - max_bad_fraction))
+    return min(n, population) if population is not None else n
+
+def _open_uncached(path):
+    """Open for reading around the page cache, so we check the media and not our own writes."""
+    if hasattr(os, 'O_DIRECT'):
+        try:
+            return os.open(path, os.O_RDONLY | os.O_DIRECT), True
+        except OSError:
+            pass
+    fd = os.open(path, os.O_RDONLY)
+    if hasattr(os, 'posix_fadvise'):
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    return fd, False
+
+def _count_mismatches(got, expected, sector_size):
+    if np is not None:
+        a = np.frombuffer(got, dtype=np.uint8).reshape(-1, sector_size)
+        b = np.frombuffer(expected, dtype=np.uint8).reshape(-1, sector_size)
+        return int((a != b).any(axis=1).sum())
+    mv_a, mv_b = memoryview(got), memoryview(expected)
+    return sum(mv_a[i:i + sector_size] != mv_b[i:i + sector_size] for i in range(0, len(got), sector_size))
+
+def verify_sample(path, pattern, sector_size=4096, confidence=0.99, max_bad_fraction=0.001, seed=None):
+    """Verify a random sector sample of `path` against `pattern`; returns the evidence dict."""
+    size = device_size(path)
+    sectors = size // sector_size
+    if sectors == 0:
+        return {'status': 'SKIPPED', 'reason': 'target smaller than one sector'}
+    n = sample_size(confidence, max_bad_fraction, sectors)
+    seed = seed if seed is not None else int.from_bytes(os.urandom(8), 'big') >> 1  # fits BSON int64
+    picks = sorted(random.Random(seed).sample(range(sectors), n))  # sorted: mostly forward seeks
+    got = bytearray(n * sector_size)
+    expected = bytearray(n * sector_size)
+    buf = mmap.mmap(-1, sector_size)  # page aligned, as O_DIRECT requires
+    view = memoryview(buf)
+    digest = hashlib.sha256()
+    fd, direct = _open_uncached(path)
+    try:
+        for i, sector in enumerate(picks):
+            offset = sector * sector_size
+            if os.preadv(fd, [view], offset) != sector_size:
+                raise OSError(f'short read at offset {offset}')
+            got[i * sector_size:(i + 1) * sector_size] = view
+            expected[i * sector_size:(i + 1) * sector_size] = pattern_bytes(pattern, offset, sector_size)
+            digest.update(offset.to_bytes(8, 'big'))
+            digest.update(view)
+    finally:
+        os.close(fd)
+        view.release()
+        buf.close()
+    mismatches = _count_mismatches(got, expected, sector_size)
+    return {
+        'status': 'PASSED' if mismatches == 0 else 'FAILED',
+        'pattern': pattern['kind'],
+        'sector_size': sector_size,
+        'sectors_total': sectors,
+        'sectors_sampled': n,
+        'coverage': round(n / sectors, 6),
+        'confidence': confidence,
+        'max_bad_fraction': max_bad_fraction,
+        'mismatches': mismatches,
+        'sample_sha256': digest.hexdigest(),
+        'seed': seed,
+        'direct_io': direct,
+    }
@@ -1,12 +1,98 @@
-import json, binascii
+import os, json, binascii, threading
+from concurrent.futures import ProcessPoolExecutor
 from cryptography.hazmat.primitives import serialization, hashes
 from cryptography.hazmat.primitives.asymmetric import padding
 from cryptography.hazmat.backends import default_backend
+from tools.timing import timed
 
-def sign_payload(private_key_path: str, payload: dict) -> str:
+def canonical_bytes(payload: dict) -> bytes:
+    return json.dumps(payload, separators=(',', ':'), sort_keys=True).encode()
+
+def load_private_key(private_key_path: str):
     with open(private_key_path, 'rb') as f:
         key_data = f.read()
-    priv = serialization.load_pem_private_key(key_data, password=None, backend=default_backend())
-    payload_bytes = json.dumps(payload, separators=(',', ':'), sort_keys=True).encode()
+    return serialization.load_pem_private_key(key_data, password=None, backend=default_backend())
+
+def _sign_bytes(priv, payload_bytes: bytes) -> str:
     sig = priv.sign(payload_bytes, padding.PKCS1v15(), hashes.SHA256())
     return binascii.hexlify(sig).decode()
+
+# Per-process key used by pool workers; loaded once by the pool initializer.
+_worker_key = None
+
+def _init_worker(private_key_path):
+    global _worker_key
+    _worker_key = load_private_key(private_key_path)
+
+def _worker_sign(payload_bytes):
+    return _sign_bytes(_worker_key, payload_bytes)
+
+class Signer:
+    """Long-lived RSA signer. Parses the PEM once and reloads it when the
+    file's mtime changes, so key rotation is picked up without a restart."""
+
+    def __init__(self, private_key_path: str, workers: int = None, min_batch: int = 8):
+        self.private_key_path = private_key_path
+        self.workers = workers or os.cpu_count() or 1
+        self.min_batch = min_batch
+        self._lock = threading.Lock()
+        self._key = None
+        self._mtime = None
+        self._pool = None
+        self._pool_mtime = None
+
+    def _current_key(self):
+        mtime = os.stat(self.private_key_path).st_mtime_ns
+        if self._key is None or mtime != self._mtime:
+            with self._lock:
+                if self._key is None or mtime != self._mtime:
+                    self._key = load_private_key(self.private_key_path)
+                    self._mtime = mtime
+        return self._key
+
+    def _current_pool(self):
+        # Workers cache the key too, so a rotated key means a fresh pool.
+        with self._lock:
+            if self._pool is not None and self._pool_mtime != self._mtime:
+                self._pool.shutdown(wait=False)
+                self._pool = None
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                                 initargs=(self.private_key_path,))
+                self._pool_mtime = self._mtime
+            return self._pool
+
+    @timed("signer.sign")
+    def sign(self, payload: dict) -> str:
+        return _sign_bytes(self._current_key(), canonical_bytes(payload))
+
+    @timed("signer.sign_many")
+    def sign_many(self, payloads) -> list:
+        """Sign a batch, fanning out across a process pool once the batch is
+        large enough to amortise the IPC. Order of results matches input."""
+        encoded = [canonical_bytes(p) for p in payloads]
+        key = self._current_key()
+        if self.workers <= 1 or len(encoded) < self.min_batch:
+            return [_sign_bytes(key, b) for b in encoded]
+        chunksize = max(1, len(encoded) // (self.workers * 4))
+        return list(self._current_pool().map(_worker_sign, encoded, chunksize=chunksize))
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+_signers = {}
+_signers_lock = threading.Lock()
+
+def get_signer(private_key_path: str) -> Signer:
+    path = os.path.abspath(private_key_path)
+    with _signers_lock:
+        s = _signers.get(path)
+        if s is None:
+            s = _signers[path] = Signer(path)
+        return s
+
+def sign_payload(private_key_path: str, payload: dict) -> str:
+    return get_signer(private_key_path).sign(payload)
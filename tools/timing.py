@@ -0,0 +1,17 @@
+"""Stage timers for the tools, recorded into the services' /metrics when
+verifier.metrics is importable (devapi, verifier) and a no-op elsewhere
+(agents, bench stations)."""
+try:
+    from verifier.metrics import timed
+except ImportError:
+    from contextlib import ContextDecorator
+
+    class timed(ContextDecorator):
+        def __init__(self, stage, histogram=None, **labels):
+            pass
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, exc_type, exc, tb):
+            return False
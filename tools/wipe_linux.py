@@ -1,15 +1,52 @@
 #!/usr/bin/env python3
 import subprocess, time, json, os
-def wipe_device(device='/dev/sdX', passes=1, dry_run=True):
+try:
+    from tools.overwrite import OverwriteEngine
+    from tools.readback import verify_sample
+except ImportError:  # run as a script: tools/ itself is on sys.path
+    from overwrite import OverwriteEngine
+    from readback import verify_sample
+
+def print_progress(p):
+    # One JSON line per update; the agent's orchestrator streams these live.
+    print(json.dumps({'progress': p}), flush=True)
+
+def wipe_device(device='/dev/sdX', passes=1, dry_run=True, engine='native', block_size=4 << 20,
+                direct=False, zero_pass=False, progress=None, verify=True, verify_confidence=0.99,
+                verify_max_bad=0.001, sector_size=4096):
     start = time.time()
     result = {'platform':'linux','device':device,'passes':passes,'status':'FAILED'}
     if dry_run:
         result.update({'status':'DRY-RUN','note':'No destructive action performed'})
         return result
     try:
-        cmd = ['shred','-v','-n',str(passes),device]
-        subprocess.run(cmd, check=True)
-        result.update({'status':'SUCCESS','duration_sec': round(time.time()-start,2)})
+        if engine == 'shred':
+            cmd = ['shred','-v','-n',str(passes)] + (['-z'] if zero_pass else []) + [device]
+            subprocess.run(cmd, check=True)
+        else:
+            eng = OverwriteEngine(device, block_size=block_size, direct=direct, progress=progress)
+            try:
+                result['overwrite'] = eng.wipe(passes=passes, zero_pass=zero_pass)
+            finally:
+                eng.close()
+            if verify:
+                result['verification'] = verify_sample(device, result['overwrite']['final_pattern'], sector_size,
+                                                       verify_confidence, verify_max_bad)
+        if result.get('verification', {}).get('status') == 'FAILED':
+            result.update({'status':'FAILED','error':'read-back verification found unwritten sectors',
+                           'duration_sec': round(time.time()-start,2)})
+            return result
+        result.update({'status':'SUCCESS','engine':engine,'duration_sec': round(time.time()-start,2)})
     except Exception as e:
         result.update({'status':'FAILED','error':str(e)})
     return result
+
+if __name__ == '__main__':
+    # Invoked by the agent with keyword arguments as JSON in WIPE_PARAMS; prints the result as one JSON line.
+    import json, os, sys, inspect
+    params = json.loads(os.environ.get('WIPE_PARAMS') or '{}')
+    accepted = inspect.signature(wipe_device).parameters
+    kwargs = {k: v for k, v in params.items() if k in accepted and k != 'progress'}
+    res = wipe_device(progress=print_progress, **kwargs)
+    print(json.dumps(res), flush=True)
+    sys.exit(0 if res.get('status') in ('SUCCESS', 'DRY-RUN') else 1)
@@ -30,3 +30,12 @@ def wipe_device(drive='C', mode='free_space', dry_run=True):
         result.update({'status':'FAILED','error':str(e)})
     result['duration_sec'] = round(time.time()-start,2)
     return result
+
+if __name__ == '__main__':
+    # Invoked by the agent with keyword arguments as JSON in WIPE_PARAMS; prints the result as one JSON line.
+    import json, os, sys, inspect
+    params = json.loads(os.environ.get('WIPE_PARAMS') or '{}')
+    accepted = inspect.signature(wipe_device).parameters
+    res = wipe_device(**{k: v for k, v in params.items() if k in accepted})
+    print(json.dumps(res), flush=True)
+    sys.exit(0 if res.get('status') in ('SUCCESS', 'DRY-RUN') else 1)
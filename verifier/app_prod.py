@@ -1,14 +1,20 @@
 #!/usr/bin/env python3
-import os, json, logging
-from flask import Flask, request, jsonify, send_file
+import time
+_IMPORT_STARTED = time.perf_counter()  # boot timing, see verifier.startup.BootTimer
+import os, json, logging, hashlib, binascii, threading
+from flask import Flask, request, jsonify, send_file, Response
 from functools import wraps
-from cryptography.hazmat.primitives import serialization, hashes
+from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.asymmetric import padding
-from cryptography.hazmat.backends import default_backend
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from mongoengine import connect
-from verifier.models import Receipt
+from cryptography.exceptions import InvalidSignature
+from verifier.models import Receipt, SigningBatch, canonical_bytes
+from verifier.merkle import batch_statement, root_from_proof
+from verifier.cache import TTLCache
+from verifier.blobstore import make_store
+from verifier.auth import APIKeySet
+from verifier import metrics, ratelimit, startup
 
 # --- Logging ---
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
@@ -16,19 +22,52 @@ logger = logging.getLogger("verifier_prod")
 
 # --- Flask App ---
 app = Flask(__name__)
+metrics.instrument_flask(app)
 
 # --- Environment Variables ---
 MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017/securewipe")
-VERIFIER_API_KEY = os.environ.get("VERIFIER_API_KEY", "changeme")
+# No default: without a key (or hash) configured every protected route answers
+# 401 and /readyz stays 503. More keys (comma separated) for rotation; *_HASHES
+# takes sha256 hex digests so the keys themselves need not be in the environment.
+VERIFIER_API_KEY = os.environ.get("VERIFIER_API_KEY", "").strip()
+VERIFIER_API_KEYS = [k.strip() for k in os.environ.get("VERIFIER_API_KEYS", "").split(",") if k.strip()]
+VERIFIER_API_KEY_HASHES = [h.strip() for h in os.environ.get("VERIFIER_API_KEY_HASHES", "").split(",") if h.strip()]
 VERIFIER_PUBKEY_PATH = os.environ.get("VERIFIER_PUBKEY_PATH", "/app/public.pem")
 RATE_LIMIT_STORAGE = os.environ.get("VERIFIER_RATE_LIMIT_STORAGE", "redis://securewipe-redis:6379/0")
 RATE_LIMIT_DEFAULT = os.environ.get("VERIFIER_RATE_LIMIT", "60 per minute")
+# Redis limits are decided in process and reconciled in batches (verifier.ratelimit)
+RATE_LIMIT_HYBRID = os.environ.get("VERIFIER_RATE_LIMIT_HYBRID", "1") in ("1", "true", "yes")
+RATE_LIMIT_SYNC_INTERVAL = float(os.environ.get("VERIFIER_RATE_LIMIT_SYNC_INTERVAL", "0.25"))
+# When set, PDFs are handed to nginx via X-Accel-Redirect: files under
+# PDF_ROOT are served from the internal location PDF_ACCEL_PREFIX.
+PDF_ACCEL_PREFIX = os.environ.get("VERIFIER_PDF_ACCEL_PREFIX", "")
+PDF_ROOT = os.environ.get("VERIFIER_PDF_ROOT", "/app/data/pdfs")
+# Content-addressed PDF store written by the devapi: a directory or s3://bucket/prefix
+RECEIPT_STORE = os.environ.get("RECEIPT_STORE", PDF_ROOT)
+PDF_MAX_AGE = int(os.environ.get("VERIFIER_PDF_MAX_AGE", "3600"))
+VERIFY_CACHE_SIZE = int(os.environ.get("VERIFIER_VERIFY_CACHE_SIZE", "10000"))
+VERIFY_CACHE_TTL = float(os.environ.get("VERIFIER_VERIFY_CACHE_TTL", "600"))
+# /debug/profile starts off unless enabled; PUT /debug/profiler flips it
+PROFILER_ENABLED = os.environ.get("PROFILER_ENABLED", "0") in ("1", "true", "yes")
+# Runtime PUTs to the switch are refused unless this is set; any valid caller could otherwise turn it on
+PROFILER_SWITCH = os.environ.get("PROFILER_SWITCH", "0") in ("1", "true", "yes")
+ROOT_CACHE_SIZE = int(os.environ.get("VERIFIER_ROOT_CACHE_SIZE", "1024"))
+VERIFY_BATCH_MAX = int(os.environ.get("VERIFIER_VERIFY_BATCH_MAX", "100"))
 
-# --- MongoDB Setup ---
-connect(host=MONGO_URI)
+# --- MongoDB Setup (connects on first use; pool and timeouts from MONGO_* env) ---
+metrics.register_mongo()
+startup.connect_mongo(MONGO_URI)
+boot = startup.BootTimer(_IMPORT_STARTED)
+
+receipt_store = make_store(RECEIPT_STORE)
 
 # --- Limiter Setup ---
 def pick_rate_limit_storage():
+    hybrid = RATE_LIMIT_HYBRID and ratelimit.hybrid_uri(RATE_LIMIT_STORAGE)
+    if hybrid:
+        # no startup ping: it limits per process until Redis answers, then reconciles
+        logger.info("Using hybrid rate limiting against %s", RATE_LIMIT_STORAGE)
+        return hybrid
     try:
         if RATE_LIMIT_STORAGE.startswith("redis://"):
             import redis
@@ -40,14 +79,31 @@ def pick_rate_limit_storage():
         logger.warning("Redis not available for limiter, falling back to memory: %s", e)
     return "memory://"
 
+rate_limited = metrics.REGISTRY.counter("rate_limit_rejections_total", "Requests rejected by the rate limiter")
+
+def _on_rate_limited(limit):
+    rate_limited.inc(route=request.url_rule.rule if request.url_rule else "<unmatched>", limit=str(limit.limit))
+
+_limiter_uri = pick_rate_limit_storage()
+
 limiter = Limiter(
     key_func=get_remote_address,
     default_limits=[RATE_LIMIT_DEFAULT],
-    storage_uri=pick_rate_limit_storage(),
+    storage_uri=_limiter_uri,
+    storage_options={"sync_interval": RATE_LIMIT_SYNC_INTERVAL} if _limiter_uri.startswith("hybrid+") else {},
+    on_breach=_on_rate_limited,
 )
 limiter.init_app(app)
 
 # --- API Key Auth ---
+api_keys = APIKeySet(([VERIFIER_API_KEY] if VERIFIER_API_KEY else []) + VERIFIER_API_KEYS, VERIFIER_API_KEY_HASHES)
+if not len(api_keys):
+    logger.error("No VERIFIER_API_KEY / VERIFIER_API_KEYS / VERIFIER_API_KEY_HASHES set: API routes stay closed")
+
+def _check_api_keys():
+    if not len(api_keys):
+        raise RuntimeError("no API key configured")
+
 def require_api_key(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -57,30 +113,277 @@ def require_api_key(f):
             key = auth.split(None, 1)[1]
         if not key:
             key = request.headers.get("X-API-KEY", None)
-        if not key or key != VERIFIER_API_KEY:
+        if not api_keys.check(key):
             return jsonify({"error": "unauthorized"}), 401
         return f(*args, **kwargs)
     return decorated
 
+# --- Signature verification ---
+_public_key = None
+_public_key_lock = threading.Lock()
+
+def get_public_key():
+    global _public_key
+    if _public_key is None:
+        with _public_key_lock:
+            if _public_key is None:
+                from cryptography.hazmat.primitives import serialization
+                from cryptography.hazmat.backends import default_backend
+                with open(VERIFIER_PUBKEY_PATH, "rb") as f:
+                    _public_key = serialization.load_pem_public_key(f.read(), backend=default_backend())
+                logger.info("Loaded verification key from %s", VERIFIER_PUBKEY_PATH)
+    return _public_key
+
+# (job_id, digest of everything the verdict depends on) -> verification result.
+# Receipts are written by the devapi, so nothing here would see a change; a
+# receipt it re-signs or rewrites gets a new key instead, and a deleted one
+# is not found before the cache is consulted.
+verify_cache = TTLCache(maxsize=VERIFY_CACHE_SIZE, ttl=VERIFY_CACHE_TTL)
+
+# (batch_id, sha256(signature)) -> Merkle root whose batch signature checked out.
+# Batches are immutable, so one RSA verification serves every receipt in them;
+# a batch deleted from the database keeps verifying for up to VERIFY_CACHE_TTL.
+root_cache = TTLCache(maxsize=ROOT_CACHE_SIZE, ttl=VERIFY_CACHE_TTL)
+
+def _verify_key(r, signed):
+    h = hashlib.sha256(r.signature.encode())
+    for part in [signed, (r.batch_id or "").encode()] + [p.encode() for p in r.merkle_proof or []]:
+        h.update(b"\0" + part)
+    return (r.job_id, h.hexdigest())
+
+def _rsa_valid(signature_hex, data):
+    try:
+        with metrics.timed("verify.rsa"):
+            get_public_key().verify(binascii.unhexlify(signature_hex), data, padding.PKCS1v15(), hashes.SHA256())
+        return True
+    except (InvalidSignature, binascii.Error, ValueError):
+        return False
+
+def verified_batch_root(batch_id, signature):
+    """Root of batch_id if `signature` is its valid batch signature, else None."""
+    key = (batch_id, hashlib.sha256(signature.encode()).hexdigest())
+    root = root_cache.get(key)
+    if root is not None:
+        return root
+    b = SigningBatch.objects(batch_id=batch_id).only("batch_id", "root", "size", "signature").first()
+    if not b or b.signature != signature:
+        return None
+    if not _rsa_valid(signature, canonical_bytes(batch_statement(b.batch_id, b.root, b.size))):
+        return None
+    root_cache.set(key, b.root)
+    return b.root
+
+def verify_receipt(r):
+    """Check r's signed bytes against r.signature (directly, or via its Merkle
+    proof and batch signature), consulting the cache first."""
+    if not r.signature:
+        return {"job_id": r.job_id, "valid": False, "reason": "unsigned"}
+    signed = r.signed_bytes()
+    if not signed:
+        return {"job_id": r.job_id, "valid": False, "reason": "unsigned"}
+    key = _verify_key(r, signed)
+    result = verify_cache.get(key)
+    if result is not None:
+        return result
+    if r.batch_id:
+        root = verified_batch_root(r.batch_id, r.signature)
+        if root is None:
+            result = {"job_id": r.job_id, "valid": False, "reason": "bad_signature", "batch_id": r.batch_id}
+        else:
+            try:
+                in_batch = root_from_proof(signed, r.merkle_proof or []).hex() == root
+            except ValueError:
+                in_batch = False
+            result = {"job_id": r.job_id, "valid": in_batch, "batch_id": r.batch_id}
+            if not in_batch:
+                result["reason"] = "not_in_batch"
+    elif _rsa_valid(r.signature, signed):
+        result = {"job_id": r.job_id, "valid": True}
+    else:
+        result = {"job_id": r.job_id, "valid": False, "reason": "bad_signature"}
+    verify_cache.set(key, result)
+    return result
+
+_VERIFY_FIELDS = ("job_id", "signature", "signed_blob", "signed_json", "batch_id", "merkle_proof")
+
 # --- Routes ---
+metrics.REGISTRY.gauge("verify_cache_entries", "Cached verification results", fn=lambda: len(verify_cache))
+profiler = metrics.SamplingProfiler(enabled=PROFILER_ENABLED)
+
+# --- Readiness: each check also warms its dependency (run off the request path) ---
+def _warm_redis():
+    startup.redis_ping(RATE_LIMIT_STORAGE)
+
+readiness = startup.Readiness(on_ready=lambda: boot.mark("ready"))
+readiness.add("mongo", startup.mongo_ping)
+readiness.add("public_key", get_public_key)
+readiness.add("api_keys", _check_api_keys)
+if RATE_LIMIT_STORAGE.startswith(("redis://", "rediss://")):
+    # the limiter keeps answering without Redis: reported, not required
+    readiness.add("redis", _warm_redis, required=False)
+
+_created = False
+_create_lock = threading.Lock()
+
+def create_app():
+    """WSGI entry point: gunicorn "verifier.app_prod:create_app()".
+
+    Importing this module opens no connections; this starts the readiness
+    warm-up (Mongo, public key, Redis) in the background and returns the app.
+    """
+    global _created
+    with _create_lock:
+        if not _created:
+            _created = True
+            readiness.refresh_async()
+            boot.mark("create_app")
+    return app
+
 @app.route("/healthz")
 def healthz():
     return jsonify({"status": "ok"})
 
+@app.route("/livez")
+@limiter.exempt
+def livez():
+    return jsonify({"status": "ok"})
+
+@app.route("/readyz")
+@limiter.exempt
+def readyz():
+    ready, checks = readiness.status()
+    return jsonify({"ready": ready, "checks": checks, "boot_seconds": boot.phases}), 200 if ready else 503
+
+@app.route("/metrics")
+@limiter.exempt
+def prometheus_metrics():
+    return Response(metrics.REGISTRY.render(), mimetype=metrics.CONTENT_TYPE)
+
+@app.route("/debug/profile", methods=["POST"])
+@require_api_key
+def debug_profile():
+    # Samples all threads for ?seconds=N and returns collapsed stacks (flamegraph input).
+    if not profiler.enabled:
+        return jsonify({"error": "profiler_disabled"}), 404
+    try:
+        seconds = min(max(float(request.args.get("seconds", 10)), 0.1), profiler.max_seconds)
+    except ValueError:
+        return jsonify({"error": "invalid_seconds"}), 400
+    try:
+        stacks = profiler.profile(seconds)
+    except RuntimeError:
+        return jsonify({"error": "profile_in_progress"}), 409
+    return Response(stacks, mimetype="text/plain")
+
+@app.route("/debug/profiler", methods=["GET", "PUT"])
+@require_api_key
+def debug_profiler_switch():
+    # Turns /debug/profile on or off at runtime. The switch is per worker
+    # process (as is what a profile samples); PROFILER_ENABLED sets it at start.
+    if request.method == "PUT":
+        if not PROFILER_SWITCH:
+            return jsonify({"error": "profiler_switch_disabled"}), 403
+        enabled = (request.get_json(silent=True) or {}).get("enabled")
+        if not isinstance(enabled, bool):
+            return jsonify({"error": "enabled_must_be_bool"}), 400
+        profiler.enabled = enabled
+        logger.info("Profiler %s", "enabled" if enabled else "disabled")
+    return jsonify({"enabled": profiler.enabled, "pid": os.getpid()})
+
+def receipt_etag(signature):
+    # The PDF is rendered from the signed payload, so the signature pins its content.
+    return hashlib.sha256(signature.encode()).hexdigest()[:32]
+
+def _accel_path(pdf_path):
+    rel = os.path.relpath(os.path.abspath(pdf_path), os.path.abspath(PDF_ROOT))
+    if rel.startswith(".."):
+        return None
+    return PDF_ACCEL_PREFIX.rstrip("/") + "/" + rel.replace(os.sep, "/")
+
 @app.route("/receipts/<string:rid>.pdf", methods=["GET"])
 @require_api_key
 def get_receipt_pdf(rid):
-    r = Receipt.objects(job_id=rid).first()  # you can also use id=rid if you prefer int IDs
-    if not r or not r.pdf_path:
+    r = Receipt.objects(job_id=rid).only("pdf_hash", "pdf_path", "job_id", "signature").first()  # you can also use id=rid if you prefer int IDs
+    if not r or not (r.pdf_hash or r.pdf_path):
         return jsonify({"error": "not_found"}), 404
-    if not os.path.exists(r.pdf_path):
+    if r.pdf_hash:
+        # The store key is the SHA-256 of the file: the strongest ETag there is.
+        etag = r.pdf_hash
+        pdf_path = receipt_store.path(r.pdf_hash)  # None for object stores
+    else:
+        etag = receipt_etag(r.signature) if r.signature else None
+        pdf_path = r.pdf_path
+    if etag and etag in request.if_none_match:
+        # Answer revalidation without touching the filesystem.
+        resp = app.response_class(status=304)
+        resp.set_etag(etag)
+        return resp
+    download_name = f"securewipe_{r.job_id}.pdf"
+    accel = _accel_path(pdf_path) if PDF_ACCEL_PREFIX and pdf_path else None
+    if accel:
+        # nginx streams the file (and handles Range); the worker is freed immediately.
+        resp = app.response_class(mimetype="application/pdf")
+        resp.headers["X-Accel-Redirect"] = accel
+        resp.headers["Content-Disposition"] = f'attachment; filename="{download_name}"'
+        if etag:
+            resp.set_etag(etag)
+        return resp
+    try:
+        # conditional=True gives If-None-Match/If-Modified-Since and Range (206) handling.
+        with metrics.timed("pdf.send_file"):
+            resp = send_file(
+                pdf_path or receipt_store.open(r.pdf_hash),
+                mimetype="application/pdf",
+                as_attachment=True,
+                download_name=download_name,
+                etag=etag if etag else True,
+                conditional=True,
+                max_age=PDF_MAX_AGE,
+            )
+    except FileNotFoundError:
+        return jsonify({"error": "not_found"}), 404
+    # Receipts sit behind an API key: browsers may cache them, shared caches may not.
+    resp.cache_control.public = False
+    resp.cache_control.private = True
+    return resp
+
+@app.route("/receipts/verify", methods=["GET"])
+def verify_receipt_get():
+    job_id = request.args.get("job_id", "")
+    if not job_id:
+        return jsonify({"error": "job_id_required"}), 400
+    r = Receipt.objects(job_id=job_id).only(*_VERIFY_FIELDS).first()
+    if not r:
         return jsonify({"error": "not_found"}), 404
-    return send_file(
-        r.pdf_path,
-        mimetype="application/pdf",
-        as_attachment=True,
-        download_name=f"securewipe_{r.job_id}.pdf",
-    )
+    try:
+        return jsonify(verify_receipt(r))
+    except OSError:
+        logger.exception("Verification key unavailable")
+        return jsonify({"error": "verifier_unavailable"}), 503
+
+@app.route("/receipts/verify", methods=["POST"])
+@require_api_key
+def verify_receipts_bulk():
+    p = request.get_json(force=True, silent=True) or {}
+    job_ids = p.get("job_ids")
+    if not isinstance(job_ids, list) or not job_ids:
+        return jsonify({"error": "job_ids_required"}), 400
+    if not all(isinstance(j, str) and j for j in job_ids):
+        return jsonify({"error": "invalid_job_ids"}), 400
+    if len(job_ids) > VERIFY_BATCH_MAX:
+        return jsonify({"error": "too_many_job_ids", "max": VERIFY_BATCH_MAX}), 400
+    found = {r.job_id: r for r in Receipt.objects(job_id__in=job_ids).only(*_VERIFY_FIELDS)}
+    try:
+        results = [
+            verify_receipt(found[j]) if j in found else {"job_id": j, "valid": False, "reason": "not_found"}
+            for j in job_ids
+        ]
+    except OSError:
+        logger.exception("Verification key unavailable")
+        return jsonify({"error": "verifier_unavailable"}), 503
+    return jsonify({"results": results})
+
+boot.mark("import")
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))
+    create_app().run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))
@@ -0,0 +1,28 @@
+import hmac
+import hashlib
+
+
+class APIKeySet:
+    """Accepted API keys, held only as SHA-256 digests.
+
+    check() hashes the presented key and compares it with every digest using
+    hmac.compare_digest, without stopping at the first match, so the time it
+    takes does not depend on how much of a key matched or which key it was.
+    """
+
+    def __init__(self, keys=(), hashes=()):
+        digests = [hashlib.sha256(k.encode()).digest() for k in keys if k]
+        digests += [bytes.fromhex(h) for h in hashes if h]
+        self._digests = tuple(digests)
+
+    def check(self, key):
+        if not key:
+            return False
+        digest = hashlib.sha256(key.encode()).digest()
+        ok = False
+        for d in self._digests:
+            ok |= hmac.compare_digest(digest, d)
+        return ok
+
+    def __len__(self):
+        return len(self._digests)
@@ -0,0 +1,143 @@
+"""Content-addressed receipt blob store.
+
+Blobs (certificate PDFs) are stored under the hex SHA-256 of their bytes, so
+the key is also the integrity check and the HTTP ETag. Putting bytes that
+are already stored is a no-op, which together with deterministic rendering
+makes re-rendering an unchanged receipt free.
+
+    LocalBlobStore   <root>/ab/cd/abcd...ef.pdf, written to a temp file in
+                     <root>/.tmp and renamed into place (atomic, so readers
+                     and concurrent writers never see a partial file)
+    S3BlobStore      s3://bucket/prefix/ab/cd/abcd...ef.pdf on any
+                     S3-compatible endpoint (boto3, optional dependency)
+
+make_store() picks one from a URI: a path or file:// URI, or s3://bucket/prefix
+(endpoint from S3_ENDPOINT_URL, credentials the usual boto3 way).
+"""
+import io
+import os
+import hashlib
+import tempfile
+from urllib.parse import urlparse
+
+
+def content_key(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _check_key(key):
+    if len(key) != 64 or any(c not in "0123456789abcdef" for c in key):
+        raise ValueError(f"not a sha256 blob key: {key!r}")
+    return key
+
+
+class LocalBlobStore:
+    def __init__(self, root, suffix=".pdf"):
+        self.root = root
+        self.suffix = suffix
+        self._tmp = os.path.join(root, ".tmp")
+
+    def relpath(self, key):
+        _check_key(key)
+        return f"{key[:2]}/{key[2:4]}/{key}{self.suffix}"
+
+    def path(self, key):
+        """Filesystem path of a blob (whether or not it exists)."""
+        return os.path.join(self.root, *self.relpath(key).split("/"))
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def put(self, data):
+        """Store bytes; returns their key. Already-stored content is not rewritten."""
+        key = content_key(data)
+        final = self.path(key)
+        if os.path.exists(final):
+            return key
+        os.makedirs(os.path.dirname(final), exist_ok=True)
+        os.makedirs(self._tmp, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self._tmp)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, final)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except FileNotFoundError:
+                pass
+            raise
+        return key
+
+    def open(self, key):
+        return open(self.path(key), "rb")
+
+    def get(self, key):
+        with self.open(key) as f:
+            return f.read()
+
+
+class S3BlobStore:
+    def __init__(self, bucket, prefix="", client=None, suffix=".pdf", content_type="application/pdf"):
+        if client is None:
+            import boto3
+            client = boto3.client("s3", endpoint_url=os.environ.get("S3_ENDPOINT_URL") or None)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.suffix = suffix
+        self.content_type = content_type
+
+    def relpath(self, key):
+        _check_key(key)
+        rel = f"{key[:2]}/{key[2:4]}/{key}{self.suffix}"
+        return f"{self.prefix}/{rel}" if self.prefix else rel
+
+    def path(self, key):
+        return None
+
+    def exists(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.relpath(key))
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def put(self, data):
+        key = content_key(data)
+        if not self.exists(key):
+            # A single PUT is atomic on S3: the object is either absent or complete.
+            self.client.put_object(Bucket=self.bucket, Key=self.relpath(key), Body=data,
+                                   ContentType=self.content_type)
+        return key
+
+    def open(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            obj = self.client.get_object(Bucket=self.bucket, Key=self.relpath(key))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                raise FileNotFoundError(key) from e
+            raise
+        # Certificates are a few KB; a seekable buffer keeps Range handling simple.
+        return io.BytesIO(obj["Body"].read())
+
+    def get(self, key):
+        return self.open(key).read()
+
+
+def make_store(uri):
+    parsed = urlparse(uri or "")
+    if parsed.scheme == "s3":
+        return S3BlobStore(parsed.netloc, parsed.path)
+    if parsed.scheme == "file":
+        return LocalBlobStore(parsed.path)
+    if parsed.scheme:
+        raise ValueError(f"unsupported blob store URI: {uri}")
+    return LocalBlobStore(uri)
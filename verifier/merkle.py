@@ -0,0 +1,57 @@
+"""Merkle trees for batched receipt signing.
+
+A batch of receipts is hashed into a binary SHA-256 tree (leaves and inner
+nodes domain-separated as in RFC 6962: 0x00 || leaf, 0x01 || left || right;
+an unpaired node is carried up unchanged) and only a statement naming the
+root is RSA-signed. Each receipt keeps its audit path, a list of
+"L:<hex>" / "R:<hex>" steps giving the sibling hash and which side it sits
+on, so it can be checked on its own against the batch signature.
+"""
+import hashlib
+
+ALG = "sha256-merkle-v1"
+
+
+def leaf_hash(data: bytes) -> bytes:
+    return hashlib.sha256(b"\x00" + data).digest()
+
+
+def node_hash(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+
+def build_tree(items):
+    """Hash `items` (bytes) into a tree; returns (root, proofs) with one proof per item."""
+    level = [leaf_hash(item) for item in items]
+    if not level:
+        raise ValueError("cannot build a Merkle tree over no items")
+    proofs = [[] for _ in level]
+    positions = list(range(len(level)))
+    while len(level) > 1:
+        for leaf, pos in enumerate(positions):
+            sibling = pos ^ 1
+            if sibling < len(level):
+                proofs[leaf].append(("L:" if sibling < pos else "R:") + level[sibling].hex())
+            positions[leaf] = pos // 2
+        level = [node_hash(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+                 for i in range(0, len(level), 2)]
+    return level[0], proofs
+
+
+def root_from_proof(item: bytes, proof) -> bytes:
+    node = leaf_hash(item)
+    for step in proof:
+        side, _, sibling = step.partition(":")
+        sibling = bytes.fromhex(sibling)
+        if side == "L":
+            node = node_hash(sibling, node)
+        elif side == "R":
+            node = node_hash(node, sibling)
+        else:
+            raise ValueError(f"bad proof step: {step!r}")
+    return node
+
+
+def batch_statement(batch_id, root_hex, size):
+    """What gets RSA-signed for a batch (signed as canonical JSON, like a receipt payload)."""
+    return {"alg": ALG, "batch_id": batch_id, "root": root_hex, "size": size}
@@ -0,0 +1,261 @@
+"""Prometheus-style metrics without a client library.
+
+Counters, gauges and histograms live in a Registry and are rendered in the
+Prometheus text format (0.0.4) by the services' /metrics routes. Values are
+per process: with several gunicorn workers each one reports its own, so
+scrape them with a `pid` relabel or aggregate in the query.
+
+    with timed("pdf.render"): ...          # or  @timed("signer.sign")
+
+records into securewipe_stage_seconds{stage="..."}. Also here:
+MongoCommandTimer (pymongo command monitoring, so every query is timed
+without touching call sites), instrument_flask (per-route latency) and
+SamplingProfiler (collapsed stacks from sys._current_frames, on demand).
+"""
+import os
+import sys
+import time
+import bisect
+import threading
+from collections import Counter as _Tally
+from contextlib import ContextDecorator
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class CounterMetric(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = list(self._values.items())
+        return self._header() + [f"{self.name}{_labels(k)} {v}" for k, v in items]
+
+
+class GaugeMetric(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help_text, fn=None):
+        super().__init__(name, help_text)
+        self.fn = fn
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+    def render(self):
+        if self.fn is not None:
+            try:
+                self.set(self.fn())
+            except Exception:
+                pass  # keep the last value; a broken callback must not break /metrics
+        with self._lock:
+            items = list(self._values.items())
+        return self._header() + [f"{self.name}{_labels(k)} {v}" for k, v in items]
+
+
+class HistogramMetric(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        with self._lock:
+            items = [(k, (list(c), s, n)) for k, (c, s, n) in self._values.items()]
+        lines = self._header()
+        for key, (counts, total, n) in items:
+            running = 0
+            for bound, count in zip(self.buckets, counts):
+                running += count
+                lines.append(f"{self.name}_bucket{_labels(key + (('le', repr(bound)),))} {running}")
+            lines.append(f"{self.name}_bucket{_labels(key + (('le', '+Inf'),))} {n}")
+            lines.append(f"{self.name}_sum{_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_labels(key)} {n}")
+        return lines
+
+
+class Registry:
+    def __init__(self, prefix="securewipe_"):
+        self.prefix = prefix
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, **kwargs):
+        name = self.prefix + name
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, **kwargs)
+            return metric
+
+    def counter(self, name, help_text=""):
+        return self._get(CounterMetric, name, help_text)
+
+    def gauge(self, name, help_text="", fn=None):
+        gauge = self._get(GaugeMetric, name, help_text)
+        if fn is not None:
+            gauge.fn = fn
+        return gauge
+
+    def histogram(self, name, help_text="", buckets=DEFAULT_BUCKETS):
+        return self._get(HistogramMetric, name, help_text, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+STAGES = REGISTRY.histogram("stage_seconds", "Time spent in instrumented stages (signing, rendering, ...)")
+
+
+class timed(ContextDecorator):
+    """Time a block or function into securewipe_stage_seconds{stage=...} (or `histogram`)."""
+
+    def __init__(self, stage, histogram=None, **labels):
+        self.histogram = histogram or STAGES
+        self.labels = dict(labels, stage=stage) if histogram is None else labels
+        self._local = threading.local()
+
+    def __enter__(self):
+        starts = getattr(self._local, "starts", None)
+        if starts is None:
+            starts = self._local.starts = []
+        starts.append(time.perf_counter())  # a stack, so recursion / reuse as a decorator is safe
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self._local.starts.pop()
+        self.histogram.observe(elapsed, **self.labels)
+        return False
+
+
+class MongoCommandTimer:
+    """pymongo CommandListener timing every command by name; register before connect()."""
+
+    def __init__(self, registry=REGISTRY):
+        self.seconds = registry.histogram("mongo_command_seconds", "MongoDB command latency")
+        self.failures = registry.counter("mongo_command_failures_total", "Failed MongoDB commands")
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.seconds.observe(event.duration_micros / 1e6, command=event.command_name)
+
+    def failed(self, event):
+        self.seconds.observe(event.duration_micros / 1e6, command=event.command_name)
+        self.failures.inc(command=event.command_name)
+
+
+def register_mongo(registry=REGISTRY):
+    from pymongo import monitoring
+
+    class _Listener(MongoCommandTimer, monitoring.CommandListener):
+        pass
+
+    monitoring.register(_Listener(registry))
+
+
+def instrument_flask(app, registry=REGISTRY):
+    """Per-route request latency and counts. Streaming responses are timed to their headers."""
+    from flask import g, request
+
+    latency = registry.histogram("http_request_seconds", "Request latency by route")
+    requests_total = registry.counter("http_requests_total", "Requests by route and status")
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record(response):
+        start = g.pop("_metrics_start", None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule else "<unmatched>"
+            latency.observe(time.perf_counter() - start, route=route, method=request.method)
+            requests_total.inc(route=route, method=request.method, status=response.status_code)
+        return response
+
+
+class SamplingProfiler:
+    """Samples every thread's stack at `interval` for a while; returns collapsed stacks
+    ("frame;frame;frame count" per line, the input flamegraph.pl / speedscope take).
+
+    `enabled` is only a switch for the debug routes to check; it can be flipped
+    at runtime and belongs to this process alone.
+    """
+
+    def __init__(self, interval=0.005, max_seconds=60, enabled=False):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.enabled = enabled
+        self._running = threading.Lock()
+
+    def profile(self, seconds):
+        if not self._running.acquire(blocking=False):
+            raise RuntimeError("a profile is already running")
+        try:
+            me = threading.get_ident()
+            stacks = _Tally()
+            deadline = time.monotonic() + min(seconds, self.max_seconds)
+            while time.monotonic() < deadline:
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    parts = []
+                    while frame is not None:
+                        code = frame.f_code
+                        parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                        frame = frame.f_back
+                    stacks[";".join(reversed(parts))] += 1
+                time.sleep(self.interval)
+            return "".join(f"{stack} {n}\n" for stack, n in stacks.most_common())
+        finally:
+            self._running.release()
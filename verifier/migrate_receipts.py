@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""Convert v1 receipts (JSON text fields) to the v2 schema in batches.
+
+USAGE:
+  MONGO_URI=mongodb://localhost:27017/securewipe python3 -m verifier.migrate_receipts --batch-size 500
+"""
+import os, argparse, logging
+from bson import Binary
+from pymongo import UpdateOne
+from mongoengine import connect
+from verifier.models import Receipt, SCHEMA_VERSION, upgrade_v1_fields
+
+logger = logging.getLogger("migrate_receipts")
+
+_V1_FIELDS = ("device", "raw_payload", "signed_json", "payload", "signed_blob")
+
+def migrate(batch_size=500, dry_run=False):
+    coll = Receipt._get_collection()
+    query = {"schema_version": {"$ne": SCHEMA_VERSION}}
+    last_id, converted = None, 0
+    while True:
+        q = dict(query, _id={"$gt": last_id}) if last_id is not None else query
+        batch = list(coll.find(q, {f: 1 for f in _V1_FIELDS}).sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+        ops = []
+        for doc in batch:
+            upgrade_v1_fields(doc)
+            update = {"$set": {"schema_version": SCHEMA_VERSION}, "$unset": {}}
+            for f in ("device", "payload"):
+                if doc.get(f) is not None:
+                    update["$set"][f] = doc[f]
+            if doc.get("signed_blob") is not None:
+                update["$set"]["signed_blob"] = Binary(doc["signed_blob"])
+            for f in ("raw_payload", "signed_json"):
+                if doc.get(f) is None:
+                    update["$unset"][f] = ""
+            if not update["$unset"]:
+                del update["$unset"]
+            ops.append(UpdateOne({"_id": doc["_id"]}, update))
+        if not dry_run:
+            coll.bulk_write(ops, ordered=False)
+        converted += len(ops)
+        last_id = batch[-1]["_id"]
+        logger.info("%s %d receipts (last _id %s)", "Would convert" if dry_run else "Converted", converted, last_id)
+    return converted
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    p = argparse.ArgumentParser()
+    p.add_argument("--batch-size", type=int, default=500)
+    p.add_argument("--dry-run", action="store_true")
+    args = p.parse_args()
+    connect(host=os.environ.get("MONGO_URI", os.environ.get("MONGO_URL", "mongodb://localhost:27017/securewipe")))
+    n = migrate(args.batch_size, args.dry_run)
+    logger.info("Done: %d receipts %s", n, "would be converted" if args.dry_run else "converted")
@@ -1,21 +1,173 @@
-from mongoengine import Document, StringField, DateTimeField
+from mongoengine import Document, StringField, DateTimeField, DictField, BinaryField, IntField, ListField, BooleanField
 import datetime
+import json
+import zlib
+
+SCHEMA_VERSION = 2
+
+def canonical_bytes(payload):
+    # Must match tools.signer.canonical_bytes, which produces the signature input.
+    return json.dumps(payload, separators=(",", ":"), sort_keys=True).encode()
+
+def encode_signed(payload):
+    """Compact binary form of the signed payload: zlib-compressed canonical JSON."""
+    return zlib.compress(canonical_bytes(payload))
+
+def _loads(text, default=None):
+    try:
+        return json.loads(text)
+    except (TypeError, ValueError):
+        return default
 
 class Receipt(Document):
     """
     MongoEngine document for receipts. Uses MongoDB's default ObjectId as the primary key.
     The job_id field is unique and used throughout the application to lookup receipts.
+
+    Schema v2 keeps the reported payload once, as an embedded document, and the
+    signed form as compressed canonical bytes. v1 documents (JSON text in
+    device / raw_payload / signed_json) are upgraded on save, or in bulk with
+    `python -m verifier.migrate_receipts`.
     """
-    meta = {"collection": "receipts", "indexes": ["job_id"]}
+    meta = {
+        "collection": "receipts",
+        # Listing sorts newest first on (timestamp, _id); the trailing -_id
+        # keeps keyset pagination an index scan with no in-memory sort.
+        "indexes": [
+            "job_id",
+            ("-timestamp", "-_id"),
+            ("operator", "-timestamp", "-_id"),
+            ("status", "-timestamp", "-_id"),
+            "email",
+            ("status", "lease_expires"),
+            ("status", "finalize_at"),
+            ("agent_id", "status"),
+            {"fields": ["batch_id"], "sparse": True},
+        ],
+    }
 
     job_id = StringField(required=True, unique=True, max_length=128)
     operator = StringField(max_length=128)
-    device = StringField()  # long text supported
+    device = DictField()
     method = StringField(max_length=64)
     timestamp = DateTimeField(default=datetime.datetime.utcnow)
-    signature = StringField()
-    signed_json = StringField()
-    raw_payload = StringField()
-    pdf_path = StringField(max_length=512)
+    signature = StringField()  # per-receipt signature, or the batch signature when batch_id is set
+    batch_id = StringField(max_length=64)  # Merkle-batched signing: SigningBatch.batch_id
+    merkle_proof = ListField(StringField())  # audit path from this receipt's leaf to the batch root
+    evidence_id = StringField(max_length=64)  # EvidenceUpload.upload_id; the log itself is in GridFS
+    evidence_sha256 = StringField(max_length=64)  # of the uncompressed log, also in the signed payload
+    payload = DictField()
+    signed_blob = BinaryField()
+    pdf_hash = StringField(max_length=64)  # sha256 key in the receipt blob store (verifier.blobstore)
+    pdf_path = StringField(max_length=512)  # legacy: filesystem path, only on receipts rendered before pdf_hash
     status = StringField(default="created", max_length=32)
+    error = StringField(max_length=512)  # last pipeline failure, cleared on progress
+    finalize_at = DateTimeField()  # last time the pipeline queued or advanced this receipt (stale ones are re-queued)
+    finalize_attempts = IntField(default=0)  # failed pipeline runs; "finalize_failed" after ReceiptPipeline.max_attempts
     email = StringField(max_length=256)
+    agent_id = StringField(max_length=128)  # agent holding the job lease
+    lease_expires = DateTimeField()
+    progress = DictField()  # latest progress event reported by the agent
+    progress_at = DateTimeField()
+    schema_version = IntField(default=SCHEMA_VERSION)
+    # v1 fields, only present on documents that have not been migrated yet
+    signed_json = StringField()
+    raw_payload = StringField()
+
+    def clean(self):
+        upgrade_v1_fields(self)
+
+    def signed_bytes(self):
+        """Exact bytes the signature covers, or None if the receipt is unsigned."""
+        if self.signed_blob:
+            return zlib.decompress(self.signed_blob)
+        if self.signed_json:
+            return canonical_bytes(json.loads(self.signed_json))
+        return None
+
+def upgrade_v1_fields(doc):
+    """Move v1 JSON-text fields into their v2 shape (works on a Receipt or a raw dict)."""
+    get = doc.get if isinstance(doc, dict) else lambda k: getattr(doc, k, None)
+    put = doc.__setitem__ if isinstance(doc, dict) else lambda k, v: setattr(doc, k, v)
+    device = get("device")
+    if isinstance(device, str):
+        put("device", _loads(device, {"raw": device}) if device else {})
+    if get("raw_payload") is not None:
+        if not get("payload"):
+            put("payload", _loads(get("raw_payload"), {}))
+        put("raw_payload", None)
+    signed_json = get("signed_json")
+    if signed_json is not None:
+        signed = _loads(signed_json)
+        if signed is not None and not get("signed_blob"):
+            put("signed_blob", encode_signed(signed))
+        if signed is not None or not signed_json:
+            put("signed_json", None)
+    put("schema_version", SCHEMA_VERSION)
+
+class SigningBatch(Document):
+    """
+    One RSA signature covering many receipts: the signature is over
+    verifier.merkle.batch_statement(batch_id, root, size), and each member
+    receipt carries its Merkle proof to `root`.
+    """
+    meta = {"collection": "signing_batches", "indexes": ["batch_id"]}
+
+    batch_id = StringField(required=True, unique=True, max_length=64)
+    alg = StringField(max_length=32)
+    root = StringField(required=True, max_length=64)
+    size = IntField()
+    signature = StringField()
+    created_at = DateTimeField(default=datetime.datetime.utcnow)
+
+class EvidenceUpload(Document):
+    """
+    A resumable evidence upload (backend.evidence). The compressed log is
+    written straight into the GridFS "evidence" bucket, one chunk per
+    request, under files_id = upload_id; the GridFS file document is only
+    created once the upload is complete and its hash checked.
+    """
+    meta = {"collection": "evidence_uploads", "indexes": ["upload_id", "job_id", ("status", "updated_at")]}
+
+    upload_id = StringField(required=True, unique=True, max_length=64)
+    job_id = StringField(required=True, max_length=128)
+    encoding = StringField(default="gzip", max_length=16)
+    chunk_size = IntField(required=True)
+    received = IntField(default=0)  # compressed bytes stored so far
+    chunks = IntField(default=0)
+    sealed = BooleanField(default=False)  # a short (last) chunk has arrived
+    writer = StringField(max_length=32)  # claim of the PUT storing the chunk at `received`
+    writer_until = DateTimeField()
+    status = StringField(default="open", max_length=16)  # open / complete
+    sha256 = StringField(max_length=64)
+    size = IntField()  # uncompressed bytes
+    summary = DictField()
+    created_at = DateTimeField(default=datetime.datetime.utcnow)
+    updated_at = DateTimeField(default=datetime.datetime.utcnow)
+
+class EmailOutbox(Document):
+    """
+    Durable queue of outgoing emails. Rows are inserted by the devapi and
+    drained in batches by backend.outbox.OutboxSender; a failed send goes back
+    to "pending" with a later next_attempt_at until max attempts are used up.
+    """
+    meta = {
+        "collection": "email_outbox",
+        "indexes": [
+            ("status", "next_attempt_at"),
+            "job_id",
+        ],
+    }
+
+    to = StringField(required=True, max_length=256)
+    subject = StringField(max_length=256)
+    body = StringField()
+    attachment_path = StringField(max_length=512)
+    attachment_key = StringField(max_length=64)  # blob store key of the certificate PDF
+    job_id = StringField(max_length=128)
+    status = StringField(default="pending", max_length=16)  # pending / sending / sent / failed
+    attempts = IntField(default=0)
+    next_attempt_at = DateTimeField(default=datetime.datetime.utcnow)
+    last_error = StringField(max_length=512)
+    created_at = DateTimeField(default=datetime.datetime.utcnow)
+    sent_at = DateTimeField()
@@ -0,0 +1,246 @@
+"""Hybrid rate-limit storage: decide locally, reconcile with Redis in batches.
+
+Registered with `limits` for hybrid+redis:// and hybrid+rediss:// URIs, so
+flask-limiter picks it up via storage_uri like any other backend.
+
+The plain redis:// backend costs a Redis round trip (a Lua call) on every
+request, and both services used to drop to per-process memory:// for good
+if Redis was down when they started. Here every hit is counted in process
+and answered from memory as (last known count from the other processes,
+extrapolated at their rate over the last sync interval, + our own hits
+this window). A background thread pushes the accumulated
+deltas to Redis every `sync_interval` seconds in one pipeline
+(SET NX EX / INCRBY / PTTL per key, the same keys and expiry the redis://
+backend uses), and learns the global total and window expiry back.
+
+Quotas are therefore approximate. Between syncs each process only sees its
+own new hits and an estimate of everyone else's, so with P processes a
+window can overshoot its limit by up to about P x (request rate x
+sync_interval) when traffic is bursty, and much less when it is steady. While Redis is unreachable each
+process enforces the limits on its own traffic alone and keeps its deltas
+for the current windows. The sync thread keeps retrying with backoff and
+picks the global counts up again once Redis is back.
+
+Only the fixed-window strategy (flask-limiter's default) is supported.
+"""
+import os
+import time
+import logging
+import threading
+
+from limits.storage import Storage
+
+from verifier.metrics import REGISTRY
+
+logger = logging.getLogger("ratelimit")
+
+sync_failures = REGISTRY.counter("rate_limit_sync_failures_total", "Failed rate-limit reconciles with Redis")
+_redis_up = REGISTRY.gauge("rate_limit_redis_up", "1 while the hybrid limiter can reach Redis")
+
+
+class _Window:
+    __slots__ = ("expires_at", "remote", "local", "pending", "synced_at", "rate")
+
+    def __init__(self, expires_at):
+        self.expires_at = expires_at
+        self.remote = 0  # hits by other processes, as of the last sync
+        self.local = 0  # our hits this window
+        self.pending = 0  # our hits not yet pushed to Redis
+        self.synced_at = 0.0
+        self.rate = 0.0  # other processes' hits per second, between the last two syncs
+
+    def count(self, now, horizon):
+        guess = self.rate * min(now - self.synced_at, horizon) if self.rate else 0
+        return self.remote + self.local + int(guess)
+
+
+class HybridRedisStorage(Storage):
+    STORAGE_SCHEME = ["hybrid+redis", "hybrid+rediss"]
+
+    def __init__(self, uri, sync_interval=0.25, max_backoff=30.0, key_prefix="LIMITS", client=None,
+                 wrap_exceptions=False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions)
+        import redis
+        self._redis_error = redis.RedisError
+        options.setdefault("socket_timeout", 1.0)
+        options.setdefault("socket_connect_timeout", 1.0)
+        self.client = client or redis.from_url(uri.split("+", 1)[1], **options)
+        self.sync_interval = float(sync_interval)
+        self.max_backoff = float(max_backoff)
+        self.key_prefix = key_prefix
+        self.up = True
+        self._failures = 0
+        self._windows = {}
+        self._dirty = {}  # key -> window length, for keys with pending hits
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._kick = threading.Event()
+        self._thread = None
+        self._pid = None
+        _redis_up.fn = lambda: 1 if self.up else 0
+
+    @property
+    def base_exceptions(self):
+        return self._redis_error
+
+    def _key(self, key):
+        return f"{self.key_prefix}:{key}"
+
+    def _ensure_thread(self):
+        # (Re)started lazily so a forked worker gets its own sync thread.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="ratelimit-sync", daemon=True)
+            self._thread.start()
+
+    def incr(self, key, expiry, amount=1):
+        if self._pid != os.getpid():
+            self._ensure_thread()
+        now = time.time()
+        with self._lock:
+            w = self._windows.get(key)
+            if w is None or w.expires_at <= now:
+                w = self._windows[key] = _Window(now + expiry)
+                if self.up:
+                    self._kick.set()  # learn the other processes' count for it now, not a full interval later
+            w.local += amount
+            w.pending += amount
+            self._dirty[key] = expiry
+            return w.count(now, 2 * self.sync_interval)
+
+    def get(self, key):
+        now = time.time()
+        w = self._windows.get(key)
+        if w is None or w.expires_at <= now:
+            return 0
+        return w.count(now, 2 * self.sync_interval)
+
+    def get_expiry(self, key):
+        w = self._windows.get(key)
+        return w.expires_at if w is not None else time.time()
+
+    def check(self):
+        # Requests are always answered locally; Redis health is on /metrics.
+        return True
+
+    def clear(self, key):
+        with self._lock:
+            self._windows.pop(key, None)
+            self._dirty.pop(key, None)
+        try:
+            self.client.delete(self._key(key))
+        except self._redis_error as e:
+            logger.warning("Could not clear rate limit %s in Redis: %s", key, e)
+
+    def reset(self):
+        with self._lock:
+            cleared = len(self._windows)
+            self._windows.clear()
+            self._dirty.clear()
+        try:
+            keys = list(self.client.scan_iter(match=f"{self.key_prefix}:*"))
+            if keys:
+                self.client.delete(*keys)
+            return len(keys)
+        except self._redis_error as e:
+            logger.warning("Could not reset rate limits in Redis: %s", e)
+            return cleared
+
+    def close(self):
+        """Stop the sync thread after a last push of pending hits."""
+        self._stop.set()
+        self._kick.set()
+        if self._thread:
+            self._thread.join(5.0)
+        self.sync()
+
+    def _run(self):
+        last_sweep = 0.0
+        while not self._stop.is_set():
+            self._kick.wait(self._delay())
+            self._kick.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.sync()
+            except Exception:
+                logger.exception("Rate limit sync crashed")
+            if time.time() - last_sweep > 1.0:
+                self._sweep()
+                last_sweep = time.time()
+
+    def _delay(self):
+        if self._failures:
+            return min(self.max_backoff, self.sync_interval * 2 ** self._failures)
+        return self.sync_interval
+
+    def _sweep(self):
+        now = time.time()
+        with self._lock:
+            for key in [k for k, w in self._windows.items() if w.expires_at <= now]:
+                del self._windows[key]
+                self._dirty.pop(key, None)
+
+    def sync(self):
+        """Push pending hits to Redis and pull back global counts; returns keys synced."""
+        now = time.time()
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            batch = []
+            for key, expiry in dirty.items():
+                w = self._windows.get(key)
+                if w is None or w.expires_at <= now or not w.pending:
+                    continue
+                batch.append((key, expiry, w, w.pending))
+                w.pending = 0
+        if not batch:
+            return 0
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for key, expiry, _, n in batch:
+                k = self._key(key)
+                pipe.set(k, 0, ex=expiry, nx=True)
+                pipe.incrby(k, n)
+                pipe.pttl(k)
+            results = pipe.execute()
+        except self._redis_error as e:
+            self._sync_failed(batch, e)
+            return 0
+        if not self.up:
+            logger.info("Rate limiter reconnected to Redis")
+        self.up = True
+        self._failures = 0
+        now = time.time()
+        with self._lock:
+            for i, (key, expiry, w, n) in enumerate(batch):
+                total, pttl = results[3 * i + 1], results[3 * i + 2]
+                if self._windows.get(key) is not w:
+                    continue  # our window rolled over meanwhile
+                # total counts everything already flushed, ours included
+                remote = max(0, total - (w.local - w.pending))
+                if w.synced_at:
+                    w.rate = max(0.0, (remote - w.remote) / max(now - w.synced_at, 1e-3))
+                w.remote, w.synced_at = remote, now
+                if pttl > 0:
+                    w.expires_at = now + pttl / 1000.0  # follow the shared window
+        return len(batch)
+
+    def _sync_failed(self, batch, error):
+        sync_failures.inc()
+        self._failures += 1
+        if self.up:
+            logger.warning("Rate limiter lost Redis, limiting per process until it is back: %s", error)
+        self.up = False
+        with self._lock:
+            for key, expiry, w, n in batch:
+                if self._windows.get(key) is w:
+                    w.pending += n
+                    self._dirty[key] = expiry
+
+
+def hybrid_uri(uri):
+    """hybrid+redis(s)://... for a redis(s):// RATE_LIMIT_STORAGE, else None."""
+    if uri and uri.startswith(("redis://", "rediss://")):
+        return "hybrid+" + uri
+    return None
@@ -0,0 +1,140 @@
+"""Start-up helpers shared by the devapi and the verifier.
+
+Importing either service only reads configuration and registers routes;
+nothing here talks to Mongo or Redis at import time:
+
+- connect_mongo() registers the connection; mongoengine creates the client
+  (pool size and timeouts from MONGO_* variables) on the first query.
+- Readiness runs named dependency checks (ping Mongo, load a key, import the
+  PDF renderer, ...) on a background thread. /readyz reports the last
+  results without waiting, and each check doubles as the warm-up for its
+  dependency.
+- BootTimer records seconds from the start of the service module's import
+  to the end of import, create_app() and the first time every required
+  check passed (/metrics: boot_seconds{phase=...}).
+"""
+import os
+import time
+import logging
+import threading
+
+import mongoengine
+
+from verifier.metrics import REGISTRY
+
+logger = logging.getLogger("startup")
+
+# env var -> (MongoClient option, default); unset options without a default keep pymongo's.
+MONGO_OPTIONS = {
+    "MONGO_MAX_POOL_SIZE": ("maxPoolSize", 100),
+    "MONGO_MIN_POOL_SIZE": ("minPoolSize", 0),
+    "MONGO_MAX_IDLE_TIME_MS": ("maxIdleTimeMS", None),
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": ("waitQueueTimeoutMS", None),
+    # pymongo waits 30 s for a server by default; fail (and report unready) sooner
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": ("serverSelectionTimeoutMS", 5000),
+    "MONGO_CONNECT_TIMEOUT_MS": ("connectTimeoutMS", 5000),
+    "MONGO_SOCKET_TIMEOUT_MS": ("socketTimeoutMS", None),
+}
+
+_boot_seconds = REGISTRY.gauge("boot_seconds", "Seconds from the start of import to each start-up phase")
+
+
+def mongo_options():
+    opts = {}
+    for env, (option, default) in MONGO_OPTIONS.items():
+        value = os.environ.get(env, "")
+        if value:
+            opts[option] = int(value)
+        elif default is not None:
+            opts[option] = default
+    return opts
+
+
+def connect_mongo(uri, alias="default"):
+    """Register the Mongo connection without opening it."""
+    opts = mongo_options()
+    mongoengine.register_connection(alias, host=uri, **opts)
+    logger.info("MongoDB registered (connects on first use): pool %s-%s, server selection %s ms",
+                opts.get("minPoolSize"), opts.get("maxPoolSize"), opts.get("serverSelectionTimeoutMS"))
+
+
+def mongo_ping(alias="default"):
+    mongoengine.get_connection(alias).admin.command("ping")
+
+
+def redis_ping(uri, timeout=1.0):
+    import redis
+    client = redis.from_url(uri, socket_timeout=timeout, socket_connect_timeout=timeout)
+    try:
+        client.ping()
+    finally:
+        client.close()
+
+
+class BootTimer:
+    def __init__(self, started):
+        self.started = started  # time.perf_counter() at the top of the service module
+        self.phases = {}
+
+    def mark(self, phase):
+        if phase not in self.phases:
+            self.phases[phase] = round(time.perf_counter() - self.started, 4)
+            _boot_seconds.set(self.phases[phase], phase=phase)
+            logger.info("Boot: %s after %.3fs", phase, self.phases[phase])
+
+
+class Readiness:
+    """Dependency checks for /readyz, refreshed in the background at most every `interval` s."""
+
+    def __init__(self, interval=5.0, on_ready=None):
+        self.interval = interval
+        self.on_ready = on_ready
+        self._checks = []
+        self._results = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._checked_at = None
+
+    def add(self, name, check, required=True):
+        """check() raises when the dependency is unavailable; its first call warms it up."""
+        self._checks.append((name, check, required))
+
+    def refresh(self):
+        for name, check, required in self._checks:
+            t0 = time.perf_counter()
+            try:
+                check()
+                result = {"ok": True}
+            except Exception as e:
+                result = {"ok": False, "error": f"{type(e).__name__}: {e}"[:300]}
+            result.update(required=required, ms=round((time.perf_counter() - t0) * 1000, 1))
+            with self._lock:
+                self._results[name] = result
+        self._checked_at = time.monotonic()
+        if self.on_ready and self.ready()[0]:
+            self.on_ready()
+
+    def refresh_async(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._refresh_logged, name="readiness", daemon=True)
+            self._thread.start()
+
+    def _refresh_logged(self):
+        try:
+            self.refresh()
+        except Exception:
+            logger.exception("Readiness checks crashed")
+
+    def ready(self):
+        """(ready, {name: result}) from the last run; unchecked dependencies count as not ready."""
+        with self._lock:
+            results = dict(self._results)
+        ok = all(results.get(name, {}).get("ok") for name, _, required in self._checks if required)
+        return ok, results
+
+    def status(self):
+        if self._checked_at is None or time.monotonic() - self._checked_at > self.interval:
+            self.refresh_async()
+        return self.ready()